@@ -0,0 +1,186 @@
+"""
+Jumpshot HipChat Bot Chat Log Archive
+
+Months of the chat log past the retention window are moved out of memory into gzip compressed SQLite files, one per
+month. An archive holds the chatlog rows of its month along with the rooms and users lookup tables and the full text
+index, under the same names as in memory, so that the same query runs against live and archived rows alike. Archives
+are decompressed into a cache directory on first use and the most recently used copies are kept around.
+"""
+
+# python modules.
+import os
+import re
+import gzip
+import time
+import shutil
+import sqlite3
+import threading
+
+# archive file name, by month.
+FILE_NAME = "chatlog-%s.memory.gz"
+
+
+########################################################################################################################
+def bounds (month):
+    """
+    @type  month: String
+    @param month: Month, YYYY-MM.
+
+    @rtype:  Tuple
+    @return: (start, end) epoch timestamps of the month in local time, end exclusive.
+    """
+
+    year, month = map(int, month.split("-"))
+    start       = time.mktime((year, month,     1, 0, 0, 0, 0, 0, -1))
+    end         = time.mktime((year + month / 12, month % 12 + 1, 1, 0, 0, 0, 0, 0, -1))
+
+    return int(start), int(end)
+
+
+########################################################################################################################
+def month_of (stamp):
+    """
+    @type  stamp: Integer
+    @param stamp: Epoch timestamp.
+
+    @rtype:  String
+    @return: Month the timestamp falls in, local time, YYYY-MM.
+    """
+
+    return time.strftime("%Y-%m", time.localtime(stamp))
+
+
+########################################################################################################################
+class archive:
+    """
+    Directory of monthly chat log archives.
+    """
+
+    ####################################################################################################################
+    def __init__ (self, directory, cache_size, functions={}):
+        """
+        @type  directory:  String
+        @param directory:  Directory holding the archives, created if need be.
+        @type  cache_size: Integer
+        @param cache_size: Number of decompressed archives to keep around.
+        @type  functions:  Dictionary
+        @param functions:  SQL function name -> (number of arguments, implementation) to register on connections.
+        """
+
+        self.directory  = directory
+        self.cache      = os.path.join(directory, "cache")
+        self.cache_size = max(cache_size, 1)
+        self.functions  = functions
+        self.lock       = threading.Lock()
+        self.writing    = set()             # months being written to, their copies are never evicted.
+
+        if not os.path.isdir(self.cache):
+            os.makedirs(self.cache)
+
+
+    ####################################################################################################################
+    def _extract (self, month):
+        """
+        Decompress an archive into the cache, unless it's already there, and evict the least recently used copies
+        beyond the cache size. A month that isn't archived yet gets an empty file. Must be called with the lock held.
+
+        @rtype:  String
+        @return: Path to the decompressed copy.
+        """
+
+        extracted = os.path.join(self.cache, (FILE_NAME % month)[:-3])
+        archived  = os.path.join(self.directory, FILE_NAME % month)
+
+        if not os.path.exists(extracted):
+            if os.path.exists(archived):
+                source = gzip.open(archived, "rb")
+
+                try:
+                    with open(extracted + ".tmp", "wb") as target:
+                        shutil.copyfileobj(source, target)
+                finally:
+                    source.close()
+
+                os.rename(extracted + ".tmp", extracted)
+            else:
+                open(extracted, "wb").close()
+
+        # the modification time orders the copies by use.
+        os.utime(extracted, None)
+
+        copies = [os.path.join(self.cache, name) for name in os.listdir(self.cache) if name.endswith(".memory")]
+        copies.sort(key=os.path.getmtime)
+
+        writing = set(os.path.join(self.cache, (FILE_NAME % written)[:-3]) for written in self.writing)
+
+        for copy in copies[:-self.cache_size]:
+            if copy != extracted and copy not in writing:
+                os.remove(copy)
+
+        return extracted
+
+
+    ####################################################################################################################
+    def connect (self, month, write=False):
+        """
+        Open a connection to the decompressed copy of an archive. Changes are only archived by a call to store().
+
+        @type  month: String
+        @param month: Month, YYYY-MM.
+        @type  write: Boolean
+        @param write: Keep the copy in the cache until it's stored.
+
+        @rtype:  sqlite3.Connection
+        @return: Connection, rows are accessible by field name and text comes back as str.
+        """
+
+        with self.lock:
+            if write:
+                self.writing.add(month)
+
+            conn = sqlite3.connect(self._extract(month), check_same_thread=False)
+
+        for name, (arguments, function) in self.functions.items():
+            conn.create_function(name, arguments, function)
+
+        conn.row_factory  = sqlite3.Row
+        conn.text_factory = str
+
+        return conn
+
+
+    ####################################################################################################################
+    def months (self):
+        """
+        @rtype:  List
+        @return: Archived months, oldest first.
+        """
+
+        names = os.listdir(self.directory)
+
+        return sorted(name[8:15] for name in names if re.match("^chatlog-\d{4}-\d{2}\.memory\.gz$", name))
+
+
+    ####################################################################################################################
+    def store (self, month):
+        """
+        Compress the decompressed copy of a month back into its archive. The archive is replaced atomically, so that a
+        crash leaves either the previous or the new one in place.
+
+        @type  month: String
+        @param month: Month, YYYY-MM.
+        """
+
+        archived = os.path.join(self.directory, FILE_NAME % month)
+
+        with self.lock:
+            with open(self._extract(month), "rb") as source:
+                target = gzip.open(archived + ".tmp", "wb")
+
+                try:
+                    shutil.copyfileobj(source, target)
+                finally:
+                    target.close()
+
+            os.rename(archived + ".tmp", archived)
+            self.writing.discard(month)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+"""
+Memory Codec Benchmark
+
+Encodes and decodes realistic cerebellum payloads (the timer, reminder and stopwatch dictionaries as they used to be
+remembered, and a per room history of recently seen items) with the legacy protocol 0 pickle, cPickle at protocol 0
+and at its highest protocol, marshal and the memory codec, then reports encode and decode time and encoded size.
+
+Usage: python benchmarks/codec.py [--nicks N] [--rounds N] [--threshold bytes]
+"""
+
+# python modules.
+import os
+import sys
+import time
+import pickle
+import random
+import cPickle
+import marshal
+import argparse
+import datetime
+
+# make the bot modules importable.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# memory serialization.
+import codec
+
+WORDS = ["deploy", "standup", "lunch", "coffee", "review", "release", "backup", "call", "invoice", "demo", "retro"]
+ROOMS = ["00000_jumpshot@conf.hipchat.com", "00000_water_cooler@conf.hipchat.com", "00000_ops@conf.hipchat.com"]
+
+
+########################################################################################################################
+def payloads (nicks, seed):
+    """
+    @type  nicks: Integer
+    @param nicks: Number of users with timers, reminders and stopwatches.
+    @type  seed:  Integer
+    @param seed:  Random seed.
+
+    @rtype:  Dictionary
+    @return: Payload name -> payload.
+    """
+
+    rng  = random.Random(seed)
+    now  = time.time()
+    nick = lambda i: "User%d" % i
+    text = lambda: " ".join(rng.choice(WORDS) for i in xrange(rng.randint(2, 8)))
+
+    timers = dict((nick(i), [(rng.choice(ROOMS), now + rng.randint(60, 7200), text())
+                             for j in xrange(rng.randint(1, 3))]) for i in xrange(nicks))
+
+    reminders = dict((nick(i), [(rng.choice(ROOMS), now + rng.randint(3600, 86400 * 7), rng.choice([0, 1, 7]), text())
+                                for j in xrange(rng.randint(1, 5))]) for i in xrange(nicks))
+
+    stopwatches = dict((nick(i), now - rng.randint(0, 3600)) for i in xrange(nicks))
+
+    recent = dict((room, ["http://i.imgur.com/%08x.jpg" % rng.getrandbits(32) for i in xrange(100)]) for room in ROOMS)
+
+    # a memory marshal can't handle, to exercise the pickle fall back.
+    dated = dict((nick(i), datetime.datetime.fromtimestamp(now - i * 60)) for i in xrange(nicks))
+
+    return \
+    {
+        "timers"      : timers,
+        "reminders"   : reminders,
+        "stopwatches" : stopwatches,
+        "recent"      : recent,
+        "dated"       : dated,
+    }
+
+
+########################################################################################################################
+def measure (encode, decode, payload, rounds):
+    """
+    @rtype:  Tuple
+    @return: (encoded bytes, mean encode microseconds, mean decode microseconds), or None if the payload can't be
+             encoded.
+    """
+
+    try:
+        encoded = encode(payload)
+    except Exception:
+        return None
+
+    start = time.time()
+
+    for i in xrange(rounds):
+        encode(payload)
+
+    encoding = (time.time() - start) * 1000000 / rounds
+    start    = time.time()
+
+    for i in xrange(rounds):
+        decode(encoded)
+
+    decoding = (time.time() - start) * 1000000 / rounds
+
+    assert decode(encoded) == payload
+
+    return len(encoded), encoding, decoding
+
+
+########################################################################################################################
+def main ():
+    parser = argparse.ArgumentParser(description="memory codec benchmark.")
+    parser.add_argument("--nicks",     type=int, default=50,   help="users with timers, reminders and stopwatches.")
+    parser.add_argument("--rounds",    type=int, default=1000, help="encodes and decodes per measurement.")
+    parser.add_argument("--threshold", type=int, default=1024, help="codec compression threshold in bytes.")
+    parser.add_argument("--seed",      type=int, default=0,    help="random seed.")
+    options = parser.parse_args()
+
+    compressing = codec.codec(options.threshold)
+    plain       = codec.codec(0)
+
+    codecs = \
+    [
+        ("pickle 0 (legacy)", pickle.dumps,                                       pickle.loads),
+        ("cPickle 0",         cPickle.dumps,                                      cPickle.loads),
+        ("cPickle highest",   lambda m: cPickle.dumps(m, cPickle.HIGHEST_PROTOCOL), cPickle.loads),
+        ("marshal",           marshal.dumps,                                      marshal.loads),
+        ("codec",             plain.encode,                                       plain.decode),
+        ("codec + zlib",      compressing.encode,                                 compressing.decode),
+    ]
+
+    print "%-12s %-18s %10s %12s %12s" % ("payload", "codec", "bytes", "encode us", "decode us")
+
+    for name, payload in sorted(payloads(options.nicks, options.seed).items()):
+        for label, encode, decode in codecs:
+            result = measure(encode, decode, payload, options.rounds)
+
+            if result:
+                print "%-12s %-18s %10d %12.1f %12.1f" % ((name, label) + result)
+            else:
+                print "%-12s %-18s %10s" % (name, label, "n/a")
+
+        print
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+"""
+In-Process Dispatch Benchmark
+
+Replays synthetic message mixes (chatter, dot commands, @mentions, regex bait, long pastes and a realistic blend)
+through jumpbot._xmpp_on_message() with the real handlers loaded, then reports messages per second, p50/p99 dispatch
+latency and the per trigger match cost. Results are saved as JSON, pass a previous run as --baseline to compare.
+
+Usage: python benchmarks/dispatch.py [--count N] [--output results.json] [--baseline previous.json]
+"""
+
+# python modules.
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+
+# benchmark harness, must be imported before the bot modules.
+import harness
+
+
+########################################################################################################################
+def percentile (samples, p):
+    """
+    @type  samples: List
+    @param samples: Sorted samples.
+    @type  p:       Float
+    @param p:       Percentile, 0 - 100.
+    """
+
+    if not samples:
+        return 0.0
+
+    return samples[min(len(samples) - 1, int(round(p / 100.0 * (len(samples) - 1))))]
+
+
+########################################################################################################################
+def replay (bot, bodies, rooms):
+    """
+    Push each message body through the dispatch path, timing each one.
+
+    @rtype:  Dictionary
+    @return: Summary statistics in microseconds.
+    """
+
+    latencies = []
+    nicks     = ["Jane Doe", "John Smith", "Pat Jones", "Sam Lee"]
+
+    # the chat logger is chatty on stdout, keep it quiet.
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+
+    try:
+        start = time.time()
+
+        for i, body in enumerate(bodies):
+            message = harness.fake_message(rooms[i % len(rooms)], nicks[i % len(nicks)], body)
+
+            before = time.time()
+            bot._xmpp_on_message(message)
+            latencies.append((time.time() - before) * 1000000)
+
+        elapsed = time.time() - start
+    finally:
+        sys.stdout = stdout
+
+    latencies.sort()
+
+    return \
+    {
+        "messages"        : len(bodies),
+        "messages_per_sec": len(bodies) / elapsed if elapsed else 0.0,
+        "p50_us"          : percentile(latencies, 50),
+        "p99_us"          : percentile(latencies, 99),
+        "mean_us"         : sum(latencies) / len(latencies) if latencies else 0.0,
+    }
+
+
+########################################################################################################################
+def trigger_costs (bot, bodies):
+    """
+    Measure the cost of matching each regex trigger, and of the command lookup, against every message body.
+
+    @rtype:  Dictionary
+    @return: Trigger -> mean microseconds per message.
+    """
+
+    costs = {}
+
+    lowered = [body.lower() for body in bodies]
+
+    start = time.time()
+
+    for body, body_lower in zip(bodies, lowered):
+        bot.commands.lookup(body, body_lower)
+
+    costs["command lookup"] = (time.time() - start) * 1000000 / len(bodies)
+
+    start = time.time()
+
+    for body, body_lower in zip(bodies, lowered):
+        bot.regexes.lookup(body, body_lower)
+
+    costs["regex lookup"] = (time.time() - start) * 1000000 / len(bodies)
+
+    for callback, trigger, pattern, required in bot.regexes.entries:
+        start = time.time()
+
+        for body in bodies:
+            pattern.match(body)
+
+        costs["regex " + trigger] = (time.time() - start) * 1000000 / len(bodies)
+
+    return costs
+
+
+########################################################################################################################
+def version ():
+    """
+    @rtype:  String
+    @return: Git revision of the bot, if available.
+    """
+
+    try:
+        path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"], cwd=path).strip()
+    except Exception:
+        return "unknown"
+
+
+########################################################################################################################
+def compare (results, baseline):
+    """
+    Print the change in throughput and latency against a previous run.
+    """
+
+    print
+    print "change vs baseline %s:" % baseline["meta"]["version"]
+
+    for mix, current in sorted(results["mixes"].items()):
+        previous = baseline["mixes"].get(mix)
+
+        if not previous:
+            continue
+
+        changes = []
+
+        for key in ["messages_per_sec", "p50_us", "p99_us"]:
+            if previous[key]:
+                changes.append("%s %+.1f%%" % (key, (current[key] - previous[key]) / previous[key] * 100))
+
+        print "  %-12s %s" % (mix, ", ".join(changes))
+
+
+########################################################################################################################
+def main ():
+    parser = argparse.ArgumentParser(description="in-process dispatch benchmark.")
+    parser.add_argument("--count",    type=int, default=2000,                   help="messages per mix.")
+    parser.add_argument("--seed",     type=int, default=0,                      help="random seed.")
+    parser.add_argument("--output",             default="dispatch_results.json", help="JSON results file.")
+    parser.add_argument("--baseline",           default=None,                   help="previous JSON results file.")
+    options = parser.parse_args()
+
+    bot   = harness.build_bot()
+    rooms = [bot.hipchat.room_encode(room) for room in harness.config.ROOMS]
+    mixes = harness.message_mixes(options.count, options.seed)
+
+    results = \
+    {
+        "meta" :
+        {
+            "version" : version(),
+            "python"  : platform.python_version(),
+            "stamp"   : time.strftime("%Y-%m-%d %H:%M:%S"),
+            "count"   : options.count,
+            "seed"    : options.seed,
+        },
+        "mixes"    : {},
+        "triggers" : trigger_costs(bot, mixes["blend"]),
+        "hits"     : {},
+    }
+
+    print "%-12s %12s %10s %10s %10s" % ("mix", "msgs/sec", "p50 us", "p99 us", "mean us")
+
+    for mix in ["chatter", "commands", "mentions", "regex bait", "long pastes", "blend"]:
+        summary = results["mixes"][mix] = replay(bot, mixes[mix], rooms)
+
+        print "%-12s %12.0f %10.1f %10.1f %10.1f" % \
+            (mix, summary["messages_per_sec"], summary["p50_us"], summary["p99_us"], summary["mean_us"])
+
+    print
+    print "per trigger match cost over the blend (us/message):"
+
+    for trigger, cost in sorted(results["triggers"].items(), key=lambda item: -item[1]):
+        print "  %8.2f  %s" % (cost, trigger)
+
+    for (category, trigger), count in bot.hits.items():
+        results["hits"]["%s %s" % (category, trigger)] = count
+
+    with open(options.output, "w") as fh:
+        json.dump(results, fh, indent=4, sort_keys=True)
+
+    print
+    print "results saved to %s" % options.output
+
+    if options.baseline:
+        with open(options.baseline) as fh:
+            compare(results, json.load(fh))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Jumpshot HipChat Bot Benchmark Harness
+
+Builds a real jumpbot, with the real handlers loaded, on top of a fake XMPP transport and a stubbed HipChat API so
+that messages can be replayed through the dispatch path in process.
+"""
+
+# python modules.
+import os
+import sys
+import random
+import tempfile
+
+# the config module requires a username to be defined, provide placeholders if they aren't. handlers are run inline
+# and outbound messages are sent without rate limiting so that dispatch can be timed, and memory is kept out of the
+# bot directory.
+os.environ.setdefault("BOT_USERNAME",       "00000_00000")
+os.environ.setdefault("BOT_NICKNAME",       "Officer Pete")
+os.environ.setdefault("BOT_ROOMS",          "Jumpshot,Water Cooler")
+os.environ.setdefault("BOT_WORKER_THREADS", "0")
+os.environ.setdefault("BOT_SPEAK_ROOM_RATE", "0")
+os.environ.setdefault("BOT_SPEAK_GLOBAL_RATE", "0")
+os.environ.setdefault("BOT_MEMORY_FILE",    os.path.join(tempfile.mkdtemp(prefix="jumpbot-bench-"), "bench.memory"))
+os.environ.setdefault("BOT_CHATLOG_ARCHIVE_DIR",
+                      os.path.join(os.path.dirname(os.environ["BOT_MEMORY_FILE"]), "archive"))
+os.environ.setdefault("BOT_MAINTENANCE_BACKUP_DIR",
+                      os.path.join(os.path.dirname(os.environ["BOT_MEMORY_FILE"]), "backups"))
+
+# make the bot modules importable.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# import options from config.py.
+import config
+
+# import our HipChat API.
+import hipchat
+
+# the bot itself.
+import jumpbot
+
+
+########################################################################################################################
+class fake_jid:
+    def __init__ (self, bare):
+        self.bare = bare
+
+
+########################################################################################################################
+class fake_message (dict):
+    """
+    Stand-in for a sleekxmpp groupchat message stanza.
+    """
+
+    def __init__ (self, room, nick, body, user_id="00000_11111"):
+        dict.__init__(self, mucroom=room, mucnick=nick, body=body, **{"from" : fake_jid(room)})
+        self.user_id = user_id
+
+    def __repr__ (self):
+        return "<message><sender>%s@chat.hipchat.com</sender><body>%s</body></message>" % (self.user_id, self["body"])
+
+
+########################################################################################################################
+class stub_api (hipchat.api):
+    """
+    HipChat API with the network round trips replaced by canned responses.
+    """
+
+    def _get (self, routine, headers={}, params={}):
+        rooms = [{"room_id" : i, "name" : name, "xmpp_jid" : self.room_encode(name)} for i, name in enumerate(config.ROOMS)]
+
+        return \
+        {
+            "rooms" : rooms,
+            "users" : [],
+            "room"  : {"participants" : []},
+            "user"  : {},
+        }
+
+    def _post (self, routine, headers={}, params={}, data={}):
+        return {"status" : "sent"}
+
+
+########################################################################################################################
+class bench_bot (jumpbot.jumpbot):
+    """
+    The bot on a fake XMPP transport. Outbound messages are recorded instead of sent, and command and regex handler
+    callbacks are replaced by counting stubs so that what's measured is dispatch rather than handler network I/O.
+    Handlers bound to "any" (ie: the chat logger) are left in place.
+    """
+
+    ####################################################################################################################
+    def __init__ (self, stub_handlers=True):
+        self.stub_handlers = stub_handlers
+        self.sent          = []
+        self.hits          = {}     # (category, trigger) -> count.
+
+        jumpbot.hipchat.api = stub_api
+        jumpbot.jumpbot.__init__(self, config.USERNAME + "@chat.hipchat.com/bot", "password")
+
+    def _dbg (self, message):
+        pass
+
+    def send_message (self, mto, mbody, msubject=None, mtype=None, mhtml=None, mfrom=None, mnick=None):
+        self.sent.append((mto, mbody))
+
+    ####################################################################################################################
+    def register_trigger (self, callback, category, trigger=None):
+        if self.stub_handlers and category.lower() in ["command", "regex"]:
+            callback = self._stub(callback, category.lower(), trigger)
+
+        return jumpbot.jumpbot.register_trigger(self, callback, category, trigger)
+
+    def _stub (self, callback, category, trigger):
+        key = (category, trigger)
+
+        def stub (xmpp_message, room, nick, arguments):
+            self.hits[key] = self.hits.get(key, 0) + 1
+
+        stub.__name__ = callback.__name__
+
+        return stub
+
+
+########################################################################################################################
+def build_bot (stub_handlers=True):
+    """
+    Instantiate the bench bot and load the real handlers.
+
+    @rtype:  bench_bot
+    @return: Ready to use bot.
+    """
+
+    bot = bench_bot(stub_handlers)
+    bot._load_handlers()
+
+    return bot
+
+
+########################################################################################################################
+def message_mixes (count, seed=0):
+    """
+    Generate synthetic message mixes.
+
+    @type  count: Integer
+    @param count: Number of messages per mix.
+    @type  seed:  Integer
+    @param seed:  Random seed, for repeatable runs.
+
+    @rtype:  Dictionary
+    @return: Mix name -> list of message bodies.
+    """
+
+    rng = random.Random(seed)
+
+    words = ["the", "build", "is", "broken", "again", "lunch", "anyone", "deploy", "finished", "review", "my", "pull",
+             "request", "please", "coffee", "meeting", "in", "five", "minutes", "thanks", "lol", "ok", "sounds", "good"]
+
+    commands = [".help", ".help timers", ".calc 2+2", ".img kittens", ".timers", ".reminders", ".ud yolo", "/weather",
+                ".note to self buy milk", ".reddit aww", ".sw start", ".sw", ".map austin tx", ".vt " + "a" * 32]
+
+    bait = ["what's the weather like", "forecast looking grim", "chuck norris approves", "who drew the short straw",
+            "ls -l", "hash is d41d8cd98f00b204e9800998ecf8427e", "@bot remind me to stretch every 1 days",
+            "@bot what are my reminders", "@bot set a timer for 5", "@bot clear the timer"]
+
+    def chatter ():
+        return " ".join(rng.choice(words) for i in xrange(rng.randint(3, 20)))
+
+    def mention ():
+        return "%s %s" % (rng.choice([config.AT_NAME, "@bot"]), rng.choice(commands).lstrip("./"))
+
+    def paste ():
+        lines = ["  File \"/srv/app/%s.py\", line %d, in %s" % (rng.choice(words), rng.randint(1, 999), rng.choice(words))
+                 for i in xrange(rng.randint(50, 400))]
+
+        return "Traceback (most recent call last):\n" + "\n".join(lines) + "\nValueError: " + chatter()
+
+    mixes = \
+    {
+        "chatter"     : [chatter()             for i in xrange(count)],
+        "commands"    : [rng.choice(commands)  for i in xrange(count)],
+        "mentions"    : [mention()             for i in xrange(count)],
+        "regex bait"  : [rng.choice(bait)      for i in xrange(count)],
+        "long pastes" : [paste()               for i in xrange(count)],
+    }
+
+    # a realistic blend, mostly chatter.
+    blend = [(90, "chatter"), (4, "commands"), (2, "mentions"), (3, "regex bait"), (1, "long pastes")]
+
+    mixes["blend"] = []
+
+    for i in xrange(count):
+        pick = rng.randint(1, 100)
+
+        for weight, mix in blend:
+            if pick <= weight:
+                break
+
+            pick -= weight
+
+        mixes["blend"].append(mixes[mix][i])
+
+    return mixes
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+
+"""
+Memory Backend Benchmark
+
+Runs the chat log and cerebellum workloads against the SQLite memory backend and, given a connection string, the
+PostgreSQL one: chat log rows written in batches along with their activity rollups the way the chat logger does,
+recent history and activity report reads, and cerebellum memories remembered write through, recalled cold and flushed
+write behind. Reports operations per second per workload and backend.
+
+The PostgreSQL database should be a scratch one, the memory tables in it are dropped before the run.
+
+Usage: python benchmarks/memory_backends.py [--rows N] [--batch N] [--reads N] [--tags N] [--dsn postgres://...]
+"""
+
+# python modules.
+import time
+import random
+import argparse
+
+# benchmark harness, must be imported before the bot modules. it points memory at a scratch file.
+import harness
+
+# the bot itself, for its memory_query().
+import jumpbot
+
+# memory backends, migrations and serialization.
+import codec
+import memory
+import metrics
+import migrations
+
+ROOMS = ["00000_jumpshot@conf.hipchat.com", "00000_water_cooler@conf.hipchat.com", "00000_ops@conf.hipchat.com"]
+WORDS = ["deploy", "standup", "lunch", "coffee", "review", "release", "backup", "call", "invoice", "demo", "retro"]
+
+# tables created by the bot, dropped before a PostgreSQL run.
+TABLES = ["chatlog_activity_backfill", "chatlog_activity", "chatlog", "users", "rooms", "cerebellum"]
+
+
+########################################################################################################################
+class memory_bot:
+    """
+    Just enough of the bot for the memory backends, migrations and the cerebellum to run on.
+    """
+
+    ####################################################################################################################
+    def __init__ (self, pool):
+        self.memory       = pool
+        self.metrics      = metrics.registry()
+        self.slow_queries = None
+
+        self.memory_query("CREATE TABLE IF NOT EXISTS cerebellum (tag TEXT UNIQUE, memory BLOB, expires INTEGER)")
+        migrations.migrate(self)
+
+    def _dbg (self, message):
+        pass
+
+    def _err (self, message):
+        print "[!!] %s" % message
+
+    def memory_query (self, query, params=(), seconds=None, rows=None):
+        return jumpbot.jumpbot.memory_query.im_func(self, query, params, seconds, rows)
+
+
+########################################################################################################################
+def chatlog_writes (bot, rows, batch, rng):
+    """
+    Write chat log rows in batches, each along with its activity counts in one transaction, as the chat logger does.
+    """
+
+    for jid in ROOMS:
+        bot.memory_query("INSERT OR IGNORE INTO rooms (jid) VALUES (?)", (jid,))
+
+    for i in xrange(20):
+        bot.memory_query("INSERT OR IGNORE INTO users (hipchat_id, name, nick) VALUES (?,?,?)",
+                         ("1_%d" % i, "User %d" % i, "User%d" % i))
+
+    room_ids = [row[0] for row in bot.memory_query("SELECT id FROM rooms").fetchall()]
+    user_ids = [row[0] for row in bot.memory_query("SELECT id FROM users").fetchall()]
+    now      = int(time.time())
+    insert   = "INSERT INTO chatlog (room_id, user_id, stamp, message) VALUES (?,?,?,?)"
+    update   = "UPDATE chatlog_activity SET messages=messages+? WHERE room_id=? AND hour=? AND user_id=?"
+
+    for start in xrange(0, rows, batch):
+        values = [(rng.choice(room_ids), rng.choice(user_ids), now - rng.randint(0, 86400 * 30),
+                   " ".join(rng.choice(WORDS) for j in xrange(rng.randint(3, 15))))
+                  for i in xrange(min(batch, rows - start))]
+        counts = {}
+
+        for room_id, user_id, stamp, message in values:
+            key         = (room_id, stamp / 3600 * 3600, user_id)
+            counts[key] = counts.get(key, 0) + 1
+
+        with bot.memory.transaction() as conn:
+            conn.executemany(insert, values)
+            conn.executemany("INSERT OR IGNORE INTO chatlog_activity VALUES (?,?,?,0)", counts.keys())
+            conn.executemany(update, [(messages,) + counted for counted, messages in counts.items()])
+
+    return rows
+
+
+########################################################################################################################
+def chatlog_reads (bot, reads, rng):
+    """
+    Alternate recent history lookups and activity report queries.
+    """
+
+    room_ids = [row[0] for row in bot.memory_query("SELECT id FROM rooms").fetchall()]
+    now      = int(time.time())
+    recent   = "SELECT stamp, message FROM chatlog WHERE room_id=? AND stamp >= ? ORDER BY stamp DESC LIMIT 20"
+    talkers  = "SELECT user_id, SUM(messages) FROM chatlog_activity WHERE room_id=? AND hour >= ?"
+    talkers += " GROUP BY user_id ORDER BY 2 DESC"
+
+    for i in xrange(reads):
+        room_id = rng.choice(room_ids)
+        since   = now - rng.randint(1, 30) * 86400
+
+        bot.memory_query(recent if i % 2 else talkers, (room_id, since)).fetchall()
+
+    return reads
+
+
+########################################################################################################################
+def cerebellum_remember (bot, tags, rng):
+    """
+    Remember memories write through, a transaction each.
+    """
+
+    brain = memory.cerebellum(bot, 0, codec.codec(1024), harness.config.MEMORY_CACHE_SIZE)
+
+    for i in xrange(tags):
+        brain.remember("tag %d" % i, {"nick" : "User%d" % i, "items" : [rng.random() for j in xrange(10)]})
+
+    return tags
+
+
+########################################################################################################################
+def cerebellum_recall (bot, tags, rng):
+    """
+    Recall memories on a cold cache, a read each.
+    """
+
+    brain = memory.cerebellum(bot, 0, codec.codec(1024), harness.config.MEMORY_CACHE_SIZE)
+
+    for i in xrange(tags):
+        brain.recall("tag %d" % rng.randint(0, tags - 1))
+
+    return tags
+
+
+########################################################################################################################
+def cerebellum_flush (bot, tags, rng):
+    """
+    Change every memory and write them behind in a single flush.
+    """
+
+    brain = memory.cerebellum(bot, 3600, codec.codec(1024), harness.config.MEMORY_CACHE_SIZE)
+
+    for i in xrange(tags):
+        brain.remember("tag %d" % i, [rng.random() for j in xrange(10)])
+
+    brain.flush()
+
+    return tags
+
+
+########################################################################################################################
+def main ():
+    parser = argparse.ArgumentParser(description="memory backend benchmark.")
+    parser.add_argument("--rows",  type=int, default=50000, help="chat log rows written.")
+    parser.add_argument("--batch", type=int, default=500,   help="chat log rows per transaction.")
+    parser.add_argument("--reads", type=int, default=2000,  help="chat log reads.")
+    parser.add_argument("--tags",  type=int, default=2000,  help="cerebellum memories.")
+    parser.add_argument("--pool",  type=int, default=8,     help="postgres connections.")
+    parser.add_argument("--dsn",   default=None,            help="scratch postgres database to compare with.")
+    parser.add_argument("--seed",  type=int, default=0,     help="random seed.")
+    options = parser.parse_args()
+
+    backends = [("sqlite", lambda: memory.pool(harness.config.MEMORY_FILE, harness.config.MEMORY_BUSY_TIMEOUT))]
+
+    if options.dsn:
+        # the driver is only needed for this backend.
+        import postgres
+
+        def connect ():
+            pool = postgres.pool(options.dsn, options.pool)
+
+            for table in TABLES:
+                pool.write("DROP TABLE IF EXISTS %s" % table)
+
+            # start over from schema version 0.
+            pool.write("DELETE FROM memory_version")
+
+            return pool
+
+        backends.append(("postgres", connect))
+
+    workloads = \
+    [
+        ("chatlog writes",      lambda bot, rng: chatlog_writes(bot, options.rows, options.batch, rng)),
+        ("chatlog reads",       lambda bot, rng: chatlog_reads(bot, options.reads, rng)),
+        ("cerebellum remember", lambda bot, rng: cerebellum_remember(bot, options.tags, rng)),
+        ("cerebellum recall",   lambda bot, rng: cerebellum_recall(bot, options.tags, rng)),
+        ("cerebellum flush",    lambda bot, rng: cerebellum_flush(bot, options.tags, rng)),
+    ]
+
+    print "%-10s %-20s %10s %10s %12s" % ("backend", "workload", "ops", "seconds", "ops/sec")
+
+    for name, connect in backends:
+        bot = memory_bot(connect())
+        rng = random.Random(options.seed)
+
+        for label, workload in workloads:
+            start   = time.time()
+            ops     = workload(bot, rng)
+            elapsed = time.time() - start
+
+            print "%-10s %-20s %10d %10.2f %12.1f" % (name, label, ops, elapsed, ops / max(elapsed, 0.000001))
+
+        print
+
+
+if __name__ == "__main__":
+    main()
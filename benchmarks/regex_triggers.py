@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+"""
+Regex Trigger Long Message Benchmark
+
+Loads every handler, collects the regex triggers they register and pushes 1 KB, 10 KB and 100 KB messages through
+each of them. Exits non zero if any pattern exceeds the per message time budget.
+
+Usage: python benchmarks/regex_triggers.py [--budget milliseconds] [--rounds count]
+"""
+
+# python modules.
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+# the config module requires a username to be defined, provide a placeholder if one isn't.
+os.environ.setdefault("BOT_USERNAME", "00000_00000")
+os.environ.setdefault("BOT_NICKNAME", "Officer Pete")
+
+# make the bot modules importable.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# import options from config.py.
+import config
+
+# trigger indexes.
+import triggers
+
+# the bot itself, for its memory_query().
+import jumpbot
+
+# memory, migrations, metrics and handler state, which handlers set up against when initialized.
+import state
+import memory
+import metrics
+import migrations
+
+SIZES = [1024, 10 * 1024, 100 * 1024]
+
+
+########################################################################################################################
+class recording_bot:
+    """
+    Just enough of the bot interface for handlers to initialize and register their triggers against. Memory is a
+    scratch file, migrated like the bot's own, as handlers create their tables and start their writers on it.
+    """
+
+    ####################################################################################################################
+    def __init__ (self):
+        self.config       = config
+        self.help         = {}
+        self.regexes      = triggers.regex_index()
+        self.path         = tempfile.mkdtemp(prefix="jumpbot-bench-")
+        self.memory       = memory.pool(os.path.join(self.path, "bench.memory"), config.MEMORY_BUSY_TIMEOUT)
+        self.metrics      = metrics.registry()
+        self.state        = state.store(config.STATE_MAX_KEYS, config.STATE_MAX_BYTES)
+        self.slow_queries = None
+
+        self.memory_query("CREATE TABLE IF NOT EXISTS cerebellum (tag TEXT UNIQUE, memory BLOB, expires INTEGER)")
+        migrations.migrate(self)
+
+    def register_trigger (self, callback, category, trigger=None):
+        if category.lower() == "regex":
+            self.regexes.add(callback, trigger)
+
+    def register_help   (self, topic, description):                     pass
+    def memory_forget   (self, tag, namespace=None):                    pass
+    def memory_recall   (self, tag, dunno=None, namespace=None):        return dunno
+    def memory_remember (self, tag, thought, ttl=None, namespace=None): return True
+    def _dbg            (self, message):                                pass
+    def _err            (self, message):                                pass
+
+    def memory_query (self, query, params=(), seconds=None, rows=None):
+        return jumpbot.jumpbot.memory_query.im_func(self, query, params, seconds, rows)
+
+
+########################################################################################################################
+def load_handlers (bot):
+    """
+    Initialize each handler against the recording bot.
+    """
+
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "handlers")
+
+    for handler in sorted(os.listdir(path)):
+        if handler.endswith(".py") and handler != "__init__.py":
+            __import__("handlers.%s" % handler[:-3], fromlist=["handlers"]).handler(bot)
+
+
+########################################################################################################################
+def make_messages (size):
+    """
+    Build messages of roughly the specified size that look like what gets pasted into chat and that tease the patterns
+    without matching them: long single lines, stack traces, hex dumps and runs of white space, quotes and brackets,
+    which optional repeats in a pattern, ie: [\s'"]*, retry from every position within them.
+    """
+
+    random.seed(size)
+
+    bait = ["@bot", config.AT_NAME, "remind", "me", "every", "set", "timer", "my", "short", "chuck", "ls", "-l",
+            "forecast'", "'weather", "0x" + "a" * 31, "deadbeef" * 3, "[", "(", "'", '"']
+
+    words = bait + ["Traceback", "File", "line", "in", "module", "raise", "Exception", "at", "com.example.Foo"]
+
+    def fill (separator):
+        chunks = []
+        length = 0
+
+        while length < size:
+            chunks.append(random.choice(words))
+            length += len(chunks[-1]) + 1
+
+        return separator.join(chunks)[:size]
+
+    def hex_dump ():
+        return "".join(random.choice("0123456789abcdef ") for i in xrange(size))
+
+    return \
+    {
+        "single line" : fill(" "),
+        "stack trace" : "\n".join(fill(" ")[i:i + 80] for i in xrange(0, size, 80)),
+        "hex dump"    : hex_dump(),
+        "white space" : "x" + " " * size + "\n" + "\t" * size,
+        "quote run"   : "x" + "'\"" * (size / 2),
+        "bracket run" : "x" + "[(" * (size / 2),
+    }
+
+
+########################################################################################################################
+def main ():
+    parser = argparse.ArgumentParser(description="regex trigger long message benchmark.")
+    parser.add_argument("--budget", type=float, default=50.0, help="per message, per pattern budget in milliseconds.")
+    parser.add_argument("--rounds", type=int,   default=3,    help="number of times each message is matched.")
+    options = parser.parse_args()
+
+    bot = recording_bot()
+    load_handlers(bot)
+
+    failures = 0
+
+    for size in SIZES:
+        for kind, message in sorted(make_messages(size).items()):
+            for callback, trigger, pattern, required in bot.regexes.entries:
+
+                # the best of several rounds is taken to reduce scheduling noise.
+                best = None
+
+                for i in xrange(options.rounds):
+                    start   = time.time()
+                    pattern.match(message)
+                    elapsed = (time.time() - start) * 1000
+
+                    if best is None or elapsed < best:
+                        best = elapsed
+
+                status = "ok"
+
+                if best > options.budget:
+                    status    = "OVER BUDGET"
+                    failures += 1
+
+                print "%6d KB  %-12s %8.3f ms  %-11s %s" % (size / 1024, kind, best, status, trigger)
+
+    if failures:
+        print "%d pattern(s) exceeded the %.1f ms budget." % (failures, options.budget)
+        sys.exit(1)
+
+    print "all patterns within the %.1f ms budget." % options.budget
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Jumpshot HipChat Bot Memory Codec
+
+Serialization of cerebellum memories. Every encoded memory starts with a tag byte naming the format it was written in,
+so that formats can be added or changed while rows written by earlier ones keep loading. Plain types (None, bools,
+numbers, strings and lists, tuples, sets and dictionaries of them) are written with marshal, which is compact and
+fast, anything else with the highest pickle protocol. Payloads above a size threshold are zlib compressed when that
+pays off.
+
+Rows without a tag byte predate the codec and are protocol 0 pickles. Protocol 0 pickles always start with a printable
+opcode, while tag bytes are control characters, so the two can't be confused.
+"""
+
+# python modules.
+import zlib
+import marshal
+import cPickle
+
+# tag bit set on compressed payloads.
+COMPRESSED = 0x10
+
+# zlib level, memories are written often and small, speed matters more than the last few percent.
+COMPRESS_LEVEL = 1
+
+# format tags.
+MARSHAL = 0x01
+PICKLE  = 0x02
+
+# (tag, encoder, decoder), in order of preference. an encoder raises ValueError or TypeError on what it can't handle.
+FORMATS = \
+[
+    (MARSHAL, marshal.dumps,                                              marshal.loads),
+    (PICKLE,  lambda memory: cPickle.dumps(memory, cPickle.HIGHEST_PROTOCOL), cPickle.loads),
+]
+
+
+########################################################################################################################
+class codec:
+    """
+    Memory encoder and decoder.
+    """
+
+    ####################################################################################################################
+    def __init__ (self, threshold, formats=FORMATS):
+        """
+        @type  threshold: Integer
+        @param threshold: Payloads of at least this many bytes are compressed, 0 disables compression.
+        @type  formats:   List
+        @param formats:   (tag, encoder, decoder) tuples, in order of preference. Tags must be below COMPRESSED.
+        """
+
+        self.threshold = threshold
+        self.formats   = formats
+        self.decoders  = dict((tag, decoder) for tag, encoder, decoder in formats)
+
+
+    ####################################################################################################################
+    def decode (self, encoded):
+        """
+        @type  encoded: String
+        @param encoded: Encoded memory, or a legacy protocol 0 pickle.
+
+        @rtype:  Mixed
+        @return: Memory.
+
+        @raise: Exception if the format is unknown or the payload is corrupt.
+        """
+
+        encoded = str(encoded)
+        tag     = ord(encoded[0]) if encoded else None
+
+        # legacy rows.
+        if tag is None or tag >= 0x20:
+            return cPickle.loads(encoded)
+
+        payload = encoded[1:]
+
+        if tag & COMPRESSED:
+            payload = zlib.decompress(payload)
+
+        if (tag & ~COMPRESSED) not in self.decoders:
+            raise Exception("unknown memory format: 0x%02x" % tag)
+
+        return self.decoders[tag & ~COMPRESSED](payload)
+
+
+    ####################################################################################################################
+    def encode (self, memory):
+        """
+        @type  memory: Mixed
+        @param memory: Whatever we want to remember.
+
+        @rtype:  String
+        @return: Encoded memory.
+
+        @raise: Exception if no format can encode the memory.
+        """
+
+        for tag, encoder, decoder in self.formats:
+            try:
+                payload = encoder(memory)
+                break
+            except (ValueError, TypeError):
+                continue
+        else:
+            raise Exception("no memory format can encode: %r" % type(memory))
+
+        if self.threshold and len(payload) >= self.threshold:
+            compressed = zlib.compress(payload, COMPRESS_LEVEL)
+
+            if len(compressed) < len(payload):
+                tag    |= COMPRESSED
+                payload = compressed
+
+        return chr(tag) + payload
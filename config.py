@@ -14,6 +14,43 @@ ROOMS               = os.environ.get("BOT_ROOMS", "").split(",")
 
 HIPCHAT_API_KEY     = os.environ.get("BOT_HIPCHAT_API_KEY",   "")
 CRON_INTERVAL       = int(os.environ.get("BOT_CRON_INTERVAL", 10))   # interval bot cron jobs are processed.
+WORKER_THREADS      = int(os.environ.get("BOT_WORKER_THREADS", 8))   # handler worker threads, 0 runs handlers inline.
+WORKER_QUEUE_DEPTH  = int(os.environ.get("BOT_WORKER_QUEUE_DEPTH", 256))   # max messages waiting on a worker.
+ASYNC_CORE          = os.environ.get("BOT_ASYNC_CORE", "") == "1"    # dispatch handlers on the twisted reactor thread.
+MEMORY_FILE         = os.environ.get("BOT_MEMORY_FILE", "officer_pete.memory")   # memory file, relative to the bot.
+METRICS_HOST        = os.environ.get("BOT_METRICS_HOST", "127.0.0.1")    # address to serve prometheus metrics on.
+METRICS_PORT        = int(os.environ.get("BOT_METRICS_PORT", 0))         # port to serve prometheus metrics on, 0 disables.
+MAX_MESSAGE_LENGTH  = int(os.environ.get("BOT_MAX_MESSAGE_LENGTH", 10000))  # HipChat message size limit, longer phrases are split.
+SPEAK_ROOM_RATE     = float(os.environ.get("BOT_SPEAK_ROOM_RATE", 1))       # messages per second per room, 0 is unlimited.
+SPEAK_ROOM_BURST    = int(os.environ.get("BOT_SPEAK_ROOM_BURST", 3))        # messages a room may send back to back.
+SPEAK_GLOBAL_RATE   = float(os.environ.get("BOT_SPEAK_GLOBAL_RATE", 4))     # messages per second across all rooms, 0 is unlimited.
+SPEAK_GLOBAL_BURST  = int(os.environ.get("BOT_SPEAK_GLOBAL_BURST", 8))      # messages that may be sent back to back across all rooms.
+SPEAK_QUEUE_DEPTH   = int(os.environ.get("BOT_SPEAK_QUEUE_DEPTH", 100))     # max phrases waiting to be sent per room.
+STARTUP_BUDGET      = float(os.environ.get("BOT_STARTUP_BUDGET", 2))        # seconds handler loading may take before it's logged as an error.
+RELOAD_HANDLERS     = os.environ.get("BOT_RELOAD_HANDLERS", "") == "1"     # reload handlers modified on disk, checked each cron interval.
+ADMINS              = os.environ.get("BOT_ADMINS", "").split(",")           # room nicknames allowed to run admin commands.
+MEMORY_FLUSH_INTERVAL = float(os.environ.get("BOT_MEMORY_FLUSH_INTERVAL", 5))   # seconds between memory write-behind flushes, 0 writes through.
+MEMORY_BUSY_TIMEOUT = int(os.environ.get("BOT_MEMORY_BUSY_TIMEOUT", 5000))  # milliseconds to wait on a locked memory file.
+MEMORY_REGEXP_CACHE = int(os.environ.get("BOT_MEMORY_REGEXP_CACHE", 256))  # compiled REGEXP patterns kept around.
+MEMORY_COMPRESS_THRESHOLD = int(os.environ.get("BOT_MEMORY_COMPRESS_THRESHOLD", 1024))  # memories of at least this many bytes are compressed, 0 never.
+MEMORY_SWEEP_INTERVAL = int(os.environ.get("BOT_MEMORY_SWEEP_INTERVAL", 60))  # seconds between sweeps of expired memories, checked on cron.
+MEMORY_SWEEP_BATCH  = int(os.environ.get("BOT_MEMORY_SWEEP_BATCH", 500))      # expired memories deleted per statement.
+MEMORY_CACHE_SIZE   = int(os.environ.get("BOT_MEMORY_CACHE_SIZE", 10000))      # memories cached, least recently used are evicted once flushed.
+STATE_MAX_KEYS      = int(os.environ.get("BOT_STATE_MAX_KEYS", 10000))        # handler state keys kept, least recently used are evicted.
+STATE_MAX_BYTES     = int(os.environ.get("BOT_STATE_MAX_BYTES", 8388608))     # estimated bytes of handler state kept.
+STATE_SNAPSHOT_TTL  = int(os.environ.get("BOT_STATE_SNAPSHOT_TTL", 86400))    # seconds a shutdown snapshot of handler state is restorable, 0 disables.
+MAINTENANCE_BACKUP_DIR = os.environ.get("BOT_MAINTENANCE_BACKUP_DIR", "backups")  # memory backups directory, relative to the bot.
+MAINTENANCE_BACKUP_INTERVAL = int(os.environ.get("BOT_MAINTENANCE_BACKUP_INTERVAL", 86400))  # seconds between memory backups, 0 disables.
+MAINTENANCE_BACKUPS = int(os.environ.get("BOT_MAINTENANCE_BACKUPS", 7))         # memory backups kept, 0 keeps all.
+MAINTENANCE_ANALYZE_INTERVAL = int(os.environ.get("BOT_MAINTENANCE_ANALYZE_INTERVAL", 86400))  # seconds between ANALYZE runs, 0 disables.
+MAINTENANCE_ANALYZE_LIMIT = int(os.environ.get("BOT_MAINTENANCE_ANALYZE_LIMIT", 1000))  # rows ANALYZE samples per index.
+MAINTENANCE_QUIET_START = int(os.environ.get("BOT_MAINTENANCE_QUIET_START", 2))  # local hour quiet hours start, the memory file is vacuumed then.
+MAINTENANCE_QUIET_END = int(os.environ.get("BOT_MAINTENANCE_QUIET_END", 6))      # local hour quiet hours end.
+MAINTENANCE_VACUUM_PAGES = int(os.environ.get("BOT_MAINTENANCE_VACUUM_PAGES", 256))  # free pages vacuumed per cron interval in quiet hours, 0 disables.
+MEMORY_BACKEND      = os.environ.get("BOT_MEMORY_BACKEND", "sqlite")          # memory backend, "sqlite" or "postgres".
+MEMORY_DSN          = os.environ.get("BOT_MEMORY_DSN", os.environ.get("DATABASE_URL", ""))  # postgres connection string or URL.
+MEMORY_POOL_SIZE    = int(os.environ.get("BOT_MEMORY_POOL_SIZE", 8))          # max postgres connections.
+MEMORY_SLOW_QUERY_THRESHOLD = float(os.environ.get("BOT_MEMORY_SLOW_QUERY_THRESHOLD", 0))  # seconds a memory query may take before it's logged with its plan, 0 disables.
 
 
 # handler-specific configuration.
@@ -24,6 +61,12 @@ DOKUWIKI_USER       = os.environ.get("BOT_DOKUWIKI_USER",       "")
 DOKUWIKI_PASS       = os.environ.get("BOT_DOKUWIKI_PASS",       "")                # dokuwiki XML-RPC password.
 DOKUWIKI_HOST       = os.environ.get("BOT_DOKUWIKI_HOST",       "")                # dokuwiki XML-RPC hostname or IP address.
 DOKUWIKI_NAMESPACE  = os.environ.get("BOT_DOKUWIKI_NAMESPACE",  "")                # optional dokuwiki namespace to prefix.
+CHATLOG_QUEUE_DEPTH = int(os.environ.get("BOT_CHATLOG_QUEUE_DEPTH", 10000))         # max chat log rows waiting to be written.
+CHATLOG_BATCH_SIZE  = int(os.environ.get("BOT_CHATLOG_BATCH_SIZE", 500))            # chat log rows written per transaction.
+CHATLOG_FLUSH_INTERVAL = float(os.environ.get("BOT_CHATLOG_FLUSH_INTERVAL", 1))     # max seconds a chat log row waits to be written.
+CHATLOG_RETENTION_MONTHS = int(os.environ.get("BOT_CHATLOG_RETENTION_MONTHS", 3))  # months of chat log kept in memory, older ones are archived. 0 keeps everything.
+CHATLOG_ARCHIVE_DIR = os.environ.get("BOT_CHATLOG_ARCHIVE_DIR", "chatlog_archive")  # chat log archive directory, relative to the bot.
+CHATLOG_ARCHIVE_CACHE = int(os.environ.get("BOT_CHATLOG_ARCHIVE_CACHE", 6))       # decompressed chat log archives kept around for queries.
 
 # shouldn't need to configured anything beyond this line.
 PREAMBLE            = USERNAME.split("_")[0]             # slice the preamble off the username.
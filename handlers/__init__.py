@@ -0,0 +1,128 @@
+"""
+Jumpshot HipChat Bot Handler Manifest
+
+Static declaration of the command and regex triggers and help topics each handler registers, so that the bot can build
+its dispatch tables at startup without importing the handler modules. A handler is imported on the first hit of one of
+its triggers, or when help on one of its topics is requested. Triggers are listed as (trigger, method name) pairs and
+must match what the handler registers in its __init__ exactly.
+
+Handlers bound to "any" or "cron" have to be running from the start and are marked eager, they are imported at startup
+and register their own triggers. Handlers missing from the manifest are loaded eagerly as well.
+"""
+
+MANIFEST = \
+{
+    "activity" :
+    {
+        "command" : [("activity", "activity")],
+        "help"    : ["activity"],
+    },
+
+    "admin" :
+    {
+        "command" : [("reload", "reload"), ("slowqueries", "slowqueries")],
+        "help"    : ["reload", "slowqueries"],
+    },
+
+    "calculators" :
+    {
+        "command" : [("calculator", "calculator"), ("=", "calculator"), ("calc", "calculator")],
+        "help"    : ["calculator", "google calculator"],
+    },
+
+    "chat_logger" :
+    {
+        "eager"   : True,
+    },
+
+    "chuck_norris" :
+    {
+        "regex"   : [("(?i).*(chuck.norris|wwcnd).*", "chuck_norris")],
+    },
+
+    "dokuwiki" :
+    {
+        "command" : [("note to self", "note_to_self"), ("notetoself", "note_to_self"), ("note_to_self", "note_to_self"),
+                     ("note2self", "note_to_self")],
+        "help"    : ["notes to self"],
+    },
+
+    "help" :
+    {
+        "command" : [("help", "help")],
+    },
+
+    "images" :
+    {
+        "command" : [("dribbble", "dribbble"), ("mustachify", "mustachify"), ("img", "google_images"),
+                     ("image", "google_images")],
+        "help"    : ["dribbble", "image search", "mustachify"],
+    },
+
+    "manhole" :
+    {
+        "command" : [("manhole", "make_manhole")],
+    },
+
+    "maps" :
+    {
+        "command" : [("map", "google_map"), ("gmap", "google_map"), ("triangulate_ssid", "triangulate_ssid"),
+                     ("ssid2loc", "triangulate_ssid"), ("locate_ssid", "triangulate_ssid")],
+        "help"    : ["maps", "ssid triangulation"],
+    },
+
+    "personality" :
+    {
+        "regex"   : [("(?i).*(ls -l).*", "ls_detected")],
+    },
+
+    "reddit" :
+    {
+        "command" : [("reddit", "reddit")],
+        "help"    : ["reddit"],
+    },
+
+    "search" :
+    {
+        "command" : [("search", "search")],
+        "help"    : ["search"],
+    },
+
+    "short_straw" :
+    {
+        "regex"   : [("(?i).*(short.straw).*", "short_straw")],
+    },
+
+    "stats" :
+    {
+        "command" : [("stats", "stats")],
+        "help"    : ["stats"],
+    },
+
+    "timers" :
+    {
+        "eager"   : True,
+    },
+
+    "urban_dictionary" :
+    {
+        "command" : [("urban_dictionary", "urban_dictionary"), ("urban dictionary", "urban_dictionary"),
+                     ("ud", "urban_dictionary")],
+        "help"    : ["urban dictionary"],
+    },
+
+    "virus_total" :
+    {
+        "command" : [("virus_total", "virus_total"), ("vt", "virus_total")],
+        "regex"   : [("(?i).*" + "[\s'\"\[\(]*" + "([0-9a-f]{32}|[0-9a-f]{40})" + "[\s'\"\]\)]*" + ".*",
+                      "_natural_hash_seen")],
+        "help"    : ["virus total"],
+    },
+
+    "weather" :
+    {
+        "command" : [("weather", "weather"), ("forecast", "weather")],
+        "regex"   : [("(?i).*weather.*", "_natural_weather"), ("(?i).*forecast.*", "_natural_weather")],
+        "help"    : ["weather"],
+    },
+}
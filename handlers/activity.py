@@ -0,0 +1,117 @@
+import re
+import time
+
+# bot helpers.
+import helpers
+
+EMOTICON = "(chart) "
+
+# talkers listed in a report.
+TOP_TALKERS = 5
+
+########################################################################################################################
+class handler:
+    """
+    Chat activity reports, answered from the hourly rollups the chat logger maintains.
+    """
+
+    ####################################################################################################################
+    def __init__ (self, bot):
+        self.bot = bot
+
+        # register triggers.
+        self.bot.register_trigger(self.activity, "command", "activity")
+
+        # register help.
+        self.bot.register_help("activity", self.activity.__doc__)
+
+
+    ####################################################################################################################
+    def activity (self, xmpp_message, room, nick, args):
+        """
+        Who talks the most and when. Reports on this room unless another room (or "all") is named, over the last week
+        unless another period is given (ie: 12h, 3d, 2w or "ever").
+
+        Usage: .activity [room|all] [period]
+        """
+
+        args   = args.split()
+        period = "7d"
+
+        if args and re.match("^(\d+[hdw]|ever)$", args[-1].lower()):
+            period = args.pop().lower()
+
+        if period == "ever":
+            since = 0
+        else:
+            since = int(time.time()) - int(period[:-1]) * {"h" : 3600, "d" : 86400, "w" : 604800}[period[-1]]
+
+        # hour buckets are aligned to the hour, so the one the period starts in is counted in full.
+        since  = since / 3600 * 3600
+        params = [since]
+        sql    = " FROM chatlog_activity a"
+        where  = " WHERE a.hour >= ?"
+
+        if " ".join(args).lower() == "all":
+            name = "all rooms"
+        else:
+            jid  = self.bot.hipchat.room_encode(" ".join(args)) if args else room
+            name = self.bot.hipchat.room_decode(jid)
+
+            sql   += ", rooms r"
+            where += " AND r.id = a.room_id AND r.jid = ?"
+            params.append(jid)
+
+        query   = "SELECT u.name, SUM(a.messages)" + sql + ", users u" + where
+        query  += " AND u.id = a.user_id GROUP BY u.name ORDER BY 2 DESC"
+        talkers = self.bot.memory_query(query, params).fetchall()
+        total   = sum(messages for talker, messages in talkers)
+
+        if not total:
+            return "%snobody said a word in %s, %s." % (EMOTICON, name, self.describe(period))
+
+        # fold the hour buckets into hours of the day, local time.
+        hours = [0] * 24
+        query = "SELECT a.hour, SUM(a.messages)" + sql + where + " GROUP BY a.hour"
+
+        for hour, messages in self.bot.memory_query(query, params).fetchall():
+            hours[time.localtime(hour).tm_hour] += messages
+
+        busiest = hours.index(max(hours))
+        people  = "1 person" if len(talkers) == 1 else "%d people" % len(talkers)
+        report  = ["%s%s, %s: %s messages from %s, busiest around %02d:00." % \
+                   (EMOTICON, name, self.describe(period), helpers.commify(total), people, busiest)]
+
+        # messages posted through the API have no user name.
+        for talker, messages in talkers[:TOP_TALKERS]:
+            report.append("%s: %s (%d%%)" % (talker or "API", helpers.commify(messages), messages * 100 / total))
+
+        # history logged before the rollups existed is still being counted in.
+        state = self.bot.memory_query("SELECT boundary, position FROM chatlog_activity_backfill").fetchone()
+
+        if state and state["position"] < state["boundary"]:
+            report.append("(still counting older history, %d%% done.)" % (state["position"] * 100 / state["boundary"]))
+
+        return "\n".join(report)
+
+
+    ####################################################################################################################
+    def describe (self, period):
+        """
+        @type  period: String
+        @param period: Period, ie: 12h, 3d, 2w or "ever".
+
+        @rtype:  String
+        @return: Human readable period.
+        """
+
+        if period == "ever":
+            return "ever"
+
+        count = int(period[:-1])
+        unit  = {"h" : "hour", "d" : "day", "w" : "week"}[period[-1]]
+
+        if count == 1:
+            return "the last %s" % unit
+
+        return "the last %d %ss" % (count, unit)
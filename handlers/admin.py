@@ -0,0 +1,81 @@
+########################################################################################################################
+class handler:
+    """
+    Bot administration, restricted to config.ADMINS.
+    """
+
+    ####################################################################################################################
+    def __init__ (self, bot):
+        self.bot = bot
+
+        # register triggers.
+        self.bot.register_trigger(self.reload,      "command", "reload")
+        self.bot.register_trigger(self.slowqueries, "command", "slowqueries")
+
+        # register help.
+        self.bot.register_help("reload",      self.reload.__doc__)
+        self.bot.register_help("slowqueries", self.slowqueries.__doc__)
+
+
+    ####################################################################################################################
+    def reload (self, xmpp_message, room, nick, handler):
+        """
+        Reload a handler from disk without restarting the bot. State the handler keeps in memory, such as timers and
+        reminders, carries over. Anything else is reset. Admins only.
+
+        Usage: .reload <handler>
+        """
+
+        if nick not in self.bot.config.ADMINS:
+            return "(nope) admins only."
+
+        handler = handler.strip().lower()
+
+        # list what's available.
+        if not handler:
+            return "(thinking) reload which handler? loaded: %s" % ", ".join(sorted(self.bot.handlers))
+
+        try:
+            elapsed = self.bot.reload_handler(handler)
+        except Exception as e:
+            return "(facepalm) failed reloading %s: %s" % (handler, e)
+
+        return "(successful) reloaded %s in %.1fms." % (handler, elapsed * 1000)
+
+
+    ####################################################################################################################
+    def slowqueries (self, xmpp_message, room, nick, arguments):
+        """
+        Report the most expensive memory query shapes by total time, along with the query plan of their last slow
+        execution. Shapes are queries with their literals collapsed. Needs config.MEMORY_SLOW_QUERY_THRESHOLD. Admins
+        only.
+
+        Usage: .slowqueries [count|reset]
+        """
+
+        if nick not in self.bot.config.ADMINS:
+            return "(nope) admins only."
+
+        if not self.bot.slow_queries:
+            return "(shrug) the slow query log is off, see config.MEMORY_SLOW_QUERY_THRESHOLD."
+
+        arguments = arguments.strip().lower()
+
+        if arguments == "reset":
+            self.bot.slow_queries.reset()
+            return "(successful) forgot all query shapes."
+
+        try:
+            count = int(arguments or 10)
+        except ValueError:
+            return "(thinking) usage: .slowqueries [count|reset]"
+
+        report = self.bot.slow_queries.top(count)
+
+        if not report:
+            return "(shrug) no queries measured yet."
+
+        report.insert(0, "(chart) memory queries over %.1fms are slow, the most time was spent in..." % \
+            (self.bot.slow_queries.threshold * 1000))
+
+        return "\n".join(report)
@@ -26,10 +26,6 @@ class handler:
         self.bot.register_help("calculator",        self.calculator.__doc__)
         self.bot.register_help("google calculator", self.google_calculator.__doc__)
 
-        # keep track of last answer per command, and per room and per person.
-        self.calc_answers  = {}
-        self.gcalc_answers = {}
-
 
     ####################################################################################################################
     def calculator (self, xmpp_message, room, nick, expression):
@@ -46,13 +42,8 @@ class handler:
         if not expression:
             return
 
-        # ensure local storage exists for this user...
-        if not self.calc_answers.has_key(nick):
-            self.calc_answers[nick] = {}
-
-        # ...and in this specific room.
-        if not self.calc_answers[nick].has_key(room):
-            self.calc_answers[nick][room] = 0
+        # last answer of this user in this specific room.
+        key = ("calculators", "calc", nick, room)
 
         # normalize ans -> answer -> res -> result -> _
         expression = expression.replace("answer", "_").replace("ans", "_").replace("result", "_").replace("res", "_")
@@ -68,10 +59,11 @@ class handler:
 
         # splice in the last value.
         if "_" in expression:
-            expression = expression.replace("_", str(self.calc_answers[nick][room]))
+            expression = expression.replace("_", str(self.bot.state.get(key, 0)))
 
         try:
-            self.calc_answers[nick][room] = answer = float(eval(expression))
+            answer = float(eval(expression))
+            self.bot.state.set(key, answer)
 
             return "%f (0x%x)" % (answer, answer)
         except:
@@ -96,20 +88,15 @@ class handler:
         if not expression:
             return
 
-        # ensure local storage exists for this user.
-        if not self.gcalc_answers.has_key(nick):
-            self.gcalc_answers[nick] = {}
-
-        # ...and in this specific room.
-        if not self.gcalc_answers[nick].has_key(room):
-            self.gcalc_answers[nick][room] = 0
+        # last answer of this user in this specific room.
+        key = ("calculators", "gcalc", nick, room)
 
         # normalize ans -> answer -> _
         expression = expression.replace("answer", "_").replace("ans", "_")
 
         # splice in the last value.
         if "_" in expression:
-            expression = expression.replace("_", str(self.gcalc_answers[nick][room]))
+            expression = expression.replace("_", str(self.bot.state.get(key, 0)))
 
         try:
             data = requests.get(URL + requests.utils.quote(expression)).content
@@ -127,7 +114,7 @@ class handler:
             ans  = data["rhs"]
 
             if ans:
-                self.gcalc_answers[nick][room] = ans
+                self.bot.state.set(key, ans)
                 return "%s" % ans
             else:
                 return "(thumbsdown) could not compute."
@@ -1,13 +1,23 @@
+import os
 import time
-import datetime
+import Queue
+import threading
 
 # bot helpers.
 import helpers
 
+# monthly chat log archives.
+import archive
+
 LOG_CHATS_TO_CONSOLE = True
 
-from pprint import pprint
+# seconds between checks for months to archive.
+ROTATION_INTERVAL = 3600
+
+# chat log row IDs counted into the activity rollups per backfill step.
+BACKFILL_CHUNK = 50000
 
+########################################################################################################################
 class handler:
     """
     Chat logging.
@@ -20,18 +30,413 @@ class handler:
         # process all messages.
         self.bot.register_trigger(self.log_message, "any")
 
-        # initialize the chatlog table if it doesn't already exist.
-        sql  = "CREATE TABLE IF NOT EXISTS chatlog ("
-        sql += "  id         INTEGER PRIMARY KEY,"
-        sql += "  room_id    INTEGER,"
-        sql += "  room_name  TEXT,"
-        sql += "  user_id    TEXT,"
-        sql += "  user_name  TEXT,"
-        sql += "  user_nick  TEXT,"
-        sql += "  message    TEXT,"
-        sql += "  stamp      TEXT)"
+        # stop the writer and write out whatever is still queued on the way out, or when reloaded.
+        self.bot.register_trigger(self.stop, "shutdown")
+
+        # full text index over the messages, kept in sync by triggers. sqlite memory only, as are the archives.
+        if self.bot.memory.dialect == "sqlite":
+            self.create_fts()
+
+        # rows are queued here and written in batches by a background thread.
+        self.queue    = Queue.Queue(self.bot.config.CHATLOG_QUEUE_DEPTH)
+        self.wakeup   = threading.Event()
+        self.stopping = threading.Event()
+        self.lock     = threading.Lock()
+        self.dropped  = 0           # rows lost to a full queue or a failed write.
+
+        # the chatlog table and its room and user lookup tables are created by the memory migrations. lookup IDs are
+        # cached here as they're resolved.
+        self.rooms   = {}           # room jid -> rooms.id.
+        self.users   = {}           # (hipchat id, name, nick) -> users.id.
+
+        # months past the retention window are moved out to compressed archives by the writer.
+        directory     = os.path.join(self.bot.path, self.bot.config.CHATLOG_ARCHIVE_DIR)
+        self.archive  = archive.archive(directory, self.bot.config.CHATLOG_ARCHIVE_CACHE, self.bot.memory.functions)
+        self.rotation = 0           # time of the next check for months to archive.
+
+        # history logged before the activity rollups existed is counted in by the writer, a chunk at a time.
+        self.backfilling = True
+
+        self.bot.metrics.register_gauge("chatlog_queue_depth",  "Chat log rows waiting to be written.",
+                                        self.queue.qsize)
+        self.bot.metrics.register_gauge("chatlog_dropped_rows", "Chat log rows lost to a full queue or failed write.",
+                                        lambda: self.dropped)
+
+        self.thread = threading.Thread(target=self.writer, name="chat_logger")
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    ####################################################################################################################
+    def create_fts (self, query=None):
+        """
+        Create the chatlog_fts full text index on chatlog.message, and the triggers that keep it up to date, if it
+        doesn't already exist. FTS5 is used when SQLite was built with it, FTS4 otherwise. Existing rows are indexed
+        when the index is first created.
+
+        @type  query: Function
+        @param query: Optional routine taking (query) to create the index with, memory by default.
+        """
+
+        query = query or self.bot.memory_query
+
+        if query("SELECT name FROM sqlite_master WHERE name='chatlog_fts'").fetchone():
+            return
+
+        options = [row[0] for row in query("PRAGMA compile_options").fetchall()]
+
+        if "ENABLE_FTS5" in options:
+            sql = "CREATE VIRTUAL TABLE chatlog_fts USING fts5(message, content='chatlog', content_rowid='id')"
+
+            query(sql)
+
+            delete = "INSERT INTO chatlog_fts (chatlog_fts, rowid, message) VALUES ('delete', old.id, old.message);"
+            insert = "INSERT INTO chatlog_fts (rowid, message) VALUES (new.id, new.message);"
+        else:
+            sql = "CREATE VIRTUAL TABLE chatlog_fts USING fts4(content='chatlog', message)"
+
+            query(sql)
+
+            delete = "DELETE FROM chatlog_fts WHERE docid=old.id;"
+            insert = "INSERT INTO chatlog_fts (docid, message) VALUES (new.id, new.message);"
+
+        query("CREATE TRIGGER chatlog_fts_insert AFTER INSERT ON chatlog BEGIN %s END" % insert)
+        query("CREATE TRIGGER chatlog_fts_delete BEFORE DELETE ON chatlog BEGIN %s END" % delete)
+        query("CREATE TRIGGER chatlog_fts_update_before BEFORE UPDATE ON chatlog BEGIN %s END" % delete)
+        query("CREATE TRIGGER chatlog_fts_update_after AFTER UPDATE ON chatlog BEGIN %s END" % insert)
+
+        # index what's already been logged.
+        query("INSERT INTO chatlog_fts (chatlog_fts) VALUES ('rebuild')")
+
+
+    ####################################################################################################################
+    def archive_month (self, month):
+        """
+        Move the oldest rows of the chat log, up to the first one logged past the end of the given month, out to the
+        month's archive. Rows are copied into the archive, which is stored before they are deleted from memory. Row IDs
+        are kept, so that a move interrupted in between is completed by the next one without duplicates. The newest row
+        always stays in memory, SQLite would otherwise hand out row IDs from 1 again and clash with archived ones.
+
+        @type  month: String
+        @param month: Month of the oldest row in the chat log, YYYY-MM.
+
+        @rtype:  Integer
+        @return: Number of rows archived.
+        """
+
+        end    = archive.bounds(month)[1]
+        batch  = self.bot.config.CHATLOG_BATCH_SIZE
+        newest = self.bot.memory_query("SELECT IFNULL(MAX(id), 0) FROM chatlog").fetchone()[0]
+        conn   = self.archive.connect(month, write=True)
+        last   = 0
+
+        try:
+            # same tables as in memory, with the full text index kept up to date by its triggers.
+            if not conn.execute("SELECT name FROM sqlite_master WHERE name='chatlog'").fetchone():
+                sql = "SELECT sql FROM sqlite_master WHERE type='table' AND name IN ('rooms', 'users', 'chatlog')"
+
+                for row in self.bot.memory_query(sql).fetchall():
+                    conn.execute(row["sql"])
+
+            self.create_fts(conn.execute)
+
+            # the lookup tables are small, they're copied whole.
+            for table in ["rooms", "users"]:
+                rows = [tuple(row) for row in self.bot.memory_query("SELECT * FROM %s" % table).fetchall()]
 
-        self.bot.memory_query(sql)
+                if rows:
+                    values = ",".join("?" * len(rows[0]))
+                    conn.executemany("INSERT OR REPLACE INTO %s VALUES (%s)" % (table, values), rows)
+
+            sql = "SELECT id, room_id, user_id, stamp, message FROM chatlog WHERE id > ? ORDER BY id LIMIT ?"
+
+            while True:
+                rows = self.bot.memory_query(sql, (last, batch)).fetchall()
+                done = len(rows) < batch
+
+                for i, row in enumerate(rows):
+                    if row["stamp"] >= end or row["id"] == newest:
+                        rows = rows[:i]
+                        done = True
+                        break
+
+                if rows:
+                    values = [tuple(row) for row in rows]
+                    last   = rows[-1]["id"]
+
+                    conn.executemany("INSERT OR IGNORE INTO chatlog (id, room_id, user_id, stamp, message) "
+                                     "VALUES (?,?,?,?,?)", values)
+
+                if done:
+                    break
+
+            conn.commit()
+        finally:
+            conn.close()
+
+        self.archive.store(month)
+
+        # the rows are safely archived, remove them from memory.
+        sql   = "DELETE FROM chatlog WHERE id IN (SELECT id FROM chatlog WHERE id <= ? ORDER BY id LIMIT ?)"
+        moved = 0
+
+        while True:
+            deleted = self.bot.memory_query(sql, (last, batch)).rowcount
+            moved  += deleted
+
+            if not deleted:
+                return moved
+
+
+    ####################################################################################################################
+    def backfill_activity (self):
+        """
+        Count the next BACKFILL_CHUNK rows of history, in memory and in the archives, into the activity rollups. The
+        counts and the backfill position are written in the same transaction.
+
+        @rtype:  Boolean
+        @return: True if there's more history left to count.
+        """
+
+        state = self.bot.memory_query("SELECT boundary, position FROM chatlog_activity_backfill").fetchone()
+
+        if not state or state["position"] >= state["boundary"]:
+            return False
+
+        upper  = min(state["position"] + BACKFILL_CHUNK, state["boundary"])
+        sql    = "SELECT room_id, stamp / 3600 * 3600, user_id, COUNT(*) FROM chatlog"
+        sql   += " WHERE id > ? AND id <= ? GROUP BY 1, 2, 3"
+        counts = {}
+
+        for room_id, hour, user_id, messages in self.query(sql, (state["position"], upper)):
+            counts[(room_id, hour, user_id)] = counts.get((room_id, hour, user_id), 0) + messages
+
+        with self.bot.memory.transaction() as conn:
+            self.count_activity(conn, counts)
+            conn.execute("UPDATE chatlog_activity_backfill SET position=?", (upper,))
+
+        return upper < state["boundary"]
+
+
+    ####################################################################################################################
+    def count_activity (self, conn, counts):
+        """
+        Add message counts to the activity rollups.
+
+        @type  conn:   Connection
+        @param conn:   Writer connection, held in a transaction.
+        @type  counts: Dictionary
+        @param counts: (room ID, hour, user ID) -> number of messages.
+        """
+
+        conn.executemany("INSERT OR IGNORE INTO chatlog_activity VALUES (?,?,?,0)", counts.keys())
+
+        sql = "UPDATE chatlog_activity SET messages=messages+? WHERE room_id=? AND hour=? AND user_id=?"
+
+        conn.executemany(sql, [(messages,) + key for key, messages in counts.items()])
+
+
+    ####################################################################################################################
+    def flush (self):
+        """
+        Write every queued row, in batches of config.CHATLOG_BATCH_SIZE with one transaction per batch. The activity
+        rollups are updated in the same transaction.
+        """
+
+        sql = "INSERT INTO chatlog (room_id, user_id, stamp, message) VALUES (?,?,?,?)"
+
+        with self.lock:
+            while True:
+                rows = []
+
+                try:
+                    while len(rows) < self.bot.config.CHATLOG_BATCH_SIZE:
+                        rows.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    pass
+
+                if not rows:
+                    return
+
+                start = time.time()
+
+                try:
+                    rows   = [(self.room_id(jid), self.user_id(user), stamp, message)
+                              for jid, user, stamp, message in rows]
+                    counts = {}
+
+                    for room_id, user_id, stamp, message in rows:
+                        key         = (room_id, stamp / 3600 * 3600, user_id)
+                        counts[key] = counts.get(key, 0) + 1
+
+                    with self.bot.memory.transaction() as conn:
+                        conn.executemany(sql, rows)
+                        self.count_activity(conn, counts)
+                except:
+                    # XXX - consider adding a more in-your-face notification on this.
+                    self.bot._err("Failed saving %d log entries." % len(rows))
+                    self.bot.metrics.observe("memory", "chat_logger", "FLUSH", time.time() - start, error=True)
+
+                    # the batch is lost, count it so the loss shows in the metrics.
+                    self.dropped += len(rows)
+                    return
+
+                self.bot.metrics.observe("memory", "chat_logger", "FLUSH", time.time() - start)
+
+
+    ####################################################################################################################
+    def room_id (self, jid):
+        """
+        @type  jid: String
+        @param jid: Room JID.
+
+        @rtype:  Integer
+        @return: ID of the room in the rooms lookup table, added if need be.
+        """
+
+        if jid not in self.rooms:
+            self.bot.memory_query("INSERT OR IGNORE INTO rooms (jid) VALUES (?)", (jid,))
+            self.rooms[jid] = self.bot.memory_query("SELECT id FROM rooms WHERE jid=?", (jid,)).fetchone()[0]
+
+        return self.rooms[jid]
+
+
+    ####################################################################################################################
+    def user_id (self, user):
+        """
+        @type  user: Tuple
+        @param user: (HipChat user ID, name, nick).
+
+        @rtype:  Integer
+        @return: ID of the user in the users lookup table, added if need be.
+        """
+
+        if user not in self.users:
+            sql = "INSERT OR IGNORE INTO users (hipchat_id, name, nick) VALUES (?,?,?)"
+            self.bot.memory_query(sql, user)
+
+            sql = "SELECT id FROM users WHERE hipchat_id=? AND name=? AND nick=?"
+            self.users[user] = self.bot.memory_query(sql, user).fetchone()[0]
+
+        return self.users[user]
+
+
+    ####################################################################################################################
+    def query (self, sql, params=(), since=None):
+        """
+        Run a read query against the chat log in memory and every archived month from a given time on. Archives have
+        the same chatlog, rooms, users and chatlog_fts tables as memory, so the same query works across them all.
+
+        @type  sql:    String
+        @param sql:    Query.
+        @type  params: Tuple
+        @param params: Query parameters.
+        @type  since:  Integer
+        @param since:  Optional epoch timestamp, archived months ending before it are skipped.
+
+        @rtype:  List
+        @return: Rows from memory followed by rows from the archives, newest month first.
+        """
+
+        rows = self.bot.memory_query(sql, params).fetchall()
+
+        for month in reversed(self.archive.months()):
+            if since and archive.bounds(month)[1] <= since:
+                break
+
+            conn = self.archive.connect(month)
+
+            try:
+                rows.extend(conn.execute(sql, params).fetchall())
+            finally:
+                conn.close()
+
+        return rows
+
+
+    ####################################################################################################################
+    def rotate (self):
+        """
+        Archive every month of the chat log past the retention window of config.CHATLOG_RETENTION_MONTHS, oldest first.
+        """
+
+        retention = self.bot.config.CHATLOG_RETENTION_MONTHS
+
+        # archives are copies of the sqlite memory tables.
+        if not retention or self.bot.memory.dialect != "sqlite":
+            return
+
+        # the start of the oldest month kept in memory.
+        year, month = time.localtime()[:2]
+        months      = year * 12 + month - 1 - retention
+        cutoff      = archive.bounds("%04d-%02d" % (months / 12, months % 12 + 1))[0]
+
+        while True:
+            oldest = self.bot.memory_query("SELECT stamp FROM chatlog ORDER BY id LIMIT 1").fetchone()
+
+            if not oldest or oldest["stamp"] >= cutoff:
+                return
+
+            month = archive.month_of(oldest["stamp"])
+            start = time.time()
+            moved = self.archive_month(month)
+
+            self.bot._dbg("archived %d chat log rows from %s in %.1fs." % (moved, month, time.time() - start))
+
+            if not moved:
+                return
+
+
+    ####################################################################################################################
+    def stop (self):
+        """
+        Stop the writer, waiting out whatever pass it's in the middle of so that a reloaded handler's writer can't race
+        it, then write out whatever is still queued.
+        """
+
+        self.stopping.set()
+        self.wakeup.set()
+
+        if self.thread is not threading.current_thread():
+            self.thread.join()
+
+        self.flush()
+
+
+    ####################################################################################################################
+    def writer (self):
+        """
+        Background writer, flushes every config.CHATLOG_FLUSH_INTERVAL seconds or as soon as a full batch is queued.
+        Counts history into the activity rollups a chunk at a time until done, then checks for months to archive
+        every ROTATION_INTERVAL seconds. Runs until stop() is called.
+        """
+
+        while not self.stopping.is_set():
+            self.wakeup.wait(self.bot.config.CHATLOG_FLUSH_INTERVAL)
+            self.wakeup.clear()
+            self.flush()
+
+            if self.stopping.is_set():
+                return
+
+            if self.backfilling:
+                try:
+                    self.backfilling = self.backfill_activity()
+                except Exception as e:
+                    self.bot._err("failed backfilling chat log activity: %s" % e)
+
+                # archiving waits for the backfill, so that no row is counted twice while it's in both places.
+                continue
+
+            if time.time() < self.rotation:
+                continue
+
+            self.rotation = time.time() + ROTATION_INTERVAL
+
+            try:
+                self.rotate()
+            except Exception as e:
+                self.bot._err("failed archiving the chat log: %s" % e)
 
 
     ####################################################################################################################
@@ -40,27 +445,20 @@ class handler:
         Maintain a message log.
         """
 
-        pprint(room)
-
-        #room_id   = self.bot.hipchat.room_jid2id(room)
-        room_id   = room
-        room_name = self.bot.hipchat.room_decode(room)
         user_id   = self.bot.hipchat.user_from_xmpp_message(xmpp_message)
         user_name = nick
         user_nick = self.bot.hipchat.user_nick2at(user_name).lstrip("@")
-        stamp     = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        stamp     = int(time.time())
 
         if LOG_CHATS_TO_CONSOLE and nick != self.bot.config.NICKNAME:
             self.bot._dbg("[%s] %s: %s" % (self.bot.hipchat.room_decode(room), nick, message))
 
-
-        sql    = "INSERT INTO chatlog"
-        sql   += " (room_id, room_name, user_id, user_name, user_nick, message, stamp)"
-        sql   += " VALUES (?,?,?,?,?,?,?)"
-
+        # queue the row for the writer, never block dispatch on it.
         try:
-            self.bot.memory_query(sql, (room_id, room, user_id, user_name, user_nick, message, stamp))
-        except:
-            raise
-            # XXX - consider adding a more in-your-face notification on this.
-            self.bot._err("Failed saving the above log entry.")
\ No newline at end of file
+            self.queue.put_nowait((room, (user_id or "", user_name or "", user_nick or ""), stamp, message))
+        except Queue.Full:
+            self.dropped += 1
+            return
+
+        if self.queue.qsize() >= self.bot.config.CHATLOG_BATCH_SIZE:
+            self.wakeup.set()
\ No newline at end of file
@@ -36,16 +36,16 @@ class handler:
         # otherwise, provide the description for the specified topic.
         topic_lower = topic.lower()
 
-        for k, v in self.bot.help.iteritems():
+        for k in self.bot.help.keys():
             if topic_lower == k.lower():
-                return v
+                return self.bot.help_describe(k)
 
         # no match was found, try to compensate for any fat fingering before giving up.
         acceptable_distance = min(.85 * len(topic), 3)
 
-        for k, v in self.bot.help.iteritems():
+        for k in self.bot.help.keys():
             if helpers.levenshtein_distance(topic_lower, k) <= acceptable_distance:
-                return ["(goodnews) i think you probably meant '%s'..." % k, v]
+                return ["(goodnews) i think you probably meant '%s'..." % k, self.bot.help_describe(k)]
 
         # pick a random emotion of disappointment.
         emotion = random.choice(["disapproval", "areyoukiddingme", "facepalm", "sadpanda"])
@@ -26,10 +26,6 @@ class handler:
         self.bot.register_help("image search", self.google_images.__doc__)
         self.bot.register_help("mustachify",   self.mustachify.__doc__)
 
-        # keep track of recent image results per room.
-        self.recent_google_images   = {}
-        self.recent_dribbble_images = {}
-
 
     ####################################################################################################################
     def dribbble (self, xmpp_message, room, nick, keywords):
@@ -69,21 +65,14 @@ class handler:
         if not results:
             return "(thumbsdown) no hits under that keyword sir."
 
-        # initialize local storage.
-        self.recent_dribbble_images[room] = self.recent_dribbble_images.get(room, [])
+        # keep track of 10 most recent URLs.
+        recent = self.bot.state.recent(("images", "dribbble", room), 10)
 
-        # try up to to 25 times to pick a unique URL.
+        # try up to to 25 times to pick a unique URL, one we haven't delivered recently.
         for i in xrange (25):
             url, img_url, desc = random.choice(results)
 
-            # we haven't delivered this one recently.
-            if url not in self.recent_dribbble_images[room]:
-                self.recent_dribbble_images[room].append(url)
-
-                # keep track of 10 most recent URLs.
-                if len(self.recent_dribbble_images[room]) > 10:
-                    self.recent_dribbble_images[room].pop(0)
-
+            if recent.add(url):
                 break
 
         # decided against returning the description for now.
@@ -112,21 +101,14 @@ class handler:
         except:
             return "(facepalm) sorry. I encounted a JSON parsing error."
 
-        # initialize local storage.
-        self.recent_google_images[room] = self.recent_google_images.get(room, [])
+        # keep track of 3 most recent URLs.
+        recent = self.bot.state.recent(("images", "google", room), 3)
 
-        # try up to to ten times to pick a unique URL.
+        # try up to to ten times to pick a unique URL, one we haven't delivered recently.
         for i in xrange (10):
             url = random.choice(data)["url"]
 
-            # we haven't delivered this one recently.
-            if url not in self.recent_google_images[room]:
-                self.recent_google_images[room].append(url)
-
-                # keep track of 3 most recent URLs.
-                if len(self.recent_google_images[room]) > 3:
-                    self.recent_google_images[room].pop(0)
-
+            if recent.add(url):
                 break
 
         return url
@@ -142,16 +124,9 @@ class handler:
 
         URL = "http://mustachify.me/?src="
 
-        # initialize local storage.
-        self.recent_google_images[room] = self.recent_google_images.get(room, [])
-
         # if no URL is specified, see if we can pull it from Google image search history for the room.
-        if not url and len(self.recent_google_images[room]):
-            # try/except in case of race condition.
-            try:
-                url = self.recent_google_images[room][-1]
-            except:
-                url = None
+        if not url:
+            url = self.bot.state.recent(("images", "google", room), 3).newest()
 
         # if still no URL, error.
         if not url:
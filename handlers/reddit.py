@@ -19,9 +19,6 @@ class handler:
         # register help.
         self.bot.register_help("reddit", self.reddit.__doc__)
 
-        # keep track of recent reddits per subreddit and per room.
-        self.recent = {}
-
 
     ####################################################################################################################
     def reddit (self, xmpp_message, room, nick, subreddit):
@@ -47,24 +44,14 @@ class handler:
         except:
             return "(reddit) no such subreddit."
 
-        # ensure local storage exists for this room...
-        self.recent[room] = self.recent.get(room, {})
-
-        # ...and this specific subreddit.
-        self.recent[room][subreddit] = self.recent[room].get(subreddit, [])
+        # keep track of 10 most recent entries in this room, for this specific subreddit.
+        recent = self.bot.state.recent(("reddit", room, subreddit), 10)
 
-        # try up to to thirty times to pick a unique entry.
+        # try up to to thirty times to pick a unique entry, one we haven't delivered recently.
         for i in xrange (30):
             entry = random.choice(data["children"])
 
-            # we haven't delivered this one recently.
-            if entry["data"]["id"] not in self.recent[room][subreddit]:
-                self.recent[room][subreddit].append(entry["data"]["id"])
-
-                # keep track of 10 most recent URLs.
-                if len(self.recent[room][subreddit]) > 10:
-                    self.recent[room][subreddit].pop(0)
-
+            if recent.add(entry["data"]["id"]):
                 break
 
         return "%s: %s" % (entry["data"]["title"], entry["data"]["url"])
@@ -0,0 +1,170 @@
+import re
+import time
+
+EMOTICON = "(search) "
+
+# hits per page of results.
+PAGE_SIZE = 5
+
+########################################################################################################################
+class handler:
+    """
+    Full text search over the chat log.
+    """
+
+    ####################################################################################################################
+    def __init__ (self, bot):
+        self.bot = bot
+
+        # register triggers.
+        self.bot.register_trigger(self.search, "command", "search")
+
+        # register help.
+        self.bot.register_help("search", self.search.__doc__)
+
+
+    ####################################################################################################################
+    def since (self, value):
+        """
+        Convert a since: filter to a chat log timestamp.
+
+        @type  value: String
+        @param value: Either a date (YYYY-MM-DD) or a relative period in hours, days or weeks (ie: 12h, 3d, 2w).
+
+        @rtype:  Integer
+        @return: Epoch timestamp, or None if the value isn't understood.
+        """
+
+        hit = re.match("^(\d+)([hdw])$", value)
+
+        if hit:
+            return int(time.time()) - int(hit.group(1)) * {"h" : 3600, "d" : 86400, "w" : 604800}[hit.group(2)]
+
+        # dates are midnight, local time.
+        try:
+            return int(time.mktime(time.strptime(value, "%Y-%m-%d")))
+        except ValueError:
+            return None
+
+
+    ####################################################################################################################
+    def search (self, xmpp_message, room, nick, args):
+        """
+        Search the chat log of this room, best matches first. Terms must all appear in a message. Narrow the search
+        down with room:<name> (or room:all), user:<name> and since:<YYYY-MM-DD or 12h, 3d, 2w>. Use page:<n> to page
+        through the results. Archived months of the chat log are searched as well.
+
+        Usage: .search <terms> [room:<name>] [user:<name>] [since:<when>] [page:<n>]
+        """
+
+        # the full text index is kept by the sqlite memory backend only.
+        if self.bot.memory.dialect != "sqlite":
+            return "%ssearch needs the sqlite memory backend." % EMOTICON
+
+        terms   = []
+        filters = {"room" : None, "user" : None, "since" : None, "page" : "1"}
+
+        # pick the filters out of the terms.
+        for token in args.split():
+            key, _, value = token.partition(":")
+
+            if key.lower() in filters and value:
+                filters[key.lower()] = value
+            else:
+                terms.append(token)
+
+        if not terms:
+            return "%swhat should i look for? try: .search <terms> [room:] [user:] [since:] [page:]" % EMOTICON
+
+        try:
+            page = max(int(filters["page"]), 1)
+        except ValueError:
+            return "%spage should be a number." % EMOTICON
+
+        # every term is quoted, so that punctuation in them can't trip up the match syntax.
+        match  = " ".join('"%s"' % term.replace('"', '""') for term in terms)
+        params = [match]
+        since  = None
+        sql    = "SELECT r.jid, u.name, c.message, c.stamp, %s AS position, c.id"
+        sql   += " FROM chatlog_fts f, chatlog c, rooms r, users u"
+        sql   += " WHERE chatlog_fts MATCH ? AND c.id = f.rowid AND r.id = c.room_id AND u.id = c.user_id"
+
+        # the current room, unless told otherwise.
+        if filters["room"] != "all":
+            sql += " AND r.jid = ?"
+            params.append(self.bot.hipchat.room_encode(filters["room"]) if filters["room"] else room)
+
+        if filters["user"]:
+            sql += " AND (u.nick = ? OR u.name LIKE ?)"
+            params.extend([filters["user"].lstrip("@").lower(), filters["user"] + "%"])
+
+        if filters["since"]:
+            since = self.since(filters["since"])
+
+            if since is None:
+                return "%ssince should be a date (YYYY-MM-DD) or period (ie: 12h, 3d, 2w)." % EMOTICON
+
+            sql += " AND c.stamp >= ?"
+            params.append(since)
+
+        # rank by relevance where the index supports it (FTS5), by recency otherwise.
+        sql %= "f.rank" if self.fts5() else "-c.id"
+        sql += " ORDER BY position"
+
+        # the chat log spans memory and the archives. every one of them contributes its best hits up to the requested
+        # page, plus one to know whether there's another page, and the page is cut from the merged hits.
+        sql += " LIMIT ?"
+        params.append(page * PAGE_SIZE + 1)
+
+        # the chat log lives with the chat logger, which may be disabled or in the middle of a reload.
+        chat_logger = self.bot.handlers.get("chat_logger")
+
+        if not chat_logger:
+            return "%sthe chat log isn't available right now, try again in a bit." % EMOTICON
+
+        start = time.time()
+        hits  = []
+        seen  = set()
+
+        # while a month is being archived its messages are in both memory and the archive, keep the best hit of each.
+        for hit in sorted(chat_logger.query(sql, params, since), key=lambda hit: hit[4]):
+            if hit[5] not in seen:
+                seen.add(hit[5])
+                hits.append(hit)
+
+        hits = hits[(page - 1) * PAGE_SIZE:]
+
+        if not hits:
+            return "%snothing found." % EMOTICON
+
+        report = ["%spage %d, found in %dms..." % (EMOTICON, page, (time.time() - start) * 1000)]
+
+        for jid, user_name, message, stamp, position, message_id in hits[:PAGE_SIZE]:
+            message = message.replace("\n", " ")
+
+            if len(message) > 200:
+                message = message[:200] + "..."
+
+            stamp = time.strftime("%Y-%m-%d %H:%M", time.localtime(stamp))
+
+            report.append("[%s] %s in %s: %s" % (stamp, user_name, self.bot.hipchat.room_decode(jid), message))
+
+        if len(hits) > PAGE_SIZE:
+            report.append("more with page:%d" % (page + 1))
+
+        return "\n".join(report)
+
+
+    ####################################################################################################################
+    def fts5 (self):
+        """
+        @rtype:  Boolean
+        @return: True if the chat log index is an FTS5 table.
+        """
+
+        if not hasattr(self, "is_fts5"):
+            sql = self.bot.memory_query("SELECT sql FROM sqlite_master WHERE name='chatlog_fts'").fetchone()
+
+            self.is_fts5 = bool(sql and "fts5" in sql[0].lower())
+
+        return self.is_fts5
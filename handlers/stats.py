@@ -0,0 +1,40 @@
+# bot helpers.
+import helpers
+
+########################################################################################################################
+class handler:
+    """
+    Bot performance statistics.
+    """
+
+    ####################################################################################################################
+    def __init__ (self, bot):
+        self.bot = bot
+
+        # register triggers.
+        self.bot.register_trigger(self.stats, "command", "stats")
+
+        # register help.
+        self.bot.register_help("stats", self.stats.__doc__)
+
+
+    ####################################################################################################################
+    def stats (self, xmpp_message, room, nick, kinds):
+        """
+        Report call counts, errors and latencies for the most expensive handlers, memory queries and HipChat API
+        calls, by total time spent. Optionally limit the report to one or more kinds of call.
+
+        Usage: .stats [any|command|regex|cron|memory|hipchat|outbound|startup ...]
+        """
+
+        kinds  = kinds.lower().split() or None
+        report = self.bot.metrics.report(kinds)
+
+        if not report:
+            return "(shrug) nothing measured yet."
+
+        days, hours, minutes, seconds = helpers.elapsed_time(self.bot.metrics.started)
+
+        report.insert(0, "(chart) up %dd %dh %dm, the most time was spent in..." % (days, hours, minutes))
+
+        return "\n".join(report)
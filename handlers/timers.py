@@ -77,15 +77,78 @@ class handler:
         self.bot.register_help("reminders", help_reminders)
         self.bot.register_help("stopwatch", self.stopwatch.__doc__)
 
-        # these two data structures are mirrored in the bots memory.
-        self.timers      = self.bot.memory_recall("timers",      {})
-        self.reminders   = self.bot.memory_recall("reminders",   {})
-        self.stopwatches = self.bot.memory_recall("stopwatches", {})
+        # timers, reminders and stopwatches are stored one row per item.
+        self._create_tables()
 
-        # keep track of what reminder last went off for each user (for snoozing purposes).
+        # keep track of the IDs of the reminders that last went off for each user (for snoozing purposes).
         self.last_reminders = {}
 
 
+    ####################################################################################################################
+    def _create_tables (self):
+        """
+        Create the timer, reminder and stopwatch tables and their indexes, migrating over any timers, reminders and
+        stopwatches still kept as pickled dictionaries in the cerebellum.
+        """
+
+        sql  = "CREATE TABLE IF NOT EXISTS timers ("
+        sql += "  id         INTEGER PRIMARY KEY,"
+        sql += "  nick       TEXT,"
+        sql += "  room_id    INTEGER,"
+        sql += "  expiration INTEGER,"
+        sql += "  message    TEXT)"
+
+        self.bot.memory_query(sql)
+
+        sql  = "CREATE TABLE IF NOT EXISTS reminders ("
+        sql += "  id         INTEGER PRIMARY KEY,"
+        sql += "  nick       TEXT,"
+        sql += "  room_id    INTEGER,"
+        sql += "  expiration INTEGER,"
+        sql += "  days       INTEGER,"
+        sql += "  message    TEXT)"
+
+        self.bot.memory_query(sql)
+
+        sql  = "CREATE TABLE IF NOT EXISTS stopwatches ("
+        sql += "  nick       TEXT PRIMARY KEY,"
+        sql += "  start      REAL)"
+
+        self.bot.memory_query(sql)
+
+        for table in ["timers", "reminders"]:
+            for column in ["expiration", "room_id", "nick"]:
+                self.bot.memory_query("CREATE INDEX IF NOT EXISTS %s_%s ON %s (%s)" % (table, column, table, column))
+
+        # migrate the pickled data structures.
+        migrated = [tag for tag in ["timers", "reminders", "stopwatches"] if self.bot.memory_recall(tag) is not None]
+
+        if not migrated:
+            return
+
+        timers      = [(nick, room_id, expiration, message)
+                       for nick, timers in self.bot.memory_recall("timers", {}).iteritems()
+                       for room_id, expiration, message in timers]
+        reminders   = [(nick, room_id, expiration, days, message)
+                       for nick, reminders in self.bot.memory_recall("reminders", {}).iteritems()
+                       for room_id, expiration, days, message in reminders]
+        stopwatches = self.bot.memory_recall("stopwatches", {}).items()
+
+        # the rows are inserted and the pickled dictionaries deleted in one transaction, bypassing the write behind
+        # cache, so that dying half way through can't migrate everything a second time on the next start.
+        with self.bot.memory.transaction() as conn:
+            conn.executemany("INSERT INTO timers (nick, room_id, expiration, message) VALUES (?, ?, ?, ?)", timers)
+            conn.executemany("INSERT INTO reminders (nick, room_id, expiration, days, message) VALUES (?, ?, ?, ?, ?)",
+                             reminders)
+            conn.executemany("INSERT OR REPLACE INTO stopwatches (nick, start) VALUES (?, ?)", stopwatches)
+            conn.executemany("DELETE FROM cerebellum WHERE tag = ?", [(tag,) for tag in migrated])
+
+        # drop the cached copies.
+        for tag in migrated:
+            self.bot._dbg("migrated %s out of the cerebellum." % tag)
+            self.bot.memory_forget(tag)
+
+
     ####################################################################################################################
     def _natural_reminder (self, xmpp_message, room, nick, message):
         hit = re.search(self.bot.config.AT_NAME + ".*remind me\s+(.*)\s(every|in)[^\d]*(\d+).*", message, re.I)
@@ -144,6 +207,57 @@ class handler:
         return days, hours, minutes, seconds, msecs
 
 
+    ####################################################################################################################
+    def midnight (self, days):
+        """
+        Determine the timestamp of midnight a number of days from now.
+
+        @type  days: Integer
+        @param days: Days from now.
+
+        @rtype:  Float
+        @return: Timestamp.
+        """
+
+        expiration = (datetime.datetime.now() + datetime.timedelta(days=days)).strftime("%Y-%m-%d 00:00:00")
+
+        return time.mktime(time.strptime(expiration, "%Y-%m-%d 00:00:00"))
+
+
+    ####################################################################################################################
+    def find_reminder (self, nick, existing_reminder, fuzzy=False):
+        """
+        Find a users reminder by message, case insensitive.
+
+        @type  nick:              String
+        @param nick:              Owner of the reminder.
+        @type  existing_reminder: String
+        @param existing_reminder: Reminder message.
+        @type  fuzzy:             Boolean
+        @param fuzzy:             Fall back to a close, minimal 85%, message match.
+
+        @rtype:  sqlite3.Row
+        @return: Reminder or None if not found.
+        """
+
+        reminders = self.bot.memory_query("SELECT * FROM reminders WHERE nick=? ORDER BY id", (nick,)).fetchall()
+
+        for reminder in reminders:
+            if reminder["message"].lower() == existing_reminder.lower():
+                return reminder
+
+        if fuzzy:
+            acceptable_distance = min(.85 * len(existing_reminder), 3)
+
+            for reminder in reminders:
+                distance = helpers.levenshtein_distance(reminder["message"].lower(), existing_reminder.lower())
+
+                if distance <= acceptable_distance:
+                    return reminder
+
+        return None
+
+
     ####################################################################################################################
     def reminder_make (self, xmpp_message, room, nick, args):
         """
@@ -167,17 +281,10 @@ class handler:
             return "%shmmm, try again. i need to know how often would you'd like me to remind you." % EMOTICON
 
         # record the reminder.
-        room_id    = self.bot.hipchat.room_jid2id(room)
-        now        = datetime.datetime.now()
-        expiration = (now + datetime.timedelta(days=days)).strftime("%Y-%m-%d 00:00:00")
-        expiration = time.mktime(time.strptime(expiration, "%Y-%m-%d 00:00:00"))
+        room_id = self.bot.hipchat.room_jid2id(room)
+        sql     = "INSERT INTO reminders (nick, room_id, expiration, days, message) VALUES (?, ?, ?, ?, ?)"
 
-        # set the reminder.
-        self.reminders[nick] = self.reminders.get(nick, [])
-        self.reminders[nick].append((room_id, expiration, days, message))
-
-        # commit the data structure to memory.
-        self.bot.memory_remember("reminders", self.reminders)
+        self.bot.memory_query(sql, (nick, room_id, self.midnight(days), days, message))
 
         return "%sok, i'll remind you '%s' every %d days." % (EMOTICON, message, days)
 
@@ -190,22 +297,16 @@ class handler:
         """
 
         report = []
+        sql    = "SELECT expiration, days, message FROM reminders WHERE nick=? ORDER BY expiration"
 
-        # iterate through each users reminders for this specific room.
-        for nick, reminders in self.reminders.iteritems():
-
-            # for each timer.
-            for reminder in reminders:
-
-                # break apart the tupple.
-                room_id, expiration, days, message = reminder
+        for expiration, days, message in self.bot.memory_query(sql, (nick,)).fetchall():
 
-                # calculate time to expiration.
-                left   = expiration - time.time()
-                entry  = "every %d days i remind you '%s'. which is coming up in %d days."
-                entry %= (days, message, int(left / 86400) + 1)
+            # calculate time to expiration.
+            left   = expiration - time.time()
+            entry  = "every %d days i remind you '%s'. which is coming up in %d days."
+            entry %= (days, message, int(left / 86400) + 1)
 
-                report.append(entry)
+            report.append(entry)
 
         if report:
             report.insert(0, "%shere's the items i'm waiting to remind you about..." % EMOTICON)
@@ -213,7 +314,6 @@ class handler:
         else:
             return "%syou haven't asked me to remind you about anything in this room." % EMOTICON
 
-
     ####################################################################################################################
     def reminder_clear (self, xmpp_message, room, nick, existing_reminder):
         """
@@ -228,24 +328,13 @@ class handler:
             return "%shmmm, you must tell me which reminder you're referring to." % EMOTICON
 
         # find the reminder.
-        found = False
+        reminder = self.find_reminder(nick, existing_reminder)
 
-        for reminder in self.reminders.get(nick, []):
-            # break apart the reminder tuple.
-            room_id, expiration, days, message = reminder
-
-            if message.lower() == existing_reminder.lower():
-                found = True
-                break
-
-        if not found:
+        if not reminder:
             return "%ssorry, but i don't recall you ever asking me to remind you about that in this room." % EMOTICON
 
         # remove the reminder.
-        self.reminders[nick].remove(reminder)
-
-        # commit the data structure to memory.
-        self.bot.memory_remember("reminders", self.reminders)
+        self.bot.memory_query("DELETE FROM reminders WHERE id=?", (reminder["id"],))
 
         return "%sok, i won't remind you about that anymore." % EMOTICON
 
@@ -270,44 +359,34 @@ class handler:
         # record the last run day.
         self.last_reminder_cron_day = now.day
 
-        # filter through each users reminders via reminder_filter().
-        for nick, reminders in self.reminders.iteritems():
-
-            # set this member variable for reminder_filter() to reference.
-            self.current_nick = nick
-
-            # filter through and process reminders.
-            self.reminders[nick] = filter(self.reminder_filter, reminders)
+        # process expired reminders only.
+        sql = "SELECT * FROM reminders WHERE expiration <= ? ORDER BY expiration"
 
-        # commit the data structure to memory.
-        self.bot.memory_remember("reminders", self.reminders)
+        for reminder in self.bot.memory_query(sql, (int(time.time()),)).fetchall():
+            self.reminder_fire(reminder)
 
 
     ####################################################################################################################
-    def reminder_filter (self, reminder):
+    def reminder_fire (self, reminder):
         """
-        List filter function for reminders.
+        Notify the room of an expired reminder and reschedule it.
         """
 
-        # pull out the various parts.
-        room_id, expiration, days, message = reminder
+        nick = reminder["nick"]
 
-        # check if time has expired.
-        if int(time.time()) > expiration:
-            self.last_reminders[self.current_nick].append(reminder)
+        self.last_reminders[nick] = self.last_reminders.get(nick, [])
+        self.last_reminders[nick].append(reminder["id"])
 
-            message = "%s, you wanted me to remind you %s. i'll remind you again in %d days." % \
-                (self.bot.hipchat.user_nick2at(self.current_nick), message, days)
+        message = "%s, you wanted me to remind you %s. i'll remind you again in %d days." % \
+            (self.bot.hipchat.user_nick2at(nick), reminder["message"], reminder["days"])
 
-            # notify the room.
-            self.bot.hipchat.rooms_message(room_id, message, color="purple", notify=1)
+        # notify the room.
+        self.bot.hipchat.rooms_message(reminder["room_id"], message, color="purple", notify=1)
 
-            # reminder is no longer active.
-            return False
-
-        # reminder is still active.
-        return True
+        # count down to the next reminder.
+        sql = "UPDATE reminders SET expiration=? WHERE id=?"
 
+        self.bot.memory_query(sql, (self.midnight(reminder["days"]), reminder["id"]))
 
     ####################################################################################################################
     def reminder_reset (self, xmpp_message, room, nick, existing_reminder):
@@ -321,62 +400,28 @@ class handler:
         existing_reminder = existing_reminder.strip()
 
         # if an existing reminder message was not supplied.
-        found = False
         if not existing_reminder:
 
             # if there is something on the last reminders stack, use that...
-            if self.last_reminders.has_key(nick) and self.last_reminders[nick]:
-                reminder = self.last_reminders[nick].pop()
-                found    = True
-
-                # break apart the reminder tuple.
-                room_id, expiration, days, message = reminder
+            if self.last_reminders.get(nick):
+                reminder_id = self.last_reminders[nick].pop()
+                reminder    = self.bot.memory_query("SELECT * FROM reminders WHERE id=?", (reminder_id,)).fetchone()
 
             # ...otherwise, complain.
             else:
                 return "%shmmm, please tell me which reminder you're referring to." % EMOTICON
 
-        # search for the reminder by exact message match.
-        if not found:
-
-            # walk through reminders.
-            for reminder in self.reminders.get(nick, []):
-
-                # break apart the reminder tuple.
-                room_id, expiration, days, message = reminder
-
-                if message.lower() == existing_reminder.lower():
-                    found = True
-                    break
-
-        # search for the reminder by close message match.
-        if not found:
-
-            # walk through reminders.
-            for reminder in self.reminders.get(nick, []):
-
-                # break apart the reminder tuple.
-                room_id, expiration, days, message = reminder
-
-                # try to find a minimal 85% match.
-                acceptable_distance = min(.85 * len(existing_reminder), 3)
-
-                if helpers.levenshtein_distance(message.lower(), existing_reminder.lower()) <= acceptable_distance:
-                    found = True
-                    break
+        # search for the reminder by exact, then close, message match.
+        else:
+            reminder = self.find_reminder(nick, existing_reminder, fuzzy=True)
 
-        if not found:
+        if not reminder:
             return "%ssorry, but i don't recall you ever asking me to remind you about that in this room." % EMOTICON
 
-        # remove the reminder and add it back in with a fresh expiration.
-        new_expiration = (datetime.datetime.now() + datetime.timedelta(days=days)).strftime("%Y-%m-%d 00:00:00")
-        new_expiration = time.mktime(time.strptime(new_expiration, "%Y-%m-%d 00:00:00"))
+        # reset the count down.
+        days = reminder["days"]
 
-        self.reminders[nick].remove(reminder)
-        self.reminders[nick].append((room_id, new_expiration, days, message))
-
-        # commit the data structure to memory.
-        self.bot.memory_remember("reminders", self.reminders)
+        self.bot.memory_query("UPDATE reminders SET expiration=? WHERE id=?", (self.midnight(days), reminder["id"]))
 
         if days == 1:
             return "%sok, we'll worry about that again tomorrow." % EMOTICON
@@ -403,27 +448,15 @@ class handler:
                 return "%ssorry, how many days did you say you want me to snooze this reminder for?" % EMOTICON
 
         # grab the last reminder from the stack.
-        reminder = None
-
-        if self.last_reminders.has_key(nick) and self.last_reminders[nick]:
-            reminder = self.last_reminders[nick].pop()
-
-        if not reminder:
+        if not self.last_reminders.get(nick):
             return "%shuh? i didn't say anything." % EMOTICON
 
-        # break apart the reminder tuple.
-        room_id, expiration, days, message = reminder
-
-        # remove the reminder and add it back in with a fresh expiration.
-        new_expiration = (datetime.datetime.now() + datetime.timedelta(days=days_to_snooze))
-        new_expiration = new_expiration.strftime("%Y-%m-%d 00:00:00")
-        new_expiration = time.mktime(time.strptime(new_expiration, "%Y-%m-%d 00:00:00"))
+        reminder_id = self.last_reminders[nick].pop()
 
-        self.reminders[nick].remove(reminder)
-        self.reminders[nick].append((room_id, new_expiration, days, message))
+        # push the expiration back.
+        sql = "UPDATE reminders SET expiration=? WHERE id=?"
 
-        # commit the data structure to memory.
-        self.bot.memory_remember("reminders", self.reminders)
+        self.bot.memory_query(sql, (self.midnight(days_to_snooze), reminder_id))
 
         if days_to_snooze == 1:
             return "%sok, we'll worry about that again tomorrow." % EMOTICON
@@ -466,36 +499,33 @@ class handler:
             return report
 
         # this function is bound to a regex trigger so get the entire message line. let's chop off the leading '.stop'.
-        message = message.lower()
+        message   = message.lower()
+        stopwatch = self.bot.memory_query("SELECT start FROM stopwatches WHERE nick=?", (nick,)).fetchone()
 
         # start the clock.
         if "start" in message or "run" in message or "go" in message:
-            self.stopwatches[nick] = time.time()
-
-            # commit the data structure to memory.
-            self.bot.memory_remember("stopwatches", self.stopwatches)
+            self.bot.memory_query("INSERT OR REPLACE INTO stopwatches (nick, start) VALUES (?, ?)", (nick, time.time()))
 
             return "%sstopwatch started!" % EMOTICON
 
         # stop/reset the clock. (see why we chopped off the .stop from earlier?)
         elif "stop" in message or "reset" in message:
-            if not self.stopwatches.has_key(nick):
+            if not stopwatch:
                 return "%syou don't have a running stopwatch." % EMOTICON
 
-            # pop the start time off the internal data structure.
-            start = self.stopwatches.pop(nick)
+            # clear the stopwatch.
+            start = stopwatch["start"]
 
-            # commit the data structure to memory.
-            self.bot.memory_remember("stopwatches", self.stopwatches)
+            self.bot.memory_query("DELETE FROM stopwatches WHERE nick=?", (nick,))
 
             return "%sstopped! time: %s" % (EMOTICON, format_stopwatch(self.elapsed_time(start)))
 
         # check time elapsed (also matches "naked" command: .stopwatch),
         elif not message or "time" in message or "elapsed" in message:
-            if not self.stopwatches.has_key(nick):
+            if not stopwatch:
                 return "%syou don't have a running stopwatch." % EMOTICON
 
-            return "%selapsed time: %s" % (EMOTICON, format_stopwatch(self.elapsed_time(self.stopwatches[nick])))
+            return "%selapsed time: %s" % (EMOTICON, format_stopwatch(self.elapsed_time(stopwatch["start"])))
 
         # invalid.
         else:
@@ -529,11 +559,9 @@ class handler:
         room_id    = self.bot.hipchat.room_jid2id(room)
         expiration = int(time.time() + minutes * 60)
 
-        self.timers[nick] = self.timers.get(nick, [])
-        self.timers[nick].append((room_id, expiration, message))
+        sql = "INSERT INTO timers (nick, room_id, expiration, message) VALUES (?, ?, ?, ?)"
 
-        # commit the data structure to memory.
-        self.bot.memory_remember("timers", self.timers)
+        self.bot.memory_query(sql, (nick, room_id, expiration, message))
 
         return "%stimer set to go off in %d minutes." % (EMOTICON, minutes)
 
@@ -548,43 +576,35 @@ class handler:
         timesheet    = ""
         this_room_id = self.bot.hipchat.room_jid2id(room)
 
-        # iterate through each users timers for this specific room.
-        for nick, timers in self.timers.iteritems():
+        # iterate through the timers for this specific room.
+        sql = "SELECT nick, expiration, message FROM timers WHERE room_id=? ORDER BY expiration"
 
-            # for each timer.
-            for timer in timers:
+        for nick, expiration, message in self.bot.memory_query(sql, (this_room_id,)).fetchall():
 
-                # break apart the tupple.
-                room_id, expiration, message = timer
+            # calculate time to expiration.
+            left = expiration - time.time()
+            mins = int(left / 60)
+            secs = left - (mins * 60)
 
-                # ignore timers outside this room.
-                if room_id != this_room_id:
-                    continue
+            # times up.
+            if not mins and not secs:
+                timesheet += "times up"
 
-                # calculate time to expiration.
-                left = expiration - time.time()
-                mins = int(left / 60)
-                secs = left - (mins * 60)
+            # less than a minute.
+            elif not mins:
+                timesheet += "in %d secs an alarm goes off" % secs
 
-                # times up.
-                if not mins and not secs:
-                    timesheet += "times up"
-
-                # less than a minute.
-                elif not mins:
-                    timesheet += "in %d secs an alarm goes off" % secs
-
-                # over a minute.
-                else:
-                    timesheet += "in %d mins %d secs an alarm goes off" % (mins, secs)
+            # over a minute.
+            else:
+                timesheet += "in %d mins %d secs an alarm goes off" % (mins, secs)
 
-                # splice in message...
-                if message:
-                    timesheet += " for %s regarding %s.\n" % (nick, message)
+            # splice in message...
+            if message:
+                timesheet += " for %s regarding %s.\n" % (nick, message)
 
-                # ...or, not.
-                else:
-                    timesheet += " for %s.\n" % nick
+            # ...or, not.
+            else:
+                timesheet += " for %s.\n" % nick
 
         if timesheet:
             return "-- TPS REPORT --\n" + timesheet
@@ -602,15 +622,17 @@ class handler:
         # get @mention name.
         atname = self.bot.hipchat.user_nick2at(nick)
 
+        # find the last timer set by this user.
+        sql   = "SELECT id, expiration, message FROM timers WHERE nick=? ORDER BY id DESC LIMIT 1"
+        timer = self.bot.memory_query(sql, (nick,)).fetchone()
+
         # user has no active timers.
-        if not self.timers.has_key(nick) or not self.timers[nick]:
+        if not timer:
             return "%s%s has no active timers." % (EMOTICON, atname)
 
-        # pop off the last timer appended for this user.
-        room_id, expiration, message = self.timers[nick].pop()
+        timer_id, expiration, message = timer
 
-        # commit the data structure to memory.
-        self.bot.memory_remember("timers", self.timers)
+        self.bot.memory_query("DELETE FROM timers WHERE id=?", (timer_id,))
 
         # determine how many minutes and seconds were left until this timer was set to expire.
         left = expiration - time.time()
@@ -626,34 +648,24 @@ class handler:
 
 
     ####################################################################################################################
-    def timer_filter (self, timer):
+    def timer_fire (self, timer):
         """
-        List filter function for timers.
+        Notify the room of an expired timer.
         """
 
-        # pull out the various parts.
-        room_id, expiration, message = timer
-
-        # check if time has expired.
-        if int(time.time()) > expiration:
-
-            # get @mention name.
-            atname = self.bot.hipchat.user_nick2at(self.current_nick)
-
-            if message:
-                message = "timer set by %s has expired: %s" % (atname, message)
-            else:
-                message = "timer set by %s has expired." % atname
-
-            # notify the room.
-            self.bot.hipchat.rooms_message(room_id, message, color="purple", notify=1)
+        # get @mention name.
+        atname = self.bot.hipchat.user_nick2at(timer["nick"])
 
-            # timer is no longer active.
-            return False
+        if timer["message"]:
+            message = "timer set by %s has expired: %s" % (atname, timer["message"])
+        else:
+            message = "timer set by %s has expired." % atname
 
-        # timer is still active.
-        return True
+        # notify the room.
+        self.bot.hipchat.rooms_message(timer["room_id"], message, color="purple", notify=1)
 
+        # timer is no longer active.
+        self.bot.memory_query("DELETE FROM timers WHERE id=?", (timer["id"],))
 
     ####################################################################################################################
     def timer_cron (self):
@@ -661,13 +673,8 @@ class handler:
         Check for expired timers during every cron loop.
         """
 
-        # filter through each users timers via timer_filter().
-        for nick, timers in self.timers.iteritems():
-            # set a member variable for time_filter() to reference.
-            self.current_nick = nick
-
-            # filter through timers.
-            self.timers[nick] = filter(self.timer_filter, timers)
+        # only the expired timers are visited, via the expiration index.
+        sql = "SELECT * FROM timers WHERE expiration <= ? ORDER BY expiration"
 
-        # commit the data structure to memory.
-        self.bot.memory_remember("timers", self.timers)
+        for timer in self.bot.memory_query(sql, (int(time.time()),)).fetchall():
+            self.timer_fire(timer)
@@ -1,7 +1,11 @@
 import re
-import requests
 import simplejson
 
+# twisted reactor core, for non-blocking lookups.
+import reactor_core
+
+from twisted.internet import defer
+
 ########################################################################################################################
 class handler:
     """
@@ -24,6 +28,7 @@ class handler:
 
 
     ####################################################################################################################
+    @reactor_core.asynchronous
     def _natural_weather (self, xmpp_message, room, nick, message):
         hit = re.search("weather[^\d]*(\d\d\d\d\d)", message, re.I)
 
@@ -37,6 +42,7 @@ class handler:
 
 
     ####################################################################################################################
+    @reactor_core.asynchronous
     def weather (self, xmpp_message, room, nick, zipcode):
         """
         Give the weather report for the specified zip code.
@@ -52,11 +58,11 @@ class handler:
             zipcode = self.bot.config.DEFAULT_WEATHER_ZIP
 
         try:
-            data = requests.get(URL + zipcode).content
+            data = yield reactor_core.http_get(URL + zipcode)
             data = simplejson.loads(data)
             data = data["query"]["results"]["channel"]
         except:
-            return "(facepalm) sorry. I encounted a JSON parsing error."
+            defer.returnValue("(facepalm) sorry. I encounted a JSON parsing error.")
 
         # not sure which of these fields are guaranteed to be present, so we'll be careful about gleaning them all.
         try:
@@ -102,6 +108,6 @@ class handler:
             report += forecast + "\n"
 
         if report:
-            return "The forecast for %s is...\n%s" % (zipcode, report)
+            defer.returnValue("The forecast for %s is...\n%s" % (zipcode, report))
         else:
-            return "The forecast for %s is... (stare)(stare)(stare) DOOM! (stare)(stare)(stare)" % zipcode
+            defer.returnValue("The forecast for %s is... (stare)(stare)(stare) DOOM! (stare)(stare)(stare)" % zipcode)
@@ -27,6 +27,7 @@ class api:
         self.params  = {"auth_token" : key}
         self.headers = {"Host" : self.host}
         self.data    = {}
+        self.metrics = None     # optional metrics.registry to record call latencies with.
 
 
     ####################################################################################################################
@@ -34,7 +35,7 @@ class api:
         headers.update(self.headers)
         params.update(self.params)
 
-        data = requests.get("https://%s/v%s/%s" % (self.host, self.version, routine), params=params, headers=headers)
+        data = self._timed("GET", routine, requests.get, "https://%s/v%s/%s" % (self.host, self.version, routine), params=params, headers=headers)
         json = simplejson.loads(data.content)
 
         return json
@@ -46,12 +47,24 @@ class api:
         params.update(self.params)
         data.update(self.data)
 
-        data = requests.post("https://%s/v%s/%s" % (self.host, self.version, routine), headers=headers, params=params, data=data)
+        data = self._timed("POST", routine, requests.post, "https://%s/v%s/%s" % (self.host, self.version, routine), headers=headers, params=params, data=data)
         json = simplejson.loads(data.content)
 
         return json
 
 
+    ####################################################################################################################
+    def _timed (self, method, routine, function, *args, **kwargs):
+        """
+        Make an HTTP request, recording its latency if a metrics registry is attached.
+        """
+
+        if not self.metrics:
+            return function(*args, **kwargs)
+
+        return self.metrics.timed("hipchat", method, routine, function, *args, **kwargs)
+
+
     ####################################################################################################################
     # straight forward wrappers.
     def rooms_history (self):     return self._get("rooms/history")["rooms"]
@@ -2,13 +2,13 @@
 
 # python modules.
 import os
-import re
 import sys
 import time
-import pickle
-import sqlite3
+import atexit
+import signal
 import logging
 import getpass
+import threading
 import traceback
 
 # external dependencies.
@@ -23,6 +23,42 @@ import helpers
 # import our HipChat API.
 import hipchat
 
+# trigger indexes.
+import triggers
+
+# handler worker pool.
+import workers
+
+# twisted reactor core, for non-blocking handlers.
+import reactor_core
+
+# call counts and latency histograms.
+import metrics
+
+# outbound message queue.
+import outbound
+
+# static handler manifest.
+import handlers
+
+# cached memory access.
+import memory
+
+# memory schema migrations.
+import migrations
+
+# memory serialization.
+import codec
+
+# bounded handler scratch state.
+import state
+
+# memory backups, vacuuming and statistics.
+import maintenance
+
+# slow memory query log.
+import slow_queries
+
 # Python versions before 3.0 do not use UTF-8 encoding by default. To ensure that Unicode is handled properly
 # throughout SleekXMPP, we will set the default encoding ourselves to UTF-8.
 if sys.version_info < (3, 0):
@@ -50,13 +86,64 @@ class jumpbot (sleekxmpp.ClientXMPP):
         self.config   = config                                              # internal reference to config options.
         self.help     = {}                                                  # handler documentation data structure.
         self.path     = os.path.dirname(os.path.abspath(__file__))          # absolute path to directory containing bot.
-        self.triggers = {"any":[], "command":[], "cron":[], "regex":[]}     # handler trigger mapping data structure.
+        self.triggers = {"any":[], "command":[], "cron":[], "regex":[], "shutdown":[]}  # handler trigger mapping.
         self.hipchat  = hipchat.api(config.HIPCHAT_API_KEY)                 # interface to HipChat API.
+        self.metrics  = metrics.registry()                                  # call counts and latency histograms.
         self.flags    = []                                                  # internal flag list for maintaining state.
+        self.commands = triggers.command_index()                            # command trigger lookup index.
+        self.regexes  = triggers.regex_index()                              # regex trigger lookup index.
+        self.handlers = {}                                                  # handler name -> loaded handler instance.
+        self.lazy     = {}                                                  # (category, trigger) -> handler to load.
+        self.topics   = {}                                                  # help topic -> handler that registers it.
+        self.owned    = {}                                                  # handler -> registered triggers.
+        self.ranks    = {}                                                  # handler -> order first registered in.
+        self.mtimes   = {}                                                  # handler -> source mtime when loaded.
+        self.loading  = []                                                  # stack of handlers being loaded.
+        self.startup  = []                                                  # (handler, import, init seconds).
+        self.lock     = threading.RLock()                                   # serializes handler loading.
+
+        # handlers are executed on the worker pool, or on the reactor thread if the asynchronous core is enabled. the
+        # reactor is always started as non-blocking handlers require it either way.
+        reactor_core.start(config.WORKER_THREADS)
+
+        if config.ASYNC_CORE:
+            self.workers = reactor_core.core(config.WORKER_THREADS)
+        else:
+            self.workers = workers.pool(config.WORKER_THREADS, config.WORKER_QUEUE_DEPTH, self._err)
+
+        # time HipChat API calls and expose the metrics for scraping.
+        self.hipchat.metrics = self.metrics
+
+        if config.METRICS_PORT:
+            try:
+                self.metrics.serve(config.METRICS_HOST, config.METRICS_PORT)
+            except Exception as e:
+                self._err("unable to serve metrics on %s:%d: %s" % (config.METRICS_HOST, config.METRICS_PORT, e))
 
-        # establish memory connectivity. sets: self.conn, self.memory.
+        # outbound messages are coalesced and rate limited per room and globally.
+        self.outbox = outbound.outbox(self._send, config.MAX_MESSAGE_LENGTH, config.SPEAK_ROOM_RATE,
+                                      config.SPEAK_ROOM_BURST, config.SPEAK_GLOBAL_RATE, config.SPEAK_GLOBAL_BURST,
+                                      config.SPEAK_QUEUE_DEPTH, self.metrics, self._err)
+
+        # establish memory connectivity. sets: self.memory, self.slow_queries, self.cerebellum, self.upkeep.
         self._memory_connect()
 
+        # bounded scratch state for handlers, picked up from the snapshot taken at the last shutdown.
+        self.state = state.store(config.STATE_MAX_KEYS, config.STATE_MAX_BYTES)
+
+        if config.STATE_SNAPSHOT_TTL:
+            try:
+                self.state.restore(self.memory_recall("snapshot", [], namespace="state"))
+            except Exception as e:
+                self._err("unable to restore the handler state snapshot: %s" % e)
+
+        self.metrics.register_gauge("state_keys",      "Handler state keys.",           lambda: len(self.state.values))
+        self.metrics.register_gauge("state_bytes",     "Estimated handler state size.", lambda: self.state.bytes)
+        self.metrics.register_gauge("state_evictions", "Handler state keys evicted.",   lambda: self.state.evictions)
+
+        # give handlers a chance to flush and don't lose cached memories on the way out.
+        atexit.register(self._process_shutdown)
+
         # handler loading occurs at the end of _xmpp_on_startup().
 
 
@@ -97,14 +184,85 @@ class jumpbot (sleekxmpp.ClientXMPP):
             self._err("%s" % message)
 
         if fatal:
+            # the hard exit below skips atexit, flush now.
+            self._process_shutdown()
+
             # we perform a hard exit here to kill all threads.
             os._exit(1)
 
 
+    ####################################################################################################################
+    def _import_handler (self, handler):
+        """
+        Import a handler and call its initialization routine, timing both. Triggers the handler declared in the
+        manifest have their lazy proxies swapped for the real callbacks as it registers them.
+
+        @type  handler: String
+        @param handler: Handler module name.
+
+        @rtype:  Handler instance
+        @return: Loaded handler.
+        """
+
+        with self.lock:
+            if handler in self.handlers:
+                return self.handlers[handler]
+
+            self._dbg("loading handler: %s" % handler)
+            self.loading.append(handler)
+
+            try:
+                start    = time.time()
+                module   = __import__("handlers.%s" % handler, fromlist=["handlers"])
+                imported = time.time()
+                instance = module.handler(self)
+                done     = time.time()
+            finally:
+                self.loading.pop()
+
+            self.handlers[handler] = instance
+            self.mtimes[handler]   = os.path.getmtime(os.path.join(self.path, "handlers", handler + ".py"))
+            self.startup.append((handler, imported - start, done - imported))
+            self.metrics.observe("startup", handler, "import", imported - start)
+            self.metrics.observe("startup", handler, "init",   done - imported)
+
+            # anything declared but not registered is left on its proxy, which resolves the method by name.
+            for (category, trigger), owner in self.lazy.items():
+                if owner == handler:
+                    self._err("handler %s didn't register manifest %s-trigger '%s'." % (handler, category, trigger))
+
+            return instance
+
+
+    ####################################################################################################################
+    def _lazy_callback (self, handler, method):
+        """
+        Create a proxy callback that loads a handler on first use and then calls through to its method.
+
+        @type  handler: String
+        @param handler: Handler module name.
+        @type  method:  String
+        @param method:  Handler method name.
+
+        @rtype:  Function
+        @return: Proxy callback.
+        """
+
+        def proxy (xmpp_message, room, nick, arguments):
+            callback = getattr(self._import_handler(handler), method)
+            return reactor_core.invoke(callback, xmpp_message, room, nick, arguments)
+
+        proxy.__name__ = method
+
+        return proxy
+
+
     ####################################################################################################################
     def _load_handlers (self):
         """
-        Dynamically load all available handlers in self.path/"handlers".
+        Load all available handlers in self.path/"handlers". Handlers declared in the manifest have their triggers and
+        help topics registered against lazy proxies and are imported on first use, eager and undeclared handlers are
+        imported now. Logs the time spent per handler and complains if config.STARTUP_BUDGET is exceeded.
         """
 
         # ensure this routine isn't run twice.
@@ -114,9 +272,11 @@ class jumpbot (sleekxmpp.ClientXMPP):
 
         # resolve path to handlers.
         path_handlers = self.path + os.sep + "handlers"
+        start         = time.time()
+        deferred      = []
 
         # for each file in the handlers path.
-        for handler in os.listdir(path_handlers):
+        for handler in sorted(os.listdir(path_handlers)):
 
             # look for files whose names end with ".py".
             if os.path.isfile(path_handlers + os.sep + handler) and handler.lower().endswith(".py"):
@@ -124,19 +284,39 @@ class jumpbot (sleekxmpp.ClientXMPP):
                 # chop off the ".py" extension.
                 handler = handler[:-3]
 
-                if handler.lower() != "__init__":
-                    self._dbg("loading handler: %s" % handler)
+                if handler.lower() == "__init__":
+                    continue
+
+                manifest = handlers.MANIFEST.get(handler)
+
+                try:
+                    if manifest and not manifest.get("eager"):
+                        self._register_manifest(handler, manifest)
+                        deferred.append(handler)
+                    else:
+                        if not manifest:
+                            self._dbg("handler %s isn't in the manifest, loading it now." % handler)
 
-                    try:
                         # dynamically import the handler and call its initialization routine.
-                        __import__("handlers.%s" % handler, fromlist=["handlers"]).handler(self)
+                        self._import_handler(handler)
 
-                    except Exception as e:
-                        self._exception_handler("unable to load handler: %s" % handler, e, fatal=True)
+                except Exception as e:
+                    self._exception_handler("unable to load handler: %s" % handler, e, fatal=True)
 
         # raise a flag to denote that handlers have been loaded.
         self.flags.append("HANDLERS_LOADED")
-        self._dbg("all handlers loaded.")
+
+        # startup report.
+        elapsed = time.time() - start
+
+        self._dbg("all handlers loaded in %.1fms, deferred until first use: %s" % (elapsed * 1000, ", ".join(deferred)))
+
+        for handler, imported, initialized in sorted(self.startup, key=lambda entry: -(entry[1] + entry[2])):
+            self._dbg("    %-20s import %.1fms, init %.1fms" % (handler, imported * 1000, initialized * 1000))
+
+        if elapsed > config.STARTUP_BUDGET:
+            self._err("handler loading took %.1fms, over the %.1fms budget." % \
+                (elapsed * 1000, config.STARTUP_BUDGET * 1000))
 
 
     ####################################################################################################################
@@ -145,68 +325,124 @@ class jumpbot (sleekxmpp.ClientXMPP):
         Initialize connection to memory.
         """
 
-        # sqlite3 REGEXP implementation.
-        # reference: http://stackoverflow.com/questions/5365451/problem-with-regexp-python-and-sqlite
-        def regexp (expression, item):
-            return re.compile(expression).search(item) is not None
-
-        # determine path to memory file and if officer pete is a new born (no prior memories).
-        memory_path = self.path + os.sep + "officer_pete.memory"
-        new_born    = True
-
-        if os.path.exists(memory_path):
-            new_born = False
+        # connection pool on the configured backend. the postgres driver is only needed, and imported, when in use.
+        if config.MEMORY_BACKEND == "postgres":
+            import postgres
 
-        # instantiate a new connection.
-        self.conn = sqlite3.connect(memory_path, check_same_thread=False)
+            self.memory = postgres.pool(config.MEMORY_DSN, config.MEMORY_POOL_SIZE, config.MEMORY_BUSY_TIMEOUT / 1000.0)
 
-        # bind REGEXP -> regexp().
-        self.conn.create_function("REGEXP", 2, regexp)
+        # REGEXP patterns are compiled once and cached across queries.
+        else:
+            memory_path = os.path.join(self.path, config.MEMORY_FILE)
+            self.memory = memory.pool(memory_path, config.MEMORY_BUSY_TIMEOUT, patterns_size=config.MEMORY_REGEXP_CACHE)
 
-        # this next line allows us to access rows by field name.
-        self.conn.row_factory = sqlite3.Row
+        # queries are accounted to their shapes and the slow ones logged, if enabled.
+        if config.MEMORY_SLOW_QUERY_THRESHOLD:
+            self.slow_queries = slow_queries.log(self.memory, config.MEMORY_SLOW_QUERY_THRESHOLD, self._err)
+        else:
+            self.slow_queries = None
 
-        # this next line switches the text objects returned from sqlite from unicode to str.
-        self.conn.text_factory = str
+        # officer pete is a new born if he has no prior memories.
+        new_born = not self.memory.columns("cerebellum")
 
-        # instantiate a cursor.
-        self.memory = self.conn.cursor()
+        # cached access to the cerebellum, memories are written behind.
+        encoder         = codec.codec(config.MEMORY_COMPRESS_THRESHOLD)
+        self.cerebellum = memory.cerebellum(self, config.MEMORY_FLUSH_INTERVAL, encoder, config.MEMORY_CACHE_SIZE)
+        self.sweeping   = 0                 # time of the next sweep of expired memories, from cron.
+        self.upkeep     = maintenance.maintenance(self)
 
         # initialize memory if officer pete is a new born and record his birthday.
         if new_born:
-            self.memory.execute("CREATE TABLE cerebellum (tag TEXT UNIQUE, memory TEXT)")
+            self.memory_query("CREATE TABLE cerebellum (tag TEXT UNIQUE, memory BLOB, expires INTEGER)")
             self.memory_remember("my birthday", time.time())
 
+        # bring the schema up to date.
+        migrations.migrate(self)
+
 
     ####################################################################################################################
     def _process_cron (self):
         """
         Called every config.CRON_INTERVAL seconds from the main thread. Executes each registered job in serial.
 
-        @note: Cron handlers should be mindful of serial processing and thread out if they intend on operating for long.
+        @note: Cron handlers should be mindful of serial processing and thread out if they intend on operating for long,
+               or be declared @reactor_core.asynchronous.
         """
 
         for callback in self.triggers["cron"]:
-            callback()
+            self.metrics.timed("cron", callback.__name__, "", reactor_core.invoke, callback)
+
+        # forget expired memories every config.MEMORY_SWEEP_INTERVAL seconds.
+        if time.time() >= self.sweeping:
+            self.sweeping = time.time() + config.MEMORY_SWEEP_INTERVAL
+
+            try:
+                self.metrics.timed("cron", "memory_sweep", "", self.cerebellum.sweep, config.MEMORY_SWEEP_BATCH)
+            except Exception as e:
+                self._err("failed sweeping expired memories: %s" % e)
+
+        # backups, statistics and vacuuming, run on a thread of their own when due.
+        try:
+            self.upkeep.run()
+        except Exception as e:
+            self._err("failed starting memory maintenance: %s" % e)
+
+        if config.RELOAD_HANDLERS:
+            self._reload_modified()
 
 
     ####################################################################################################################
-    def _xmpp_on_message (self, xmpp_message):
+    def _process_shutdown (self):
+        """
+        Called once on the way out. Executes each registered shutdown job, snapshots handler state, then flushes cached
+        memories.
+        """
+
+        if "SHUTDOWN" in self.flags:
+            return
+
+        self.flags.append("SHUTDOWN")
+
+        for callback in self.triggers["shutdown"]:
+            try:
+                callback()
+            except Exception as e:
+                self._err("shutdown handler-%s() failed: %s" % (callback.__name__, e))
+
+        if config.STATE_SNAPSHOT_TTL:
+            self.memory_remember("snapshot", self.state.snapshot(), config.STATE_SNAPSHOT_TTL, "state")
+
+        try:
+            self.cerebellum.flush()
+        except Exception as e:
+            self._err("failed flushing memory: %s" % e)
+
+
+    ####################################################################################################################
+    def _process_signal (self, signum, frame):
+        """
+        SIGTERM handler. Heroku stops dynos with SIGTERM, whose default action skips atexit, so shut down here and
+        perform a hard exit as the XMPP threads would otherwise keep the process alive.
+        """
+
+        self._dbg("received signal %d, shutting down." % signum)
+        self._process_shutdown()
+
+        os._exit(0)
+
+
+    ####################################################################################################################
+    def _dispatch_message (self, xmpp_message):
         """
-        Called for each message both sent and received by the bot. The logic for parsing messages and appropriately
-        multiplexing out to handlers happens here.
+        Called from the worker pool for each message both sent and received by the bot. The logic for parsing messages
+        and appropriately multiplexing out to handlers happens here.
         """
 
         room, nick, message = xmpp_message["mucroom"], xmpp_message["mucnick"], xmpp_message["body"]
 
         # process all handlers bound to "any".
         for callback in self.triggers["any"]:
-            try:
-                # process callback and speak results.
-                self.speak(xmpp_message, callback(xmpp_message, room, nick, message))
-
-            except Exception as e:
-                self._exception_handler("exception in handler-all-%s()." % callback.__name__, e, fatal=True)
+            self._invoke(xmpp_message, "any", callback, "", room, nick, message)
 
         # ensure the other handlers don't talk to themselves.
         if nick == config.NICKNAME:
@@ -219,69 +455,181 @@ class jumpbot (sleekxmpp.ClientXMPP):
         message_lower = message.lower()
 
         # the first handler to get triggered is called. "command" takes precedence over "regex".
+        hit = self.commands.lookup(message, message_lower)
+
+        if hit:
+            callback, trigger, arguments = hit
+            self._invoke(xmpp_message, "command", callback, trigger, room, nick, arguments)
+            return
+
+        hit = self.regexes.lookup(message, message_lower)
+
+        if hit:
+            # the entire message is the argument.
+            callback, trigger = hit
+            self._invoke(xmpp_message, "regex", callback, trigger, room, nick, message)
+
+
+    ####################################################################################################################
+    def _invoke (self, xmpp_message, category, callback, trigger, room, nick, arguments):
+        """
+        Process a handler callback, record its latency and speak the results. Handler exceptions are fatal.
+        Non-blocking handlers, and any handler when dispatching on the reactor thread, produce a Deferred whose result
+        is spoken once it fires.
+        """
+
+        start = time.time()
+
+        def fired (phrase_or_phrases):
+            self.metrics.observe(category, callback.__name__, trigger, time.time() - start)
+            self.speak(xmpp_message, phrase_or_phrases)
+
+        def failed (failure):
+            self.metrics.observe(category, callback.__name__, trigger, time.time() - start, error=True)
+            self._exception_handler("handler %s-%s().\n\n%s" % (category, callback.__name__, failure.getTraceback()),
+                                    fatal=True)
+
+        try:
+            result = reactor_core.invoke(callback, xmpp_message, room, nick, arguments)
+        except Exception as e:
+            self.metrics.observe(category, callback.__name__, trigger, time.time() - start, error=True)
+            self._exception_handler("handler %s-%s()." % (category, callback.__name__), e, fatal=True)
+
+        if isinstance(result, reactor_core.defer.Deferred):
+            result.addCallbacks(fired, failed)
+        else:
+            fired(result)
+
+
+    ####################################################################################################################
+    def _reload_modified (self):
+        """
+        Reload any loaded handler whose source has changed on disk since it was loaded.
+        """
+
+        for handler, mtime in self.mtimes.items():
+            try:
+                modified = os.path.getmtime(os.path.join(self.path, "handlers", handler + ".py"))
+            except OSError:
+                continue
+
+            if modified <= mtime:
+                continue
+
+            # don't retry a broken handler until it changes again.
+            self.mtimes[handler] = modified
+
+            try:
+                self.reload_handler(handler)
+                self._dbg("reloaded modified handler: %s" % handler)
+            except Exception as e:
+                self._err("failed reloading modified handler %s: %s" % (handler, e))
+
+
+    ####################################################################################################################
+    def _register_manifest (self, handler, manifest):
+        """
+        Register the triggers and help topics a handler declares in the manifest without importing it.
+
+        @type  handler:  String
+        @param handler:  Handler module name.
+        @type  manifest: Dictionary
+        @param manifest: Handler manifest entry.
+        """
+
         for category in ["command", "regex"]:
-            for callback, trigger in self.triggers[category]:
+            for trigger, method in manifest.get(category, []):
+                proxy = self._lazy_callback(handler, method)
+
+                self.register_trigger(proxy, category, trigger)
+                self.lazy[(category, trigger)] = handler
+                self.owned.setdefault(handler, []).append((category, proxy, trigger))
+                self.ranks.setdefault(handler, len(self.ranks))
+
+        for topic in manifest.get("help", []):
+            self.help[topic]   = None
+            self.topics[topic] = handler
+
 
-                trigger_lower = trigger.lower()     # lower case version of trigger.
-                trigger_match = False               # whether or not a trigger was matched.
-                arguments     = None                # trigger arguments, extracted below.
+    ####################################################################################################################
+    def _reorder_triggers (self):
+        """
+        Put the triggers back in the order their handlers first registered in, each handler's own in the order it
+        registered them, and rebuild the dispatch indexes to match. A reloaded handler re-registers its triggers at
+        the end, this keeps precedence from depending on reload history.
+        """
 
-                # command triggers are either prefixed with a dot...
-                if category == "command" and \
-                    (
-                        message_lower.startswith("." + trigger_lower + " ") or \
-                        message_lower.endswith  ("." + trigger_lower)       or \
-                        message_lower.startswith("/" + trigger_lower + " ") or \
-                        message_lower.endswith  ("/" + trigger_lower)
-                    ):
+        # (category, trigger, or callback for categories without triggers) -> (handler rank, position).
+        positions = {}
 
-                    # the arguments begin after the trigger, preserve the original case.
-                    arguments     = message[len(trigger) + 1:].strip()  # +1 for the dot or slash (./)
-                    trigger_match = True
+        for handler, registrations in self.owned.items():
+            for position, (category, callback, trigger) in enumerate(registrations):
+                key = trigger if category in ["command", "regex"] else callback
+                positions[(category, key)] = (self.ranks.get(handler, len(self.ranks)), position)
 
-                # ...or triggers prefixed with an @mention.
-                elif category == "command" and config.AT_NAME in message_lower:
+        # triggers registered outside of handler loading keep their place ahead of the handlers'.
+        for category, registered in self.triggers.items():
+            ranked = []
 
-                    # the trigger and arguments being after the @message.
-                    remainder = message[message_lower.index(config.AT_NAME) + len(config.AT_NAME):].strip().lstrip("./")
+            for i, x in enumerate(registered):
+                key = x[1] if category in ["command", "regex"] else x
+                ranked.append((positions.get((category, key), (-1, i)), x))
 
-                    # if the remainder starts with our trigger (no dot prefix required here).
-                    if remainder.lower().startswith(trigger_lower):
+            self.triggers[category] = [x for rank, x in sorted(ranked, key=lambda pair: pair[0])]
 
-                        # the arguments begin after the trigger, preserve the original case.
-                        arguments     = remainder[len(trigger):].strip()
-                        trigger_match = True
+        commands = triggers.command_index()
+        regexes  = triggers.regex_index()
 
-                # ...or triggers prefixed with a generic mention of @bot.
-                elif category == "command" and "@bot" in message_lower:
+        for callback, trigger in self.triggers["command"]:
+            commands.add(callback, trigger)
 
-                    # the trigger and arguments being after the @message.
-                    remainder = message[message_lower.index("@bot") + 4:].strip().lstrip("./")
+        for callback, trigger in self.triggers["regex"]:
+            regexes.add(callback, trigger)
 
-                    # if the remainder starts with our trigger (no dot prefix required here).
-                    if remainder.lower().startswith(trigger_lower):
+        self.commands = commands
+        self.regexes  = regexes
 
-                        # the arguments begin after the trigger, preserve the original case.
-                        arguments     = remainder[len(trigger):].strip()
-                        trigger_match = True
 
-                # look for regular expression match (not search, want to be more strict here).
-                elif category == "regex" and re.match(trigger, message):
+    ####################################################################################################################
+    def _restore_handler (self, handler, previous):
+        """
+        Put back what unregister_handler() removed.
+        """
 
-                    # the entire message is the argument.
-                    arguments     = message
-                    trigger_match = True
+        registrations, topics, lazy, instance, mtime = previous
 
-                # if a trigger was matched, launch the callback.
-                if trigger_match:
-                    try:
-                        # process callback, speak the results and return
-                        self.speak(xmpp_message, callback(xmpp_message, room, nick, arguments))
-                        return
+        for category, callback, trigger in registrations:
+            self.register_trigger(callback, category, trigger)
 
-                    except Exception as e:
-                        # fata exception.
-                        self._exception_handler("handler %s-%s()." % (category, callback.__name__), e, fatal=True)
+        self.owned[handler] = registrations
+
+        self.lazy.update(lazy)
+        self.help.update(topics)
+        self.topics.update(dict((topic, handler) for topic in topics))
+
+        if instance:
+            self.handlers[handler] = instance
+            self.mtimes[handler]   = mtime
+
+
+    ####################################################################################################################
+    def _send (self, mto, body):
+        """
+        Outbox delivery routine.
+        """
+
+        self.send_message(mto=mto, mtype="groupchat", mbody=body)
+
+
+    ####################################################################################################################
+    def _xmpp_on_message (self, xmpp_message):
+        """
+        Called for each message both sent and received by the bot. Handler execution is handed off to the worker pool
+        so that slow handlers don't block the XMPP event thread. Messages within a room are processed in order.
+        """
+
+        if not self.workers.submit(xmpp_message["mucroom"], self._dispatch_message, xmpp_message):
+            self._err("worker queue full, dropped message in %s." % xmpp_message["mucroom"])
 
 
     ####################################################################################################################
@@ -321,109 +669,175 @@ class jumpbot (sleekxmpp.ClientXMPP):
 
 
     ####################################################################################################################
-    def memory_forget (self, tag):
+    def help_describe (self, topic):
         """
-        Forget a memory.
+        Retrieve the description of a help topic, loading the handler that provides it if necessary.
+
+        @type  topic: String
+        @param topic: Topic title, as registered.
 
-        @type  tag:   String
-        @param tag:   Tag identifying this memory, tags are lower cased.
+        @rtype:  String
+        @return: Topic description or None if the topic is unknown.
         """
 
-        # normalize tag.
-        tag = tag.lower()
+        if self.help.get(topic) is None and topic in self.topics:
+            self._import_handler(self.topics[topic])
 
-        self.memory_query("DELETE FROM cerebellum WHERE tag=?", (tag,))
+        return self.help.get(topic)
 
 
     ####################################################################################################################
-    def memory_query (self, query, params=()):
+    def memory_forget (self, tag, namespace=None):
         """
-        Query memory.
+        Forget a memory.
+
+        @type  tag:       String
+        @param tag:       Tag identifying this memory, tags are lower cased.
+        @type  namespace: String
+        @param namespace: Optional namespace the tag lives in.
         """
 
-        query          = query.lstrip().rstrip()
-        succeeded      = False
-        attempts       = 0
-        MAX_ATTEMPTS   = 5
+        self.cerebellum.forget(memory.normalize(tag, namespace))
 
-        # try up to MAX_ATTEMPTS times to execute the SQL query.
-        while not succeeded and attempts < MAX_ATTEMPTS:
-            try:
-                self.memory.execute(query, params)
-                self.conn.commit()
-                succeeded = True
-            except sqlite3.Error, e:
-                message  = "sqlite3: %s\n\n" % e
-                message += "query:   %s\n"   % query
-                message += "params:  %s\n\n" % str(params)
 
-                self._err(message)
+    ####################################################################################################################
+    def memory_query (self, query, params=(), seconds=None, rows=None):
+        """
+        Query memory. SELECT queries are read from a connection private to the calling thread, anything else is
+        executed and committed on the shared writer connection. SELECT queries can be limited in time and in the number
+        of rows REGEXP examines, ie: for regex audits of the chat log. Limits hold while fetching from the cursor too,
+        where exceeding them raises sqlite3.OperationalError. Queries are written in SQLite's dialect, other memory
+        backends translate them, see postgres.py. Queries slower than config.MEMORY_SLOW_QUERY_THRESHOLD are logged
+        with their query plan, see slow_queries.py.
+
+        @type  query:   String
+        @param query:   Query.
+        @type  params:  Tuple
+        @param params:  Query parameters.
+        @type  seconds: Float
+        @param seconds: Optional time limit for SELECT queries.
+        @type  rows:    Integer
+        @param rows:    Optional limit on rows examined by REGEXP, for SELECT queries.
+
+        @rtype:  Cursor
+        @return: Cursor to fetch results from, rows are accessible by index and field name.
+        """
+
+        query = query.lstrip().rstrip()
+        verb  = query.split(None, 1)[0].upper()
+        start = time.time()
+
+        # reads go through the calling thread's own connection, writes through the shared writer. lock contention
+        # between threads is queued on the writer lock and between processes by the busy timeout, so no retry here.
+        try:
+            if verb in ["SELECT", "EXPLAIN"]:
+                cursor = self.memory.read(query, params, seconds, rows)
+            else:
+                cursor = self.memory.write(query, params)
+        except self.memory.Error, e:
+            message  = "%s: %s\n\n" % (self.memory.dialect, e)
+            message += "query:   %s\n"   % query
+            message += "params:  %s\n\n" % str(params)
+
+            self._err(message)
+
+            # record the failed query.
+            self.metrics.observe("memory", "memory_query", verb, time.time() - start, error=True)
+
+            raise Exception("%s failure: %s" % (self.memory.dialect, e))
 
-                attempts += 1
-                time.sleep(.5)
+        # record the query latency by verb, ie: SELECT, and by shape if the slow query log is enabled.
+        elapsed = time.time() - start
 
-        # if execute() failed, now is the time to whine about it.
-        if not succeeded:
-            raise Exception("sqlite failure count exceeded max of %d" % MAX_ATTEMPTS)
+        self.metrics.observe("memory", "memory_query", verb, elapsed)
+
+        if self.slow_queries:
+            self.slow_queries.observe(query, params, elapsed)
 
         # return database cursor.
-        return self.memory
+        return cursor
 
 
     ####################################################################################################################
-    def memory_recall (self, tag, dunno=None):
+    def memory_query_many (self, query, params_list):
+        """
+        Execute a statement once per set of parameters, in a single transaction on the writer connection.
+
+        @type  query:       String
+        @param query:       Statement.
+        @type  params_list: List
+        @param params_list: List of parameter tuples.
+        """
+
+        query = query.lstrip().rstrip()
+        verb  = query.split(None, 1)[0].upper()
+        start = time.time()
+
+        try:
+            with self.memory.transaction() as conn:
+                conn.executemany(query, params_list)
+        except self.memory.Error, e:
+            self._err("%s: %s\n\nquery:   %s\nrows:    %d\n\n" % (self.memory.dialect, e, query, len(params_list)))
+            self.metrics.observe("memory", "memory_query_many", verb, time.time() - start, error=True)
+
+            raise Exception("%s failure: %s" % (self.memory.dialect, e))
+
+        elapsed = time.time() - start
+
+        self.metrics.observe("memory", "memory_query_many", verb, elapsed)
+
+        if self.slow_queries and params_list:
+            self.slow_queries.observe(query, params_list[0], elapsed)
+
+
+    ####################################################################################################################
+    def memory_recall (self, tag, dunno=None, namespace=None):
         """
         Recall a memory.
 
-        @type  tag:   String
-        @param tag:   Tag identifying this memory, tags are lower cased.
-        @type  dunno: Mixed
-        @param dunno: What to return if no memory was found.
+        @type  tag:       String
+        @param tag:       Tag identifying this memory, tags are lower cased.
+        @type  dunno:     Mixed
+        @param dunno:     What to return if no memory was found, or if it expired.
+        @type  namespace: String
+        @param namespace: Optional namespace the tag lives in.
 
         @rtype:  Mixed
         @return: Memory
         """
 
-        tag     = tag.lower()
-        synapse = self.memory_query("SELECT memory FROM cerebellum WHERE tag=?", (tag,)).fetchone()
-
-        if not synapse:
-            return dunno
-        else:
-            return pickle.loads(synapse["memory"])
+        return self.cerebellum.recall(memory.normalize(tag, namespace), dunno)
 
 
     ####################################################################################################################
-    def memory_remember (self, tag, memory):
+    def memory_remember (self, tag, thought, ttl=None, namespace=None):
         """
-        Remember something.
-
-        @type  tag:    String
-        @param tag:    Tag identifying this memory, tags are lower cased.
-        @type  memory: Mixed
-        @param memory: Whatever we want to remember.
+        Remember something. Handlers keeping many small memories, ie: per room or per user, should put them under a
+        namespace of their own and give them a ttl, so that they're swept away once no longer needed.
+
+        @type  tag:       String
+        @param tag:       Tag identifying this memory, tags are lower cased.
+        @type  thought:   Mixed
+        @param thought:   Whatever we want to remember.
+        @type  ttl:       Integer
+        @param ttl:       Optional seconds after which the memory is forgotten, remembering it again restarts the clock.
+        @type  namespace: String
+        @param namespace: Optional namespace to keep the tag in, ie: the handler name.
 
         @rtype:  Boolean
         @return: True if remembered, False otherwise.
         """
 
-        # normalize tag.
-        tag = tag.lower()
+        tag     = memory.normalize(tag, namespace)
+        expires = int(time.time() + ttl) if ttl else None
 
-        # use pickle to handle complex types.
+        # memories are encoded by the codec, see codec.py. the memory is written behind, see memory.cerebellum.
         try:
-            memory = pickle.dumps(memory)
+            self.cerebellum.remember(tag, thought, expires)
         except:
-            self._err("unable to marshal: %s" % memory)
+            self._err("unable to marshal: %s" % thought)
             return False
 
-        # if this memory already exists, forget it.
-        if self.memory_recall(tag, "beats me") != "beats me":
-            self.memory_forget(tag)
-
-        # create the memory.
-        self.memory_query("INSERT INTO cerebellum (tag, memory) VALUES (?, ?)", (tag, memory))
-
         # memory successfully formed.
         return True
 
@@ -445,19 +859,23 @@ class jumpbot (sleekxmpp.ClientXMPP):
         # replace single new lines with a space, and replace double new lines with a single new line.
         self.help[topic] = "".join([line + " " if line else "\n" for line in description.split("\n")])
 
+        # keep track of who provides the topic, so it can be dropped when the handler is reloaded.
+        if self.loading:
+            self.topics[topic] = self.loading[-1]
+
 
     ####################################################################################################################
     def register_trigger (self, callback, category, trigger=None):
         """
         Map a trigger to a specific handler method. Triggers can be bound to: any message (any), period (cron), messages
-        which begin with a dot or are @mentioned to the bot (command), or messages that match a specified regular
-        expression (regex). Command triggers are case insensitive. For case insensitive regular expression triggers,
-        start the trigger pattern with "(?i).
+        which begin with a dot or are @mentioned to the bot (command), messages that match a specified regular
+        expression (regex) or the bot exiting (shutdown). Command triggers are case insensitive. For case insensitive
+        regular expression triggers, start the trigger pattern with "(?i).
 
         @type  callback: Handler Method
         @param callback: Handler method to call when trigger fires.
         @type  category: String
-        @param category: One of "any", "command", "cron", or "regex".
+        @param category: One of "any", "command", "cron", "regex" or "shutdown".
         @type  trigger:  String
         @param trigger:  Trigger string
 
@@ -467,8 +885,34 @@ class jumpbot (sleekxmpp.ClientXMPP):
         # normalize category and sanity check.
         category = category.lower()
 
-        # categories "any" and "cron" don't have triggers.
-        if category in ["any", "cron"]:
+        # a lazily loaded handler registering a trigger declared in its manifest, swap out the proxy.
+        if self.loading and self.lazy.get((category, trigger)) == self.loading[-1]:
+            self._dbg("    resolving %s-trigger '%s' -> handler-%s()" % (category, trigger, callback.__name__))
+
+            self.triggers[category] = [(callback, x_trigger) if x_trigger == trigger else (x_callback, x_trigger)
+                                       for x_callback, x_trigger in self.triggers[category]]
+
+            if category == "command":
+                self.commands.replace(callback, trigger)
+            else:
+                self.regexes.replace(callback, trigger)
+
+            owned = self.owned[self.loading[-1]]
+
+            for i, (x_category, x_callback, x_trigger) in enumerate(owned):
+                if (x_category, x_trigger) == (category, trigger):
+                    owned[i] = (category, callback, trigger)
+
+            del self.lazy[(category, trigger)]
+            return
+
+        # keep track of which handler registered the trigger, so it can be unregistered when the handler is reloaded.
+        if self.loading:
+            self.owned.setdefault(self.loading[-1], []).append((category, callback, trigger))
+            self.ranks.setdefault(self.loading[-1], len(self.ranks))
+
+        # categories "any", "cron" and "shutdown" don't have triggers.
+        if category in ["any", "cron", "shutdown"]:
 
             # append the callback and we're done.
             self._dbg("    registering %s-trigger -> handler-%s()" % (category, callback.__name__))
@@ -491,11 +935,60 @@ class jumpbot (sleekxmpp.ClientXMPP):
             self._dbg("    registering %s-trigger '%s' -> hander-%s()" % (category, trigger, callback.__name__))
             self.triggers[category].append((callback, trigger))
 
+            # triggers are additionally indexed for dispatch.
+            if category == "command":
+                self.commands.add(callback, trigger)
+            else:
+                self.regexes.add(callback, trigger)
+
         # invalid category.
         else:
             raise Exception("register_trigger() called with invalid category: %s" % category)
 
 
+    ####################################################################################################################
+    def reload_handler (self, handler):
+        """
+        Reload a handler from disk without dropping the XMPP session. The handler's triggers and help topics are
+        unregistered, the module and manifest are re-imported and the handler is initialized again. State a handler
+        keeps through the memory API carries over, anything else is reset. If the new code fails to initialize, the
+        previous instance is put back in place.
+
+        @type  handler: String
+        @param handler: Handler module name.
+
+        @rtype:  Float
+        @return: Seconds the reload took.
+
+        @raise: Exception if the handler doesn't exist or fails to load.
+        """
+
+        if handler == "__init__" or not os.path.isfile(os.path.join(self.path, "handlers", handler + ".py")):
+            raise Exception("no such handler: %s" % handler)
+
+        with self.lock:
+            start = time.time()
+
+            # pick up manifest changes and compile the new code before anything is torn down.
+            reload(handlers)
+
+            if "handlers." + handler in sys.modules:
+                reload(sys.modules["handlers." + handler])
+
+            previous = self.unregister_handler(handler)
+
+            try:
+                self._import_handler(handler)
+            except:
+                self.unregister_handler(handler)
+                self._restore_handler(handler, previous)
+                raise
+            finally:
+                self._reorder_triggers()
+
+            return time.time() - start
+
+
     ####################################################################################################################
     def speak (self, xmpp_message, phrase_or_phrases):
         """
@@ -517,10 +1010,58 @@ class jumpbot (sleekxmpp.ClientXMPP):
         # extract and decode room.
         room = self.hipchat.room_decode(xmpp_message["mucroom"])
 
-        # speak each phrase.
         for phrase in phrase_or_phrases:
             self._dbg("[%s] %s: %s..." % (room, self.config.NICKNAME, phrase.split("\n")[0][:140]))
-            self.send_message(mto=xmpp_message["from"].bare, mtype="groupchat", mbody=phrase)
+
+        # queue the phrases, they're merged and sent as the rate limits allow.
+        self.outbox.put(xmpp_message["from"].bare, phrase_or_phrases)
+
+
+    ####################################################################################################################
+    def unregister_handler (self, handler):
+        """
+        Remove every trigger and help topic registered by, or on behalf of, a handler and forget the loaded instance.
+
+        @type  handler: String
+        @param handler: Handler module name.
+
+        @rtype:  Tuple
+        @return: (registrations, help topics, lazy triggers, instance, mtime) as they were, see _restore_handler().
+        """
+
+        with self.lock:
+            registrations = self.owned.pop(handler, [])
+            lazy          = dict((key, owner) for key, owner in self.lazy.items() if owner == handler)
+            topics        = dict((topic, self.help.pop(topic, None)) for topic, owner in self.topics.items()
+                                 if owner == handler)
+
+            for category, callback, trigger in registrations:
+                # let the outgoing handler flush whatever it has pending.
+                if category == "shutdown":
+                    try:
+                        callback()
+                    except Exception as e:
+                        self._err("shutdown handler-%s() failed: %s" % (callback.__name__, e))
+
+                if category in ["any", "cron", "shutdown"]:
+                    self.triggers[category] = [x for x in self.triggers[category] if x != callback]
+                    continue
+
+                self.triggers[category] = [(x_callback, x_trigger) for x_callback, x_trigger in self.triggers[category]
+                                           if x_trigger != trigger]
+
+                if category == "command":
+                    self.commands.remove(trigger)
+                else:
+                    self.regexes.remove(trigger)
+
+            for key in lazy:
+                del self.lazy[key]
+
+            for topic in topics:
+                del self.topics[topic]
+
+            return registrations, topics, lazy, self.handlers.pop(handler, None), self.mtimes.pop(handler, None)
 
 
 ########################################################################################################################
@@ -535,6 +1076,9 @@ if __name__ == "__main__":
     # instatiate bot. the "/bot" suffix ensures no message history is delivered to the bot.
     officer_pete = jumpbot(config.USERNAME + "@chat.hipchat.com/bot", config.PASSWORD)
 
+    # flush memories, the chat log and handler state when stopped, ie: on deploys.
+    signal.signal(signal.SIGTERM, officer_pete._process_signal)
+
     # service discovery.
     officer_pete.register_plugin("xep_0030")
 
@@ -0,0 +1,238 @@
+"""
+Jumpshot HipChat Bot Memory Maintenance
+
+Upkeep of the memory file, driven from cron. Consistent backups are copied on an interval and the oldest ones pruned,
+query planner statistics are refreshed with ANALYZE on an interval, and during quiet hours free pages are returned to
+the file system with PRAGMA incremental_vacuum, a few at a time. Tasks run on a thread of their own, one run at a time,
+and each is logged with how long it took and how much space it reclaimed.
+
+Backups and vacuuming are for the SQLite memory backend, PostgreSQL is backed up and vacuumed on its own side.
+"""
+
+# python modules.
+import os
+import re
+import time
+import threading
+
+# backup file name, by time taken.
+FILE_NAME = "memory-%s.memory"
+
+# cerebellum namespace the times backups and ANALYZE were last attempted are remembered in, so they survive restarts.
+NAMESPACE = "maintenance"
+
+
+########################################################################################################################
+class maintenance:
+    """
+    Scheduler of memory maintenance tasks.
+    """
+
+    ####################################################################################################################
+    def __init__ (self, bot):
+        """
+        @type  bot: jumpbot
+        @param bot: Bot whose memory to maintain, with its config, metrics and logging.
+        """
+
+        self.bot       = bot
+        self.config    = bot.config
+        self.running   = False          # a run is in progress.
+        self.lock      = threading.Lock()
+        self.reclaimed = 0              # bytes returned to the file system since startup.
+
+        bot.metrics.register_gauge("memory_reclaimed_bytes", "Bytes vacuumed out of the memory file since startup.",
+                                   lambda: self.reclaimed)
+
+
+    ####################################################################################################################
+    def _due (self, task, interval):
+        """
+        A due task is marked as run right away, before it's attempted, so that one which keeps failing waits out its
+        interval before the next try rather than failing again on every cron pass.
+
+        @rtype:  Boolean
+        @return: True if the task last ran at least interval seconds ago, never if the interval is 0.
+        """
+
+        if not interval:
+            return False
+
+        now = time.time()
+
+        if now - self.bot.memory_recall(task, 0, namespace=NAMESPACE) < interval:
+            return False
+
+        self.bot.memory_remember(task, now, namespace=NAMESPACE)
+
+        return True
+
+
+    ####################################################################################################################
+    def _run (self, tasks):
+        """
+        Maintenance thread, run the given tasks in order and report on each.
+        """
+
+        try:
+            for name, task in tasks:
+                start = time.time()
+
+                try:
+                    report = task()
+                except Exception as e:
+                    self.bot.metrics.observe("maintenance", name, "", time.time() - start, error=True)
+                    self.bot._err("memory maintenance, %s failed: %s" % (name, e))
+                    continue
+
+                self.bot.metrics.observe("maintenance", name, "", time.time() - start)
+                self.bot._dbg("memory maintenance, %s took %.2fs: %s" % (name, time.time() - start, report))
+        finally:
+            with self.lock:
+                self.running = False
+
+
+    ####################################################################################################################
+    def analyze (self):
+        """
+        Refresh the query planner statistics. On SQLite the rows sampled per index are capped, keeping the writer lock
+        short on a large chat log.
+
+        @rtype:  String
+        @return: Report.
+        """
+
+        if self.bot.memory.dialect == "sqlite":
+            self.bot.memory_query("PRAGMA analysis_limit=%d" % self.config.MAINTENANCE_ANALYZE_LIMIT)
+
+        self.bot.memory_query("ANALYZE")
+
+        return "statistics refreshed."
+
+
+    ####################################################################################################################
+    def backup (self):
+        """
+        Copy a consistent snapshot of the memory file into the backup directory and prune the oldest backups beyond
+        config.MAINTENANCE_BACKUPS.
+
+        @rtype:  String
+        @return: Report.
+        """
+
+        directory = os.path.join(self.bot.path, self.config.MAINTENANCE_BACKUP_DIR)
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        path = os.path.join(directory, FILE_NAME % time.strftime("%Y%m%d-%H%M%S"))
+
+        if os.path.exists(path + ".tmp"):
+            os.remove(path + ".tmp")
+
+        # memories waiting to be written behind go in too. the copy is taken under a temporary name, so that a partial
+        # copy is never mistaken for a backup.
+        self.bot.cerebellum.flush()
+        self.bot.memory.backup(path + ".tmp")
+        os.rename(path + ".tmp", path)
+
+        backups = sorted(name for name in os.listdir(directory) if re.match("^memory-\d{8}-\d{6}\.memory$", name))
+        pruned  = backups[:-self.config.MAINTENANCE_BACKUPS] if self.config.MAINTENANCE_BACKUPS else []
+
+        for name in pruned:
+            os.remove(os.path.join(directory, name))
+
+        return "%.1fMB to %s, %d old backups pruned." % (os.path.getsize(path) / 1048576.0, path, len(pruned))
+
+
+    ####################################################################################################################
+    def quiet (self):
+        """
+        @rtype:  Boolean
+        @return: True if it's quiet hours, between config.MAINTENANCE_QUIET_START and MAINTENANCE_QUIET_END local time.
+        """
+
+        start = self.config.MAINTENANCE_QUIET_START
+        end   = self.config.MAINTENANCE_QUIET_END
+        hour  = time.localtime().tm_hour
+
+        # quiet hours may wrap around midnight, ie: 22 to 4.
+        if start <= end:
+            return start <= hour < end
+
+        return hour >= start or hour < end
+
+
+    ####################################################################################################################
+    def run (self):
+        """
+        Called from cron. Starts a maintenance run with whatever tasks are due, unless one is still in progress.
+
+        @rtype:  Boolean
+        @return: True if a run was started.
+        """
+
+        sqlite = self.bot.memory.dialect == "sqlite"
+        tasks  = []
+
+        with self.lock:
+            if self.running:
+                return False
+
+            if sqlite and self._due("backup", self.config.MAINTENANCE_BACKUP_INTERVAL):
+                tasks.append(("backup", self.backup))
+
+            if self._due("analyze", self.config.MAINTENANCE_ANALYZE_INTERVAL):
+                tasks.append(("analyze", self.analyze))
+
+            if sqlite and self.config.MAINTENANCE_VACUUM_PAGES and self.quiet() and self.space()[1]:
+                tasks.append(("vacuum", self.vacuum))
+
+            if not tasks:
+                return False
+
+            self.running = True
+
+        thread = threading.Thread(target=self._run, args=(tasks,), name="maintenance")
+        thread.daemon = True
+        thread.start()
+
+        return True
+
+
+    ####################################################################################################################
+    def space (self):
+        """
+        @rtype:  Tuple
+        @return: (size of the memory file, bytes of it on the free list).
+        """
+
+        # plain pragmas rather than their table valued functions, which need SQLite 3.16.
+        pages = self.bot.memory_query("PRAGMA page_count").fetchone()[0]
+        size  = self.bot.memory_query("PRAGMA page_size").fetchone()[0]
+        free  = self.bot.memory_query("PRAGMA freelist_count").fetchone()[0]
+
+        return pages * size, free * size
+
+
+    ####################################################################################################################
+    def vacuum (self):
+        """
+        Return up to config.MAINTENANCE_VACUUM_PAGES free pages to the file system. Every step of the pragma frees one
+        page, so it's stepped through to the end within the transaction.
+
+        @rtype:  String
+        @return: Report.
+        """
+
+        before = self.space()
+
+        with self.bot.memory.transaction() as conn:
+            conn.execute("PRAGMA incremental_vacuum(%d)" % self.config.MAINTENANCE_VACUUM_PAGES).fetchall()
+
+        after           = self.space()
+        reclaimed       = before[0] - after[0]
+        self.reclaimed += reclaimed
+
+        return "%.1fKB reclaimed, %.1fKB free left in a %.1fMB file." % \
+               (reclaimed / 1024.0, after[1] / 1024.0, after[0] / 1048576.0)
@@ -0,0 +1,704 @@
+"""
+Jumpshot HipChat Bot Memory
+
+SQLite connection pool and a write-behind cache in front of the cerebellum table. Recalled memories are cached in
+process, remembered and forgotten memories are marked dirty and flushed together in a single transaction on an
+interval and at shutdown. Memories can be remembered under a namespace, ie: one per handler, and with an expiration
+after which they're forgotten, expired rows are swept out of the table in batches.
+
+The pool is one of the memory backends, postgres.py has the other. A backend provides read(), write(), transaction(),
+columns(), plan() and version(), along with its SQL dialect, the exception class its errors derive from, a wrapper for
+binary values and the SQL functions it registers.
+"""
+
+# python modules.
+import re
+import time
+import shutil
+import sqlite3
+import threading
+import contextlib
+import collections
+
+# cache entry for a memory known not to exist.
+FORGOTTEN = None
+
+# separates a namespace from the tags in it.
+NAMESPACE_SEPARATOR = ":"
+
+# characters that make an expression more than a plain substring.
+METACHARACTERS = set(".^$*+?{}[]\\|()")
+
+# SQLite virtual machine instructions between checks of a query's limits.
+PROGRESS_INTERVAL = 1000
+
+# pages copied per step of an online backup.
+BACKUP_PAGES = 256
+
+# first SQLite version with VACUUM INTO.
+VACUUM_INTO_VERSION = (3, 27, 0)
+
+
+########################################################################################################################
+def normalize (tag, namespace=None):
+    """
+    @type  tag:       String
+    @param tag:       Tag identifying a memory.
+    @type  namespace: String
+    @param namespace: Optional namespace the tag lives in.
+
+    @rtype:  String
+    @return: Normalized tag, lower cased and prefixed with its namespace.
+    """
+
+    if namespace:
+        return (namespace + NAMESPACE_SEPARATOR + tag).lower()
+
+    return tag.lower()
+
+
+########################################################################################################################
+class patterns:
+    """
+    Bounded least recently used cache of compiled REGEXP patterns. SQLite calls REGEXP once per row, without the cache
+    the same expression would be compiled for every row scanned. Expressions free of regex metacharacters are matched as
+    plain substrings, skipping the regex engine altogether.
+    """
+
+    ####################################################################################################################
+    def __init__ (self, size):
+        """
+        @type  size: Integer
+        @param size: Maximum number of compiled patterns to keep around.
+        """
+
+        self.size     = max(size, 1)
+        self.lock     = threading.Lock()
+        self.matchers = collections.OrderedDict()       # (expression, case insensitive) -> matcher.
+        self.hits     = 0
+        self.misses   = 0
+
+
+    ####################################################################################################################
+    def matcher (self, expression, insensitive=False):
+        """
+        @type  expression:  String
+        @param expression:  Regular expression.
+        @type  insensitive: Boolean
+        @param insensitive: Match regardless of case.
+
+        @rtype:  Function
+        @return: Routine taking a string and returning whether or not the expression matches it.
+
+        @raise: re.error if the expression doesn't compile.
+        """
+
+        key = (expression, insensitive)
+
+        with self.lock:
+            matcher = self.matchers.pop(key, None)
+
+            if matcher:
+                self.hits += 1
+                self.matchers[key] = matcher
+                return matcher
+
+            self.misses += 1
+
+        # plain substrings, case folded if need be.
+        if not METACHARACTERS.intersection(expression):
+            if insensitive:
+                literal = expression.lower()
+                matcher = lambda item: literal in item.lower()
+            else:
+                matcher = lambda item: expression in item
+        else:
+            search  = re.compile(expression, re.IGNORECASE if insensitive else 0).search
+            matcher = lambda item: search(item) is not None
+
+        with self.lock:
+            self.matchers[key] = matcher
+
+            while len(self.matchers) > self.size:
+                self.matchers.popitem(last=False)
+
+        return matcher
+
+
+########################################################################################################################
+class thread_state (threading.local):
+    """
+    Per thread reader connection, query limits and the REGEXP matcher last used.
+    """
+
+    conn     = None
+    deadline = None             # time after which the running query is interrupted.
+    rows     = None             # rows REGEXP may still examine before the running query is interrupted.
+    key      = None             # (expression, case insensitive) of the last REGEXP evaluated.
+    matcher  = None
+
+
+########################################################################################################################
+class pool:
+    """
+    SQLite connections to the memory file. The database runs in WAL mode so that readers and the writer don't block
+    each other. Each thread reads through a query only connection of its own, while writes are funneled through a
+    single writer connection under a lock, SQLite only allows one writer at a time anyway.
+
+    Every connection gets REGEXP and a case insensitive IREGEXP, backed by a cache of compiled patterns. Reads can be
+    limited in time and in the number of rows REGEXP examines, so that an expensive scan can't hang the bot.
+    """
+
+    ####################################################################################################################
+    def __init__ (self, path, busy_timeout, functions={}, patterns_size=256):
+        """
+        @type  path:          String
+        @param path:          Path to the memory file.
+        @type  busy_timeout:  Integer
+        @param busy_timeout:  Milliseconds to wait on a lock held by another process before giving up.
+        @type  functions:     Dictionary
+        @param functions:     SQL function name -> (number of arguments, implementation) to register on connections.
+        @type  patterns_size: Integer
+        @param patterns_size: Maximum number of compiled REGEXP patterns to cache.
+        """
+
+        self.path         = path
+        self.busy_timeout = busy_timeout
+        self.dialect      = "sqlite"
+        self.Error        = sqlite3.Error
+        self.binary       = sqlite3.Binary
+        self.patterns     = patterns(patterns_size)
+        self.functions    = dict(functions, REGEXP=(2, self._regexp), IREGEXP=(2, self._iregexp))
+        self.local        = thread_state()
+        self.lock         = threading.RLock()       # serializes writes.
+        self.writer       = self._connect()
+
+        self.writer.execute("PRAGMA journal_mode=WAL")
+
+
+    ####################################################################################################################
+    def _connect (self, query_only=False):
+        """
+        Open a connection to the memory file.
+
+        @type  query_only: Boolean
+        @param query_only: Refuse writes on this connection.
+
+        @rtype:  sqlite3.Connection
+        @return: Connection.
+        """
+
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout / 1000.0, check_same_thread=False)
+
+        conn.execute("PRAGMA busy_timeout=%d" % self.busy_timeout)
+        conn.execute("PRAGMA synchronous=NORMAL")
+
+        if query_only:
+            conn.execute("PRAGMA query_only=1")
+            conn.set_progress_handler(self._progress, PROGRESS_INTERVAL)
+
+        for name, (arguments, function) in self.functions.items():
+            conn.create_function(name, arguments, function)
+
+        # access rows by field name and get str rather than unicode back.
+        conn.row_factory  = sqlite3.Row
+        conn.text_factory = str
+
+        return conn
+
+
+    ####################################################################################################################
+    def _copy (self, path):
+        """
+        Copy the memory file while holding the writer, for SQLite without VACUUM INTO. Committed changes still in the
+        write ahead log are checkpointed into the file first, BEGIN IMMEDIATE then keeps other processes from writing
+        until the copy is done. The checkpoint goes first as the sqlite3 module commits an open transaction before a
+        PRAGMA.
+
+        @type  path: String
+        @param path: Path to copy to.
+
+        @raise sqlite3.OperationalError: If readers kept the log from being checkpointed in full.
+        """
+
+        with self.lock:
+            busy, logged, checkpointed = self.writer.execute("PRAGMA wal_checkpoint(FULL)").fetchone()
+
+            if busy or logged != checkpointed:
+                raise sqlite3.OperationalError("checkpointed %d of %d log frames, readers kept it busy." % \
+                                               (checkpointed, logged))
+
+            self.writer.execute("BEGIN IMMEDIATE")
+
+            try:
+                shutil.copyfile(self.path, path)
+            finally:
+                self.writer.commit()
+
+
+    ####################################################################################################################
+    def _iregexp (self, expression, item):
+        """
+        Case insensitive REGEXP, ie: WHERE IREGEXP(?, message).
+        """
+
+        return self._match(expression, item, True)
+
+
+    ####################################################################################################################
+    def _match (self, expression, item, insensitive=False):
+        """
+        Match a REGEXP expression against a column value, counting the row against the calling thread's row limit.
+        SQLite evaluates the same expression for row after row, so the last matcher is kept at hand per thread and the
+        pattern cache is only consulted when the expression changes.
+        """
+
+        local = self.local
+
+        if local.rows is not None:
+            local.rows -= 1
+
+        if item is None:
+            return False
+
+        if local.key != (expression, insensitive):
+            local.matcher = self.patterns.matcher(expression, insensitive)
+            local.key     = (expression, insensitive)
+
+        return local.matcher(item)
+
+
+    ####################################################################################################################
+    def _progress (self):
+        """
+        SQLite progress handler on reader connections, a true return value interrupts the running query.
+        """
+
+        local = self.local
+
+        if local.rows is not None and local.rows < 0:
+            return True
+
+        return local.deadline is not None and time.time() > local.deadline
+
+
+    ####################################################################################################################
+    def _regexp (self, expression, item):
+        """
+        SQLite REGEXP implementation, "X REGEXP Y" calls REGEXP(Y, X).
+        reference: http://stackoverflow.com/questions/5365451/problem-with-regexp-python-and-sqlite
+        """
+
+        return self._match(expression, item)
+
+
+    ####################################################################################################################
+    def backup (self, path, pages=BACKUP_PAGES):
+        """
+        Copy a consistent snapshot of the memory file, on a connection of its own so that the writer lock isn't held.
+        The online backup API copies a few pages at a time where the sqlite3 module has it (Python 3.7+), VACUUM INTO
+        copies from a single read transaction otherwise, which WAL mode lets writers carry on past. SQLite older than
+        3.27 has neither, the write ahead log is checkpointed into the file and the file copied with writers held off.
+
+        @type  path:  String
+        @param path:  Path to copy to, the file mustn't exist.
+        @type  pages: Integer
+        @param pages: Pages copied per step by the online backup API.
+        """
+
+        conn = self._connect()
+
+        try:
+            if hasattr(conn, "backup"):
+                target = sqlite3.connect(path)
+
+                try:
+                    conn.backup(target, pages=pages)
+                finally:
+                    target.close()
+            elif sqlite3.sqlite_version_info >= VACUUM_INTO_VERSION:
+                conn.execute("VACUUM INTO ?", (path,))
+            else:
+                self._copy(path)
+        finally:
+            conn.close()
+
+
+    ####################################################################################################################
+    def columns (self, table):
+        """
+        @type  table: String
+        @param table: Table name.
+
+        @rtype:  List
+        @return: Column names of the table, empty if the table doesn't exist.
+        """
+
+        return [row["name"] for row in self.read("PRAGMA table_info(%s)" % table).fetchall()]
+
+
+    ####################################################################################################################
+    def plan (self, query, params=()):
+        """
+        Explain how SQLite would execute a statement, without executing it. The calling thread's reader is used
+        directly, leaving the limits of a query still being fetched from in place.
+
+        @rtype:  List
+        @return: Query plan steps, indented by depth.
+        """
+
+        depths = {0 : -1}
+        steps  = []
+
+        for id, parent, unused, detail in self.reader().execute("EXPLAIN QUERY PLAN " + query, params).fetchall():
+            depths[id] = depths.get(parent, -1) + 1
+
+            steps.append("  " * depths[id] + detail)
+
+        return steps
+
+
+    ####################################################################################################################
+    def reader (self):
+        """
+        @rtype:  sqlite3.Connection
+        @return: Read only connection for the calling thread.
+        """
+
+        if self.local.conn is None:
+            self.local.conn = self._connect(query_only=True)
+
+        return self.local.conn
+
+
+    ####################################################################################################################
+    def read (self, query, params=(), seconds=None, rows=None):
+        """
+        Execute a query on the calling thread's reader connection. Limits hold while the returned cursor is fetched
+        from, up to the next read on the same thread. A query exceeding them is interrupted with
+        sqlite3.OperationalError.
+
+        @type  seconds: Float
+        @param seconds: Optional time limit.
+        @type  rows:    Integer
+        @param rows:    Optional limit on the number of rows REGEXP may examine.
+
+        @rtype:  sqlite3.Cursor
+        @return: Cursor to fetch results from.
+        """
+
+        self.local.deadline = time.time() + seconds if seconds else None
+        self.local.rows     = rows
+
+        return self.reader().execute(query, params)
+
+
+    ####################################################################################################################
+    def write (self, query, params=()):
+        """
+        Execute and commit a statement on the writer connection.
+
+        @rtype:  sqlite3.Cursor
+        @return: Cursor, ie: for lastrowid.
+        """
+
+        with self.transaction() as conn:
+            return conn.execute(query, params)
+
+
+    ####################################################################################################################
+    @contextlib.contextmanager
+    def transaction (self):
+        """
+        Hold the writer for a transaction, committed on success and rolled back on error.
+        """
+
+        with self.lock:
+            try:
+                yield self.writer
+                self.writer.commit()
+            except:
+                self.writer.rollback()
+                raise
+
+
+    ####################################################################################################################
+    def version (self, number=None):
+        """
+        The schema version lives in PRAGMA user_version.
+
+        @type  number: Integer
+        @param number: Optional schema version to record.
+
+        @rtype:  Integer
+        @return: Schema version of the memory file.
+        """
+
+        if number is not None:
+            self.write("PRAGMA user_version=%d" % number)
+
+        return self.read("PRAGMA user_version").fetchone()[0]
+
+
+########################################################################################################################
+class cerebellum:
+    """
+    Cached access to the cerebellum table. Memories are cached in their encoded form so that every recall hands out a
+    fresh copy, exactly as reading from the table would. A memory with an expiration is forgotten once it passes, the
+    row stays in the table until sweep() comes around. The least recently used memories, and memories known not to
+    exist, are evicted from the cache beyond its size once they're flushed.
+    """
+
+    ####################################################################################################################
+    def __init__ (self, bot, interval, codec, size):
+        """
+        @type  bot:      jumpbot
+        @param bot:      Bot whose memory pool, error reporting and metrics are used.
+        @type  interval: Float
+        @param interval: Seconds between flushes of dirty memories, 0 writes every change through immediately.
+        @type  codec:    codec.codec
+        @param codec:    Memory encoder and decoder.
+        @type  size:     Integer
+        @param size:     Maximum number of cached memories, dirty ones are kept beyond it until they're flushed.
+        """
+
+        self.bot       = bot
+        self.interval  = interval
+        self.codec     = codec
+        self.size      = max(size, 1)
+        self.lock      = threading.RLock()
+        self.cache     = collections.OrderedDict()      # tag -> encoded memory or FORGOTTEN, least recently used first.
+        self.expires   = {}                             # tag -> epoch expiration, for cached memories that expire.
+        self.dirty     = set()                          # tags changed since the last flush.
+        self.evictions = 0
+
+        bot.metrics.register_gauge("memory_dirty_tags",  "Memories waiting to be flushed.",  lambda: len(self.dirty))
+        bot.metrics.register_gauge("memory_cached_tags", "Memories cached.",                 lambda: len(self.cache))
+        bot.metrics.register_gauge("memory_evictions",   "Memories evicted from the cache.", lambda: self.evictions)
+
+        if interval:
+            flusher = threading.Thread(target=self._run, name="cerebellum")
+            flusher.daemon = True
+            flusher.start()
+
+
+    ####################################################################################################################
+    def _evict (self):
+        """
+        Evict the least recently used memories that have been flushed, until the cache is back within its size. Must be
+        called with the lock held.
+        """
+
+        if len(self.cache) <= self.size:
+            return
+
+        for tag in self.cache.keys():
+            if tag in self.dirty:
+                continue
+
+            del self.cache[tag]
+            self.expires.pop(tag, None)
+            self.evictions += 1
+
+            if len(self.cache) <= self.size:
+                return
+
+
+    ####################################################################################################################
+    def _expire (self, tag):
+        """
+        Forget a cached memory that expired. A pending write of it is turned into a delete, so that an older copy in
+        the table can't resurface. Must be called with the lock held.
+        """
+
+        del self.expires[tag]
+
+        if tag in self.dirty:
+            self._store(tag, FORGOTTEN)
+        else:
+            self.cache.pop(tag, None)
+
+
+    ####################################################################################################################
+    def _run (self):
+        """
+        Flusher thread loop.
+        """
+
+        while True:
+            time.sleep(self.interval)
+
+            try:
+                self.flush()
+            except Exception as e:
+                self.bot._err("failed flushing memory: %s" % e)
+
+
+    ####################################################################################################################
+    def _store (self, tag, encoded):
+        """
+        Cache a memory as the most recently used and evict beyond the size. Must be called with the lock held.
+        """
+
+        self.cache.pop(tag, None)
+        self.cache[tag] = encoded
+
+        self._evict()
+
+
+    ####################################################################################################################
+    def flush (self):
+        """
+        Write every dirty memory in a single transaction.
+
+        @rtype:  Integer
+        @return: Number of memories written.
+        """
+
+        with self.lock:
+            if not self.dirty:
+                return 0
+
+            start   = time.time()
+            binary  = self.bot.memory.binary
+            writes  = [(tag, binary(self.cache[tag]), self.expires.get(tag))
+                       for tag in self.dirty if self.cache[tag] is not FORGOTTEN]
+            deletes = [(tag,) for tag in self.dirty if self.cache[tag] is FORGOTTEN]
+
+            try:
+                with self.bot.memory.transaction() as conn:
+                    if writes:
+                        sql = "INSERT OR REPLACE INTO cerebellum (tag, memory, expires) VALUES (?, ?, ?)"
+                        conn.executemany(sql, writes)
+
+                    if deletes:
+                        conn.executemany("DELETE FROM cerebellum WHERE tag=?", deletes)
+            except:
+                self.bot.metrics.observe("memory", "cerebellum", "FLUSH", time.time() - start, error=True)
+                raise
+
+            self.dirty.clear()
+            self._evict()
+            self.bot.metrics.observe("memory", "cerebellum", "FLUSH", time.time() - start)
+
+            return len(writes) + len(deletes)
+
+
+    ####################################################################################################################
+    def forget (self, tag):
+        """
+        @type  tag: String
+        @param tag: Normalized tag.
+        """
+
+        with self.lock:
+            self.dirty.add(tag)
+            self.expires.pop(tag, None)
+            self._store(tag, FORGOTTEN)
+
+            if not self.interval:
+                self.flush()
+
+
+    ####################################################################################################################
+    def recall (self, tag, dunno=None):
+        """
+        @type  tag:   String
+        @param tag:   Normalized tag.
+        @type  dunno: Mixed
+        @param dunno: What to return if no memory was found.
+
+        @rtype:  Mixed
+        @return: Memory
+        """
+
+        now = int(time.time())
+
+        with self.lock:
+            if tag in self.expires and self.expires[tag] <= now:
+                self._expire(tag)
+
+            if tag in self.cache:
+                encoded = self.cache[tag]
+            else:
+                sql     = "SELECT memory, expires FROM cerebellum WHERE tag=?"
+                synapse = self.bot.memory_query(sql, (tag,)).fetchone()
+                encoded = FORGOTTEN
+
+                # encoded memories are BLOBs, legacy pickles TEXT. expired rows are as good as gone.
+                if synapse and (synapse["expires"] is None or synapse["expires"] > now):
+                    encoded = str(synapse["memory"])
+
+                    if synapse["expires"] is not None:
+                        self.expires[tag] = synapse["expires"]
+
+            self._store(tag, encoded)
+
+        if encoded is FORGOTTEN:
+            return dunno
+
+        return self.codec.decode(encoded)
+
+
+    ####################################################################################################################
+    def remember (self, tag, memory, expires=None):
+        """
+        @type  tag:     String
+        @param tag:     Normalized tag.
+        @type  memory:  Mixed
+        @param memory:  Whatever we want to remember.
+        @type  expires: Integer
+        @param expires: Optional epoch time at which the memory is forgotten.
+
+        @raise: Exception if the memory can't be encoded.
+        """
+
+        encoded = self.codec.encode(memory)
+
+        with self.lock:
+            # nothing changed, nothing to write.
+            if self.cache.get(tag) == encoded and self.expires.get(tag) == expires:
+                return
+
+            self.dirty.add(tag)
+
+            if expires is None:
+                self.expires.pop(tag, None)
+            else:
+                self.expires[tag] = expires
+
+            self._store(tag, encoded)
+
+            if not self.interval:
+                self.flush()
+
+
+    ####################################################################################################################
+    def sweep (self, batch):
+        """
+        Forget every expired memory, dropping cached ones and deleting rows from the table, batch rows per statement
+        so that other writers get their turn in between.
+
+        @type  batch: Integer
+        @param batch: Rows deleted per statement.
+
+        @rtype:  Integer
+        @return: Number of rows deleted.
+        """
+
+        now = int(time.time())
+
+        with self.lock:
+            for tag, expires in self.expires.items():
+                if expires <= now:
+                    self._expire(tag)
+
+        sql   = "DELETE FROM cerebellum WHERE tag IN (SELECT tag FROM cerebellum WHERE expires <= ? LIMIT ?)"
+        swept = 0
+
+        while True:
+            deleted = self.bot.memory_query(sql, (now, batch)).rowcount
+            swept  += deleted
+
+            if deleted < batch:
+                return swept
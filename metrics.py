@@ -0,0 +1,280 @@
+"""
+Jumpshot HipChat Bot Metrics
+
+Call counts, error counts and latency histograms for handler callbacks, memory queries and HipChat API calls. Metrics
+are reported in chat via .stats and exposed in the Prometheus text format over HTTP for scraping.
+"""
+
+# python modules.
+import time
+import threading
+import BaseHTTPServer
+
+# histogram bucket upper bounds, in seconds.
+BUCKETS = [.0001, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30]
+
+
+########################################################################################################################
+class histogram:
+    """
+    Cumulative latency histogram.
+    """
+
+    ####################################################################################################################
+    def __init__ (self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count   = 0
+        self.errors  = 0
+        self.sum     = 0.0
+
+
+    ####################################################################################################################
+    def observe (self, seconds, error=False):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+        self.count += 1
+        self.sum   += seconds
+
+        if error:
+            self.errors += 1
+
+
+    ####################################################################################################################
+    def quantile (self, q):
+        """
+        Estimate a quantile as the upper bound of the bucket it falls in.
+
+        @type  q: Float
+        @param q: Quantile, 0 - 1.
+
+        @rtype:  Float
+        @return: Seconds, or None if the quantile falls beyond the last bucket.
+        """
+
+        for i, bound in enumerate(BUCKETS):
+            if self.buckets[i] >= q * self.count:
+                return bound
+
+        return None
+
+
+########################################################################################################################
+class registry:
+    """
+    Thread safe collection of histograms keyed by (kind, name, trigger). Kinds are "any", "command", "regex", "cron"
+    for handler callbacks, "memory" for memory queries, "hipchat" for HipChat API calls, "outbound" for the time
+    outbound messages spend queued and "startup" for handler import and initialization.
+    """
+
+    ####################################################################################################################
+    def __init__ (self):
+        self.lock       = threading.Lock()
+        self.histograms = {}                # (kind, name, trigger) -> histogram.
+        self.gauges     = {}                # name -> (description, callable returning {labels tuple: value}).
+        self.started    = time.time()
+
+
+    ####################################################################################################################
+    def observe (self, kind, name, trigger, seconds, error=False):
+        """
+        Record a single call.
+
+        @type  kind:    String
+        @param kind:    Call kind.
+        @type  name:    String
+        @param name:    Handler callback or routine name.
+        @type  trigger: String
+        @param trigger: Trigger, query verb or API routine, "" if there is none.
+        @type  seconds: Float
+        @param seconds: Call duration.
+        @type  error:   Boolean
+        @param error:   Whether or not the call failed.
+        """
+
+        key = (kind, name, trigger or "")
+
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = histogram()
+
+            self.histograms[key].observe(seconds, error)
+
+
+    ####################################################################################################################
+    def timed (self, kind, name, trigger, function, *args, **kwargs):
+        """
+        Call function, recording its duration and whether or not it raised.
+        """
+
+        start = time.time()
+
+        try:
+            result = function(*args, **kwargs)
+        except:
+            self.observe(kind, name, trigger, time.time() - start, error=True)
+            raise
+
+        self.observe(kind, name, trigger, time.time() - start)
+
+        return result
+
+
+    ####################################################################################################################
+    def register_gauge (self, name, description, function):
+        """
+        Register a gauge that is sampled at exposition time.
+
+        @type  name:        String
+        @param name:        Metric name, prefixed with "jumpbot_".
+        @type  description: String
+        @param description: Metric help text.
+        @type  function:    Callable
+        @param function:    Returns a dictionary of label dictionary items tuple -> value, or a plain number.
+        """
+
+        with self.lock:
+            self.gauges[name] = (description, function)
+
+
+    ####################################################################################################################
+    def snapshot (self):
+        """
+        @rtype:  List
+        @return: Sorted list of ((kind, name, trigger), count, errors, sum, p50, p99) tuples.
+        """
+
+        with self.lock:
+            return [(key, h.count, h.errors, h.sum, h.quantile(.5), h.quantile(.99))
+                    for key, h in sorted(self.histograms.items())]
+
+
+    ####################################################################################################################
+    def report (self, kinds=None, top=10):
+        """
+        Human readable summary of the most expensive calls, by total time.
+
+        @type  kinds: List
+        @param kinds: Optional list of kinds to limit the report to.
+        @type  top:   Integer
+        @param top:   Maximum number of entries to report.
+
+        @rtype:  List
+        @return: List of report lines.
+        """
+
+        def ms (seconds):
+            return "%gms" % (seconds * 1000) if seconds is not None else ">%ds" % BUCKETS[-1]
+
+        entries = [entry for entry in self.snapshot() if not kinds or entry[0][0] in kinds]
+        entries.sort(key=lambda entry: -entry[3])
+
+        report = []
+
+        for (kind, name, trigger), count, errors, total, p50, p99 in entries[:top]:
+            label  = "%s %s" % (kind, name)
+            label += " '%s'" % trigger if trigger else ""
+
+            report.append("%s: %d calls, %d errors, avg %.1fms, p50 %s, p99 %s" % \
+                (label, count, errors, total / count * 1000, ms(p50), ms(p99)))
+
+        return report
+
+
+    ####################################################################################################################
+    def prometheus (self):
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        @rtype:  String
+        @return: Exposition text.
+        """
+
+        def labels (pairs):
+            escaped = [(k, str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")) for k, v in pairs]
+            return "{" + ",".join("%s=\"%s\"" % pair for pair in escaped) + "}"
+
+        with self.lock:
+            histograms = [(key, list(h.buckets), h.count, h.errors, h.sum) for key, h in sorted(self.histograms.items())]
+            gauges     = sorted(self.gauges.items())
+
+        lines  = ["# HELP jumpbot_uptime_seconds Seconds since the bot started."]
+        lines += ["# TYPE jumpbot_uptime_seconds gauge"]
+        lines += ["jumpbot_uptime_seconds %f" % (time.time() - self.started)]
+
+        lines += ["# HELP jumpbot_call_seconds Latency of handler callbacks, memory queries and HipChat API calls."]
+        lines += ["# TYPE jumpbot_call_seconds histogram"]
+
+        for (kind, name, trigger), buckets, count, errors, total in histograms:
+            pairs = [("kind", kind), ("name", name), ("trigger", trigger)]
+
+            for bound, bucket in zip(BUCKETS, buckets):
+                lines.append("jumpbot_call_seconds_bucket%s %d" % (labels(pairs + [("le", bound)]), bucket))
+
+            lines.append("jumpbot_call_seconds_bucket%s %d" % (labels(pairs + [("le", "+Inf")]), count))
+            lines.append("jumpbot_call_seconds_sum%s %f"    % (labels(pairs), total))
+            lines.append("jumpbot_call_seconds_count%s %d"  % (labels(pairs), count))
+
+        lines += ["# HELP jumpbot_call_errors_total Failed handler callbacks, memory queries and HipChat API calls."]
+        lines += ["# TYPE jumpbot_call_errors_total counter"]
+
+        for (kind, name, trigger), buckets, count, errors, total in histograms:
+            lines.append("jumpbot_call_errors_total%s %d" % \
+                (labels([("kind", kind), ("name", name), ("trigger", trigger)]), errors))
+
+        for name, (description, function) in gauges:
+            try:
+                values = function()
+            except Exception:
+                continue
+
+            if not isinstance(values, dict):
+                values = {() : values}
+
+            lines += ["# HELP jumpbot_%s %s" % (name, description)]
+            lines += ["# TYPE jumpbot_%s gauge" % name]
+
+            for pairs, value in sorted(values.items()):
+                lines.append("jumpbot_%s%s %s" % (name, labels(pairs) if pairs else "", value))
+
+        return "\n".join(lines) + "\n"
+
+
+    ####################################################################################################################
+    def serve (self, host, port):
+        """
+        Expose the metrics over HTTP at /metrics from a daemon thread.
+
+        @type  host: String
+        @param host: Address to bind to.
+        @type  port: Integer
+        @param port: Port to bind to.
+        """
+
+        registry = self
+
+        class request_handler (BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET (self):
+                if self.path.split("?")[0] not in ["/", "/metrics"]:
+                    self.send_error(404)
+                    return
+
+                body = registry.prometheus()
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            # keep scrapes out of the console.
+            def log_message (self, format, *args):
+                pass
+
+        server = BaseHTTPServer.HTTPServer((host, port), request_handler)
+        thread = threading.Thread(target=server.serve_forever, name="metrics")
+        thread.daemon = True
+        thread.start()
+
+        return server
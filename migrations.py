@@ -0,0 +1,213 @@
+"""
+Jumpshot HipChat Bot Memory Migrations
+
+Versioned schema changes to the memory. The schema version is kept by the memory backend, in PRAGMA user_version on
+SQLite, migrations run in order at startup and the version is bumped as each one completes. A migration must be safe to
+restart from the top after an interruption, long running ones commit their progress in chunks and pick up where they
+left off.
+"""
+
+# python modules.
+import time
+
+# legacy rows copied per transaction by backfills.
+CHUNK_SIZE = 10000
+
+
+########################################################################################################################
+def columns (bot, table):
+    """
+    @type  bot:   jumpbot
+    @param bot:   Bot whose memory to inspect.
+    @type  table: String
+    @param table: Table name.
+
+    @rtype:  List
+    @return: Column names of the table, empty if the table doesn't exist.
+    """
+
+    return bot.memory.columns(table)
+
+
+########################################################################################################################
+def chatlog_normalize (bot):
+    """
+    Version 1. The chat log moves from formatted TEXT stamps and repeated room and user strings on every row, to epoch
+    stamps and integer references into rooms and users lookup tables, indexed by (room, stamp) and (user, stamp).
+
+    The legacy table is renamed to chatlog_legacy and backfilled into the new chatlog in chunks of CHUNK_SIZE rows,
+    keeping row IDs. Progress is the highest row ID copied, so an interrupted backfill resumes on the next start. Legacy
+    stamps were recorded in local time and are converted as such.
+    """
+
+    # put the legacy table aside. its full text index and triggers go with it, the chat logger rebuilds them.
+    if "room_name" in columns(bot, "chatlog"):
+        for trigger in ["insert", "delete", "update_before", "update_after"]:
+            bot.memory_query("DROP TRIGGER IF EXISTS chatlog_fts_%s" % trigger)
+
+        bot.memory_query("DROP TABLE IF EXISTS chatlog_fts")
+        bot.memory_query("ALTER TABLE chatlog RENAME TO chatlog_legacy")
+
+    bot.memory_query("CREATE TABLE IF NOT EXISTS rooms (id INTEGER PRIMARY KEY, jid TEXT UNIQUE)")
+
+    sql  = "CREATE TABLE IF NOT EXISTS users ("
+    sql += "  id         INTEGER PRIMARY KEY,"
+    sql += "  hipchat_id TEXT,"
+    sql += "  name       TEXT,"
+    sql += "  nick       TEXT,"
+    sql += "  UNIQUE (hipchat_id, name, nick))"
+
+    bot.memory_query(sql)
+
+    sql  = "CREATE TABLE IF NOT EXISTS chatlog ("
+    sql += "  id         INTEGER PRIMARY KEY,"
+    sql += "  room_id    INTEGER REFERENCES rooms (id),"
+    sql += "  user_id    INTEGER REFERENCES users (id),"
+    sql += "  stamp      INTEGER,"
+    sql += "  message    TEXT)"
+
+    bot.memory_query(sql)
+
+    if columns(bot, "chatlog_legacy"):
+        # NULLs are folded to empty strings, so that they dedupe in the lookup tables and join back to them.
+        rooms  = "INSERT OR IGNORE INTO rooms (jid)"
+        rooms += " SELECT DISTINCT IFNULL(room_id, '') FROM chatlog_legacy WHERE id > ? AND id <= ?"
+
+        users  = "INSERT OR IGNORE INTO users (hipchat_id, name, nick)"
+        users += " SELECT DISTINCT IFNULL(user_id, ''), IFNULL(user_name, ''), IFNULL(user_nick, '')"
+        users += " FROM chatlog_legacy WHERE id > ? AND id <= ?"
+
+        rows  = "INSERT INTO chatlog (id, room_id, user_id, stamp, message)"
+        rows += " SELECT l.id, r.id, u.id, CAST(strftime('%s', l.stamp, 'utc') AS INTEGER), l.message"
+        rows += " FROM chatlog_legacy l"
+        rows += " JOIN rooms r ON r.jid = IFNULL(l.room_id, '')"
+        rows += " JOIN users u ON u.hipchat_id = IFNULL(l.user_id, '') AND u.name = IFNULL(l.user_name, '')"
+        rows += "  AND u.nick = IFNULL(l.user_nick, '')"
+        rows += " WHERE l.id > ? AND l.id <= ?"
+
+        done  = bot.memory_query("SELECT IFNULL(MAX(id), 0) FROM chatlog").fetchone()[0]
+        total = bot.memory_query("SELECT COUNT(*) FROM chatlog_legacy WHERE id > ?", (done,)).fetchone()[0]
+        moved = 0
+
+        while True:
+            sql   = "SELECT MAX(id) FROM (SELECT id FROM chatlog_legacy WHERE id > ? ORDER BY id LIMIT ?)"
+            upper = bot.memory_query(sql, (done, CHUNK_SIZE)).fetchone()[0]
+
+            if upper is None:
+                break
+
+            with bot.memory.transaction() as conn:
+                conn.execute(rooms, (done, upper))
+                conn.execute(users, (done, upper))
+                moved += conn.execute(rows, (done, upper)).rowcount
+
+            done = upper
+
+            bot._dbg("chatlog backfill: %d of %d rows." % (moved, total))
+
+        bot.memory_query("DROP TABLE chatlog_legacy")
+
+    # per room and per user time ranges are sought on these. they don't cover the message, which history and search
+    # queries read from the table row by row, only queries limited to the ID, room, user and stamp are answered from
+    # the index alone. carrying the message in the index would store the chat log twice.
+    bot.memory_query("CREATE INDEX IF NOT EXISTS chatlog_room_stamp ON chatlog (room_id, stamp)")
+    bot.memory_query("CREATE INDEX IF NOT EXISTS chatlog_user_stamp ON chatlog (user_id, stamp)")
+
+
+########################################################################################################################
+def chatlog_activity (bot):
+    """
+    Version 2. Message counts per room, user and hour, kept up to date by the chat logger as it writes. Rows logged
+    before the rollups existed, up to the boundary row ID recorded here, are counted by the chat logger's background
+    backfill, which records its position alongside the counts.
+    """
+
+    sql  = "CREATE TABLE IF NOT EXISTS chatlog_activity ("
+    sql += "  room_id    INTEGER,"
+    sql += "  hour       INTEGER,"
+    sql += "  user_id    INTEGER,"
+    sql += "  messages   INTEGER,"
+    sql += "  PRIMARY KEY (room_id, hour, user_id)) WITHOUT ROWID"
+
+    bot.memory_query(sql)
+    bot.memory_query("CREATE INDEX IF NOT EXISTS chatlog_activity_hour ON chatlog_activity (hour)")
+    bot.memory_query("CREATE TABLE IF NOT EXISTS chatlog_activity_backfill (boundary INTEGER, position INTEGER)")
+
+    if not bot.memory_query("SELECT boundary FROM chatlog_activity_backfill").fetchone():
+        sql = "INSERT INTO chatlog_activity_backfill SELECT IFNULL(MAX(id), 0), 0 FROM chatlog"
+
+        bot.memory_query(sql)
+
+
+########################################################################################################################
+def cerebellum_expires (bot):
+    """
+    Version 3. Memories can expire, the epoch expiration is kept alongside the memory and NULL never expires. Only
+    expiring memories are indexed, for the sweeper to find.
+    """
+
+    if "expires" not in columns(bot, "cerebellum"):
+        bot.memory_query("ALTER TABLE cerebellum ADD COLUMN expires INTEGER")
+
+    bot.memory_query("CREATE INDEX IF NOT EXISTS cerebellum_expires ON cerebellum (expires) WHERE expires IS NOT NULL")
+
+
+########################################################################################################################
+def incremental_vacuum (bot):
+    """
+    Version 4. Pages freed by deletes are kept on a free list, for the maintenance routine to return to the file system
+    a few at a time during quiet hours, see maintenance.py. Takes effect with the VACUUM that follows the migrations.
+    PostgreSQL vacuums on its own.
+    """
+
+    if bot.memory.dialect == "sqlite":
+        bot.memory_query("PRAGMA auto_vacuum=INCREMENTAL")
+
+
+########################################################################################################################
+# (version, description, routine), in order. versions must be consecutive and never reused.
+MIGRATIONS = \
+[
+    (1, "epoch stamps, room and user lookup tables and indexes for the chat log", chatlog_normalize),
+    (2, "per room, user and hour chat log activity rollups", chatlog_activity),
+    (3, "expiring memories in the cerebellum", cerebellum_expires),
+    (4, "incremental vacuum of the memory file", incremental_vacuum),
+]
+
+
+########################################################################################################################
+def migrate (bot):
+    """
+    Bring the memory file up to the latest schema version. Space freed by a migration is returned to the file system
+    once all of them are through.
+
+    @type  bot: jumpbot
+    @param bot: Bot whose memory to migrate.
+
+    @rtype:  Integer
+    @return: Schema version.
+    """
+
+    version = bot.memory.version()
+    ran     = False
+
+    for number, description, routine in MIGRATIONS:
+        if number <= version:
+            continue
+
+        bot._dbg("migrating memory to version %d: %s..." % (number, description))
+
+        start = time.time()
+        routine(bot)
+
+        bot.memory.version(number)
+        bot.metrics.observe("startup", "migration", str(number), time.time() - start)
+        bot._dbg("migrated memory to version %d in %.1fs." % (number, time.time() - start))
+
+        version = number
+        ran     = True
+
+    if ran:
+        bot.memory_query("VACUUM")
+
+    return version
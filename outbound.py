@@ -0,0 +1,276 @@
+"""
+Jumpshot HipChat Bot Outbound Message Queue
+"""
+
+# python modules.
+import time
+import threading
+import collections
+
+
+########################################################################################################################
+class token_bucket:
+    """
+    Token bucket rate limiter. A rate of 0 disables limiting.
+    """
+
+    ####################################################################################################################
+    def __init__ (self, rate, burst):
+        """
+        @type  rate:  Float
+        @param rate:  Tokens added per second.
+        @type  burst: Integer
+        @param burst: Bucket capacity.
+        """
+
+        self.rate   = float(rate)
+        self.burst  = float(max(burst, 1))
+        self.tokens = self.burst
+        self.last   = time.time()
+
+
+    ####################################################################################################################
+    def _refill (self, now):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+
+        self.last = now
+
+
+    ####################################################################################################################
+    def delay (self, now):
+        """
+        @rtype:  Float
+        @return: Seconds until a token is available, 0 if one is available now.
+        """
+
+        if not self.rate:
+            return 0
+
+        self._refill(now)
+
+        if self.tokens >= 1:
+            return 0
+
+        return (1 - self.tokens) / self.rate
+
+
+    ####################################################################################################################
+    def take (self, now):
+        if self.rate:
+            self._refill(now)
+            self.tokens -= 1
+
+
+########################################################################################################################
+class outbox:
+    """
+    Per room outbound message queues drained by a sender thread. Adjacent phrases queued for the same room are merged
+    into a single message up to the maximum message length, and sends are rate limited per room and globally with
+    token buckets. Rooms are serviced round robin, so a chatty handler in one room can't starve the others.
+    """
+
+    ####################################################################################################################
+    def __init__ (self, send, max_length, room_rate, room_burst, global_rate, global_burst, depth, metrics=None,
+                  err=None):
+        """
+        @type  send:         Function
+        @param send:         Routine taking (mto, body) that delivers a message.
+        @type  max_length:   Integer
+        @param max_length:   Maximum length of a single message.
+        @type  room_rate:    Float
+        @param room_rate:    Messages per second allowed per room, 0 for unlimited.
+        @type  room_burst:   Integer
+        @param room_burst:   Messages a room may send back to back.
+        @type  global_rate:  Float
+        @param global_rate:  Messages per second allowed across all rooms, 0 for unlimited.
+        @type  global_burst: Integer
+        @param global_burst: Messages that may be sent back to back across all rooms.
+        @type  depth:        Integer
+        @param depth:        Maximum number of phrases queued per room.
+        @type  metrics:      metrics.registry
+        @param metrics:      Optional registry to report queue depth and send latency to.
+        @type  err:          Function
+        @param err:          Optional error reporting routine.
+        """
+
+        self.send         = send
+        self.max_length   = max_length
+        self.room_rate    = room_rate
+        self.room_burst   = room_burst
+        self.depth        = depth
+        self.metrics      = metrics
+        self.err          = err
+        self.condition    = threading.Condition()
+        self.queues       = {}                      # mto -> deque of (phrase, enqueued at).
+        self.buckets      = {}                      # mto -> token_bucket.
+        self.order        = collections.deque()     # rooms with queued phrases, in service order.
+        self.limiter      = token_bucket(global_rate, global_burst)
+        self.threaded     = bool(room_rate or global_rate)
+
+        if metrics:
+            metrics.register_gauge("outbound_queue_depth", "Phrases waiting to be sent, per room.", self.depths)
+
+        # without rate limits there is nothing to wait on, messages are sent inline.
+        if self.threaded:
+            sender = threading.Thread(target=self._run, name="outbox")
+            sender.daemon = True
+            sender.start()
+
+
+    ####################################################################################################################
+    def depths (self):
+        """
+        @rtype:  Dictionary
+        @return: Labels -> number of phrases queued, per room.
+        """
+
+        with self.condition:
+            return dict(((("room", mto),), len(queue)) for mto, queue in self.queues.items())
+
+
+    ####################################################################################################################
+    def put (self, mto, phrases):
+        """
+        Queue phrases for delivery to a room.
+
+        @type  mto:     String
+        @param mto:     Room JID.
+        @type  phrases: List
+        @param phrases: Phrases to send, in order.
+        """
+
+        now = time.time()
+
+        with self.condition:
+            queue = self.queues.setdefault(mto, collections.deque())
+
+            for phrase in phrases:
+                if len(queue) >= self.depth:
+                    if self.err:
+                        self.err("outbound queue for %s is full, dropped: %s" % (mto, phrase.split("\n")[0][:140]))
+                    continue
+
+                # phrases too long to send in one go are split up.
+                for offset in xrange(0, max(len(phrase), 1), self.max_length):
+                    queue.append((phrase[offset:offset + self.max_length], now))
+
+            if queue and mto not in self.order:
+                self.order.append(mto)
+
+            self.condition.notify()
+
+        if not self.threaded:
+            while self._send_next(now):
+                pass
+
+
+    ####################################################################################################################
+    def _coalesce (self, mto):
+        """
+        Pop the next message for a room off its queue, merging adjacent phrases up to the maximum message length.
+        Must be called with the condition held.
+
+        @rtype:  Tuple
+        @return: (body, enqueued at) of the oldest phrase merged in.
+        """
+
+        queue          = self.queues[mto]
+        body, enqueued = queue.popleft()
+
+        while queue and len(body) + 1 + len(queue[0][0]) <= self.max_length:
+            body += "\n" + queue.popleft()[0]
+
+        if not queue:
+            del self.queues[mto]
+            self.order.remove(mto)
+
+        # move the room to the back of the line.
+        elif self.order[0] == mto:
+            self.order.rotate(-1)
+
+        return body, enqueued
+
+
+    ####################################################################################################################
+    def _next (self, now):
+        """
+        Determine the next room allowed to send. Must be called with the condition held.
+
+        @rtype:  Tuple
+        @return: (room or None, seconds to wait or None to wait for new phrases).
+        """
+
+        if not self.order:
+            return None, None
+
+        wait = self.limiter.delay(now)
+
+        if wait:
+            return None, wait
+
+        for mto in self.order:
+            if mto not in self.buckets:
+                self.buckets[mto] = token_bucket(self.room_rate, self.room_burst)
+
+            delay = self.buckets[mto].delay(now)
+
+            if not delay:
+                # bring the room to the front of the line so _coalesce() rotates it to the back.
+                while self.order[0] != mto:
+                    self.order.rotate(-1)
+
+                return mto, 0
+
+            wait = delay if not wait else min(wait, delay)
+
+        return None, wait
+
+
+    ####################################################################################################################
+    def _send_next (self, now):
+        """
+        Send the next message, if any room is allowed to.
+
+        @rtype:  Boolean
+        @return: True if a message was sent.
+        """
+
+        with self.condition:
+            mto, wait = self._next(now)
+
+            if not mto:
+                return False
+
+            body, enqueued = self._coalesce(mto)
+
+            self.limiter.take(now)
+            self.buckets[mto].take(now)
+
+        try:
+            self.send(mto, body)
+        except Exception as e:
+            if self.err:
+                self.err("failed sending to %s: %s" % (mto, e))
+
+        if self.metrics:
+            self.metrics.observe("outbound", "send", mto, time.time() - enqueued)
+
+        return True
+
+
+    ####################################################################################################################
+    def _run (self):
+        """
+        Sender thread loop.
+        """
+
+        while True:
+            with self.condition:
+                mto, wait = self._next(time.time())
+
+                if not mto:
+                    self.condition.wait(wait)
+                    continue
+
+            self._send_next(time.time())
@@ -0,0 +1,192 @@
+"""
+Jumpshot HipChat Bot Twisted Reactor Core
+
+Runs the Twisted reactor in a background thread so that handlers can be written as non-blocking coroutines. Python 2
+has no asyncio, so handlers are declared with the @asynchronous decorator below, which wraps generator methods with
+Twisted's inlineCallbacks. Such handlers yield Deferreds (ie: from http_get()) instead of blocking on requests:
+
+    @reactor_core.asynchronous
+    def lookup (self, xmpp_message, room, nick, term):
+        data = yield reactor_core.http_get(URL % term)
+        defer.returnValue(data)
+"""
+
+# python modules.
+import urllib
+import inspect
+import threading
+
+# external dependencies.
+from twisted.internet import defer, reactor, threads
+from twisted.python   import threadable
+from twisted.web      import client
+
+# guards reactor start up.
+_lock    = threading.Lock()
+_started = False
+
+
+########################################################################################################################
+def asynchronous (method):
+    """
+    Decorator marking a handler method as non-blocking. Generator methods are wrapped with inlineCallbacks, anything
+    else is expected to return a Deferred (or a plain value).
+    """
+
+    if inspect.isgeneratorfunction(method):
+        method = defer.inlineCallbacks(method)
+
+    method.asynchronous = True
+
+    return method
+
+
+########################################################################################################################
+def is_asynchronous (callback):
+    """
+    @rtype:  Boolean
+    @return: True if callback was declared with @asynchronous.
+    """
+
+    return getattr(callback, "asynchronous", False)
+
+
+########################################################################################################################
+def in_reactor ():
+    """
+    @rtype:  Boolean
+    @return: True if called from the reactor thread.
+    """
+
+    return _started and threadable.isInIOThread()
+
+
+########################################################################################################################
+def start (threads=8):
+    """
+    Start the reactor in a daemon thread, if it isn't already running.
+
+    @type  threads: Integer
+    @param threads: Size of the reactor thread pool, used to offload blocking handlers.
+    """
+
+    global _started
+
+    with _lock:
+        if _started:
+            return
+
+        reactor.suggestThreadPoolSize(max(threads, 1))
+
+        thread = threading.Thread(target=reactor.run, kwargs={"installSignalHandlers" : False}, name="reactor")
+        thread.daemon = True
+        thread.start()
+
+        _started = True
+
+
+########################################################################################################################
+def invoke (callback, *args):
+    """
+    Invoke a handler callback from any thread. From the reactor thread a Deferred is always returned, blocking
+    handlers are offloaded to the reactor thread pool. From any other thread the result is returned directly,
+    non-blocking handlers are run on the reactor and waited on.
+
+    @type  callback: Handler Method
+    @param callback: Handler method to invoke.
+    @type  args:     Mixed
+    @param args:     Arguments to pass to the handler.
+
+    @rtype:  Mixed
+    @return: Deferred or handler result.
+    """
+
+    if in_reactor():
+        if is_asynchronous(callback):
+            return defer.maybeDeferred(callback, *args)
+
+        return threads.deferToThread(callback, *args)
+
+    if is_asynchronous(callback):
+        return threads.blockingCallFromThread(reactor, callback, *args)
+
+    return callback(*args)
+
+
+########################################################################################################################
+def http_get (url, params=None, headers=None, timeout=10):
+    """
+    Non-blocking HTTP GET.
+
+    @note: HTTPS requires pyOpenSSL.
+
+    @type  url:     String
+    @param url:     URL to fetch.
+    @type  params:  Dictionary
+    @param params:  Optional query string parameters.
+    @type  headers: Dictionary
+    @param headers: Optional request headers.
+    @type  timeout: Integer
+    @param timeout: Seconds to wait before giving up.
+
+    @rtype:  Deferred
+    @return: Deferred firing with the response body.
+    """
+
+    if params:
+        url += ("&" if "?" in url else "?") + urllib.urlencode(params)
+
+    return client.getPage(url, headers=headers or {}, timeout=timeout)
+
+
+########################################################################################################################
+def http_post (url, data=None, headers=None, timeout=10):
+    """
+    Non-blocking HTTP POST of form data.
+
+    @note: HTTPS requires pyOpenSSL.
+
+    @type  url:     String
+    @param url:     URL to post to.
+    @type  data:    Dictionary
+    @param data:    Optional form fields.
+    @type  headers: Dictionary
+    @param headers: Optional request headers.
+    @type  timeout: Integer
+    @param timeout: Seconds to wait before giving up.
+
+    @rtype:  Deferred
+    @return: Deferred firing with the response body.
+    """
+
+    headers = dict(headers or {})
+    headers.setdefault("Content-Type", "application/x-www-form-urlencoded")
+
+    return client.getPage(url, method="POST", postdata=urllib.urlencode(data or {}), headers=headers, timeout=timeout)
+
+
+########################################################################################################################
+class core:
+    """
+    Drop in replacement for the worker pool that dispatches messages on the reactor thread. Blocking handlers are
+    offloaded to the reactor thread pool, non-blocking handlers run on the reactor itself, so thousands of lookups can
+    be outstanding at once without a thread each.
+    """
+
+    ####################################################################################################################
+    def __init__ (self, threads):
+        start(threads)
+
+
+    ####################################################################################################################
+    def submit (self, key, function, *args):
+        """
+        Schedule a job on the reactor thread. Unlike the worker pool, jobs for the same key may complete out of order.
+
+        @rtype:  Boolean
+        @return: Always True.
+        """
+
+        reactor.callFromThread(function, *args)
+
+        return True
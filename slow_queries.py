@@ -0,0 +1,195 @@
+"""
+Jumpshot HipChat Bot Slow Query Log
+
+Optional instrumentation of memory_query. Every query is timed and accounted to its shape, the query with literals and
+lists of placeholders collapsed, so that the same query issued with different values adds up. Queries slower than a
+threshold are logged along with their parameters and query plan, and the most expensive shapes by total time are
+reported in chat via the admin handler's .slowqueries, so that a handler query missing an index stands out before it
+hurts latency.
+
+Times are those of executing a query, up to its first row. Rows fetched from the cursor afterwards aren't included.
+"""
+
+# python modules.
+import re
+import threading
+
+# shapes accounted for, the cheapest by total time are dropped beyond this.
+SHAPES = 256
+
+# query texts whose shapes are cached, the cache is cleared once it grows beyond this.
+CACHE_SIZE = 1024
+
+# longest parameter representation logged.
+PARAMS_LENGTH = 500
+
+# statements there's a query plan for.
+EXPLAINABLE = set(["SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "WITH"])
+
+# (pattern, replacement) collapsing a query to its shape, in order.
+SHAPING = \
+[
+    (re.compile(r"'(?:[^']|'')*'"),                          "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"),                       "?"),
+    (re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.I), "IN (...)"),
+    (re.compile(r"\s+"),                                     " "),
+]
+
+
+########################################################################################################################
+class shape:
+    """
+    Time spent on one query shape.
+    """
+
+    ####################################################################################################################
+    def __init__ (self, query):
+        self.query = query
+        self.count = 0
+        self.slow  = 0
+        self.total = 0.0
+        self.max   = 0.0
+        self.plan  = []                 # query plan of the last slow execution.
+
+
+########################################################################################################################
+class log:
+    """
+    Thread safe slow query log and per shape accounting.
+    """
+
+    ####################################################################################################################
+    def __init__ (self, memory, threshold, report):
+        """
+        @type  memory:    memory.pool
+        @param memory:    Memory backend to explain slow queries on.
+        @type  threshold: Float
+        @param threshold: Seconds a query may take before it's logged.
+        @type  report:    Function
+        @param report:    Routine taking a log message, ie: bot._err.
+        """
+
+        self.memory    = memory
+        self.threshold = threshold
+        self.report    = report
+        self.lock      = threading.Lock()
+        self.shapes    = {}             # shape -> shape().
+        self.cache     = {}             # query text -> shape.
+
+
+    ####################################################################################################################
+    def _shape (self, query):
+        """
+        @rtype:  String
+        @return: Query with literals and placeholder lists collapsed.
+        """
+
+        shaped = self.cache.get(query)
+
+        if shaped is None:
+            shaped = query
+
+            for pattern, replacement in SHAPING:
+                shaped = pattern.sub(replacement, shaped)
+
+            # queries built with literals in them would grow the cache without bound.
+            if len(self.cache) >= CACHE_SIZE:
+                self.cache.clear()
+
+            self.cache[query] = shaped
+
+        return shaped
+
+
+    ####################################################################################################################
+    def observe (self, query, params, seconds):
+        """
+        Account a query to its shape and, if it was slow, log it with its parameters and query plan.
+
+        @type  query:   String
+        @param query:   Query, as executed.
+        @type  params:  Tuple
+        @param params:  Query parameters, the first set for a batch.
+        @type  seconds: Float
+        @param seconds: Execution time.
+        """
+
+        shaped = self._shape(query)
+        slow   = seconds >= self.threshold
+
+        with self.lock:
+            if shaped not in self.shapes:
+                # make room by dropping the shape that cost the least so far.
+                if len(self.shapes) >= SHAPES:
+                    del self.shapes[min(self.shapes, key=lambda key: self.shapes[key].total)]
+
+                self.shapes[shaped] = shape(shaped)
+
+            entry        = self.shapes[shaped]
+            entry.count += 1
+            entry.total += seconds
+            entry.max    = max(entry.max, seconds)
+
+            if slow:
+                entry.slow += 1
+
+        if not slow:
+            return
+
+        # explaining is done outside of the lock, it's a query of its own.
+        plan = []
+
+        if query.split(None, 1)[0].upper() in EXPLAINABLE:
+            try:
+                plan = self.memory.plan(query, params)
+            except Exception as e:
+                plan = ["unable to explain: %s" % e]
+
+        with self.lock:
+            entry.plan = plan
+
+        message  = "slow query, %.1fms over the %.1fms threshold.\n\n" % (seconds * 1000, self.threshold * 1000)
+        message += "query:   %s\n"   % query
+        message += "params:  %s\n"   % repr(params)[:PARAMS_LENGTH]
+        message += "plan:    %s\n\n" % ("\n         ".join(plan) or "none")
+
+        self.report(message)
+
+
+    ####################################################################################################################
+    def reset (self):
+        """
+        Forget all shapes.
+        """
+
+        with self.lock:
+            self.shapes.clear()
+
+
+    ####################################################################################################################
+    def top (self, count=10):
+        """
+        Human readable summary of the most expensive query shapes, by total time.
+
+        @type  count: Integer
+        @param count: Maximum number of shapes to report.
+
+        @rtype:  List
+        @return: List of report lines.
+        """
+
+        with self.lock:
+            entries = sorted(self.shapes.values(), key=lambda entry: -entry.total)[:count]
+            entries = [(entry.query, entry.count, entry.slow, entry.total, entry.max, list(entry.plan))
+                       for entry in entries]
+
+        report = []
+
+        for query, count, slow, total, longest, plan in entries:
+            report.append("%.1fms total, %d calls, %d slow, avg %.1fms, max %.1fms: %s" % \
+                (total * 1000, count, slow, total / count * 1000, longest * 1000, query))
+
+            for step in plan:
+                report.append("    %s" % step)
+
+        return report
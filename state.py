@@ -0,0 +1,263 @@
+"""
+Jumpshot HipChat Bot State
+
+Bounded in process scratch state shared by the handlers, ie: the last answer per person and room or the items recently
+delivered to a room. Keys are tuples led by the handler name, ie: ("reddit", room, subreddit). The least recently used
+keys are evicted once there are too many of them or their values take up too much room, so state stays flat however
+many people and rooms the bot sees. The whole store can be snapshotted to memory and restored, see jumpbot.
+"""
+
+# python modules.
+import sys
+import threading
+import collections
+
+
+########################################################################################################################
+def measure (value):
+    """
+    Estimate the bytes a value takes up, including what it contains.
+
+    @type  value: Mixed
+    @param value: Value to measure.
+
+    @rtype:  Integer
+    @return: Approximate size in bytes.
+    """
+
+    size = sys.getsizeof(value)
+
+    if isinstance(value, recent_set):
+        value = value.items
+
+    if isinstance(value, dict):
+        size += sum(measure(key) + measure(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset, collections.deque)):
+        size += sum(measure(item) for item in value)
+
+    return size
+
+
+########################################################################################################################
+class recent_set:
+    """
+    The most recent distinct items, up to a size, ie: URLs recently delivered to a room. Membership, adding and
+    evicting the oldest item are all constant time.
+    """
+
+    ####################################################################################################################
+    def __init__ (self, size):
+        """
+        @type  size: Integer
+        @param size: Number of items to keep.
+        """
+
+        self.size  = max(size, 1)
+        self.items = collections.deque()    # oldest first.
+        self.index = set()
+        self.lock  = threading.Lock()
+
+
+    ####################################################################################################################
+    def __contains__ (self, item):
+        return item in self.index
+
+
+    ####################################################################################################################
+    def __getstate__ (self):
+        return self.size, list(self.items)
+
+
+    ####################################################################################################################
+    def __len__ (self):
+        return len(self.items)
+
+
+    ####################################################################################################################
+    def __setstate__ (self, state):
+        size, items = state
+
+        self.__init__(size)
+
+        for item in items:
+            self.add(item)
+
+
+    ####################################################################################################################
+    def add (self, item):
+        """
+        Add an item, unless it's already there, evicting the oldest item beyond the size.
+
+        @type  item: Mixed
+        @param item: Hashable item.
+
+        @rtype:  Boolean
+        @return: True if the item was added, False if it was already there.
+        """
+
+        with self.lock:
+            if item in self.index:
+                return False
+
+            self.items.append(item)
+            self.index.add(item)
+
+            if len(self.items) > self.size:
+                self.index.discard(self.items.popleft())
+
+            return True
+
+
+    ####################################################################################################################
+    def newest (self):
+        """
+        @rtype:  Mixed
+        @return: Most recently added item, None if there's none.
+        """
+
+        try:
+            return self.items[-1]
+        except IndexError:
+            return None
+
+
+########################################################################################################################
+class store:
+    """
+    Least recently used key value store, bounded in key count and estimated byte size. Values are measured when set
+    and, as they may be changed in place (ie: a recent_set), again whenever they're handed out.
+    """
+
+    ####################################################################################################################
+    def __init__ (self, max_keys, max_bytes):
+        """
+        @type  max_keys:  Integer
+        @param max_keys:  Maximum number of keys.
+        @type  max_bytes: Integer
+        @param max_bytes: Maximum estimated size of the keys and values, in bytes.
+        """
+
+        self.max_keys  = max(max_keys, 1)
+        self.max_bytes = max_bytes
+        self.lock      = threading.RLock()
+        self.values    = collections.OrderedDict()      # key -> value, least recently used first.
+        self.sizes     = {}                             # key -> estimated bytes.
+        self.bytes     = 0
+        self.evictions = 0
+
+
+    ####################################################################################################################
+    def _store (self, key, value):
+        """
+        Store a value as the most recently used, measure it and evict beyond the bounds. Must be called with the lock
+        held.
+        """
+
+        self.values.pop(key, None)
+        self.values[key] = value
+
+        size             = measure(key) + measure(value)
+        self.bytes      += size - self.sizes.get(key, 0)
+        self.sizes[key]  = size
+
+        while len(self.values) > self.max_keys or (self.bytes > self.max_bytes and len(self.values) > 1):
+            evicted, value = self.values.popitem(last=False)
+
+            self.bytes     -= self.sizes.pop(evicted)
+            self.evictions += 1
+
+
+    ####################################################################################################################
+    def delete (self, key):
+        """
+        @type  key: Tuple
+        @param key: Key to drop, if it's there.
+        """
+
+        with self.lock:
+            if key in self.values:
+                del self.values[key]
+                self.bytes -= self.sizes.pop(key)
+
+
+    ####################################################################################################################
+    def get (self, key, default=None):
+        """
+        @type  key:     Tuple
+        @param key:     Key.
+        @type  default: Mixed
+        @param default: What to return if the key isn't there.
+
+        @rtype:  Mixed
+        @return: Value.
+        """
+
+        with self.lock:
+            if key not in self.values:
+                return default
+
+            value = self.values[key]
+
+            self._store(key, value)
+
+            return value
+
+
+    ####################################################################################################################
+    def recent (self, key, size):
+        """
+        @type  key:  Tuple
+        @param key:  Key.
+        @type  size: Integer
+        @param size: Number of items to keep, for a set created here.
+
+        @rtype:  recent_set
+        @return: The recent set under the key, created if need be.
+        """
+
+        with self.lock:
+            recent = self.get(key)
+
+            if not isinstance(recent, recent_set):
+                recent = recent_set(size)
+                self._store(key, recent)
+
+            return recent
+
+
+    ####################################################################################################################
+    def restore (self, snapshot):
+        """
+        Load a snapshot taken by snapshot(), on top of what's already stored.
+
+        @type  snapshot: List
+        @param snapshot: (key, value) pairs, least recently used first.
+        """
+
+        with self.lock:
+            for key, value in snapshot:
+                self._store(key, value)
+
+
+    ####################################################################################################################
+    def set (self, key, value):
+        """
+        @type  key:   Tuple
+        @param key:   Key.
+        @type  value: Mixed
+        @param value: Value.
+        """
+
+        with self.lock:
+            self._store(key, value)
+
+
+    ####################################################################################################################
+    def snapshot (self):
+        """
+        @rtype:  List
+        @return: (key, value) pairs, least recently used first.
+        """
+
+        with self.lock:
+            return self.values.items()
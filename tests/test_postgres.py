@@ -0,0 +1,240 @@
+"""
+PostgreSQL Memory Backend Tests
+
+Runs the schema migrations, the cerebellum and the chat logger's batched writes through postgres.pool, along with the
+SQLite to PostgreSQL translation, prepared statements and paged batch writes underneath them. Needs psycopg2 and a
+scratch database, the memory tables in it are dropped before every test:
+
+    BOT_TEST_MEMORY_DSN=postgres://postgres@127.0.0.1/scratch python -m unittest discover -s tests
+
+The tests are skipped when no database is given.
+"""
+
+# python modules.
+import os
+import sys
+import time
+import tempfile
+import unittest
+
+# the config module requires a username to be defined, provide placeholders if they aren't.
+os.environ.setdefault("BOT_USERNAME", "00000_00000")
+os.environ.setdefault("BOT_NICKNAME", "Officer Pete")
+
+# make the bot modules importable.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# import options from config.py.
+import config
+
+# the bot itself, for its memory_query().
+import jumpbot
+
+# memory, serialization, migrations and metrics.
+import codec
+import memory
+import metrics
+import migrations
+
+# the chat logger, whose batched writes are tested.
+import handlers.chat_logger
+
+DSN = os.environ.get("BOT_TEST_MEMORY_DSN", "")
+
+# tables created by the bot, dropped before every test.
+TABLES = ["chatlog_activity_backfill", "chatlog_activity", "chatlog", "users", "rooms", "cerebellum", "memory_version",
+          "translation"]
+
+try:
+    import psycopg2
+    import postgres
+except ImportError:
+    postgres = None
+
+
+########################################################################################################################
+class memory_bot:
+    """
+    Just enough of the bot for the memory backend, migrations, the cerebellum and the chat logger to run on.
+    """
+
+    ####################################################################################################################
+    def __init__ (self, pool):
+        self.config       = config
+        self.memory       = pool
+        self.metrics      = metrics.registry()
+        self.path         = tempfile.mkdtemp(prefix="jumpbot-test-")
+        self.slow_queries = None
+        self.errors       = []
+
+    def register_trigger (self, callback, category, trigger=None):
+        pass
+
+    def _dbg (self, message):
+        pass
+
+    def _err (self, message):
+        self.errors.append(message)
+
+    def memory_query (self, query, params=(), seconds=None, rows=None):
+        return jumpbot.jumpbot.memory_query.im_func(self, query, params, seconds, rows)
+
+    def memory_query_many (self, query, params_list):
+        return jumpbot.jumpbot.memory_query_many.im_func(self, query, params_list)
+
+
+########################################################################################################################
+@unittest.skipUnless(DSN and postgres, "set BOT_TEST_MEMORY_DSN to a scratch database, with psycopg2 installed.")
+class postgres_memory (unittest.TestCase):
+
+    ####################################################################################################################
+    def setUp (self):
+        # start from an empty database, before the pool creates its version table.
+        conn = psycopg2.connect(DSN)
+        conn.autocommit = True
+
+        for table in TABLES:
+            conn.cursor().execute("DROP TABLE IF EXISTS %s" % table)
+
+        conn.close()
+
+        self.pool = postgres.pool(DSN, 4)
+        self.bot  = memory_bot(self.pool)
+
+        self.bot.memory_query("CREATE TABLE cerebellum (tag TEXT UNIQUE, memory BLOB, expires INTEGER)")
+        migrations.migrate(self.bot)
+
+
+    ####################################################################################################################
+    def test_migrate (self):
+        self.assertEqual(self.pool.version(), MIGRATIONS_LATEST)
+        self.assertEqual(self.pool.columns("chatlog"), ["id", "room_id", "user_id", "stamp", "message"])
+        self.assertEqual(self.pool.columns("chatlog_activity"), ["room_id", "hour", "user_id", "messages"])
+        self.assertEqual(self.pool.columns("cerebellum"), ["tag", "memory", "expires"])
+
+        # migrating again is a no-op.
+        self.assertEqual(migrations.migrate(self.bot), MIGRATIONS_LATEST)
+
+
+    ####################################################################################################################
+    def test_translation (self):
+        sql = "CREATE TABLE translation (id INTEGER PRIMARY KEY, name TEXT UNIQUE, score REAL, data BLOB)"
+
+        self.bot.memory_query(sql)
+
+        insert = "INSERT OR IGNORE INTO translation (name, score, data) VALUES (?, ?, ?)"
+
+        self.bot.memory_query(insert, ("pete", 1.5, self.pool.binary("\x00\x01")))
+        self.bot.memory_query(insert, ("pete", 2.5, self.pool.binary("\x02")))
+        self.bot.memory_query("INSERT OR REPLACE INTO translation (name, score) VALUES (?, ?)", ("bob", 3))
+        self.bot.memory_query("INSERT OR REPLACE INTO translation (name, score) VALUES (?, ?)", ("bob", 4))
+
+        rows = self.bot.memory_query("SELECT name, score, IFNULL(data, 'none') FROM translation ORDER BY id").fetchall()
+
+        self.assertEqual([(row[0], row[1]) for row in rows], [("pete", 1.5), ("bob", 4)])
+        self.assertEqual(str(rows[0][2]), "\x00\x01")
+
+        # string literals are left alone, placeholders and percent signs included.
+        row = self.bot.memory_query("SELECT '100% ?', name FROM translation WHERE name = ?", ("pete",)).fetchone()
+
+        self.assertEqual(tuple(row), ("100% ?", "pete"))
+
+        # the conflict target follows the schema as it changes.
+        self.bot.memory_query("ALTER TABLE translation ADD COLUMN nick TEXT UNIQUE")
+        replace = "INSERT OR REPLACE INTO translation (%s) VALUES (%s)"
+
+        self.bot.memory_query(replace % ("name, score, nick", "?, ?, ?"), ("bob", 5, "b"))
+        self.bot.memory_query(replace % ("nick, score", "?, ?"), ("b", 6))
+
+        self.assertEqual(self.bot.memory_query("SELECT score FROM translation WHERE nick = ?", ("b",)).fetchone()[0], 6)
+
+
+    ####################################################################################################################
+    def test_prepared_statements (self):
+        query = "SELECT * FROM cerebellum WHERE tag = ?"
+
+        self.assertEqual(len(self.bot.memory_query(query, ("x",)).description), 3)
+
+        # data definition invalidates the statements prepared against the old table.
+        self.bot.memory_query("ALTER TABLE cerebellum ADD COLUMN extra INTEGER")
+
+        self.assertEqual(len(self.bot.memory_query(query, ("x",)).description), 4)
+
+
+    ####################################################################################################################
+    def test_paged_batches (self):
+        # more rows than fit on one page, and a partial last page.
+        rows = [("tag %d" % i, self.pool.binary("memory %d" % i)) for i in xrange(postgres.PAGE_SIZE * 2 + 17)]
+
+        self.bot.memory_query_many("INSERT INTO cerebellum (tag, memory) VALUES (?, ?)", rows)
+
+        self.assertEqual(self.bot.memory_query("SELECT COUNT(*) FROM cerebellum").fetchone()[0], len(rows))
+        self.assertEqual(str(self.bot.memory_query("SELECT memory FROM cerebellum WHERE tag = ?", ("tag 213",))
+                             .fetchone()[0]), "memory 213")
+
+
+    ####################################################################################################################
+    def test_cerebellum (self):
+        brain = memory.cerebellum(self.bot, 3600, codec.codec(16), config.MEMORY_CACHE_SIZE)
+
+        brain.remember("plain", {"nick" : "pete", "items" : range(50)})
+        brain.remember(memory.normalize("tag", "namespace"), "namespaced")
+        brain.remember("expired", "gone", int(time.time()) - 1)
+        brain.remember("expiring", "kept", int(time.time()) + 3600)
+        brain.forget("plain")
+        brain.remember("plain", [1, 2, 3])
+        brain.flush()
+
+        # recalled cold, from the table.
+        cold = memory.cerebellum(self.bot, 0, codec.codec(16), config.MEMORY_CACHE_SIZE)
+
+        self.assertEqual(cold.recall("plain"), [1, 2, 3])
+        self.assertEqual(cold.recall("namespace:tag"), "namespaced")
+        self.assertEqual(cold.recall("expiring"), "kept")
+        self.assertEqual(cold.recall("expired", "dunno"), "dunno")
+
+        # only the expired row is swept.
+        self.assertEqual(cold.sweep(1), 1)
+        self.assertEqual(sorted(row[0] for row in self.bot.memory_query("SELECT tag FROM cerebellum").fetchall()),
+                         ["expiring", "namespace:tag", "plain"])
+
+        cold.forget("plain")
+
+        cold = memory.cerebellum(self.bot, 0, codec.codec(16), config.MEMORY_CACHE_SIZE)
+
+        self.assertEqual(cold.recall("plain", "dunno"), "dunno")
+
+
+    ####################################################################################################################
+    def test_chat_logger_flush (self):
+        logger = handlers.chat_logger.handler(self.bot)
+        logger.stop()
+
+        hour = int(time.time()) / 3600 * 3600
+        rows = [("1_jumpshot@conf.hipchat.com", ("1_1", "Pete", "OfficerPete"), hour + i, "message %d" % i)
+                for i in xrange(config.CHATLOG_BATCH_SIZE + 10)]
+        rows.append(("1_ops@conf.hipchat.com", ("1_2", "Bob", "Bob"), hour, "hello"))
+
+        for row in rows:
+            logger.queue.put_nowait(row)
+
+        logger.flush()
+
+        self.assertEqual(self.bot.errors, [])
+        self.assertEqual(self.bot.memory_query("SELECT COUNT(*) FROM chatlog").fetchone()[0], len(rows))
+        self.assertEqual(self.bot.memory_query("SELECT COUNT(*) FROM rooms").fetchone()[0], 2)
+        self.assertEqual(self.bot.memory_query("SELECT COUNT(*) FROM users").fetchone()[0], 2)
+
+        sql  = "SELECT r.jid, a.messages FROM chatlog_activity a JOIN rooms r ON r.id = a.room_id"
+        sql += " WHERE a.hour = ? ORDER BY r.jid"
+
+        self.assertEqual([tuple(row) for row in self.bot.memory_query(sql, (hour,)).fetchall()],
+                         [("1_jumpshot@conf.hipchat.com", len(rows) - 1), ("1_ops@conf.hipchat.com", 1)])
+
+
+# schema version after all migrations.
+MIGRATIONS_LATEST = migrations.MIGRATIONS[-1][0]
+
+
+if __name__ == "__main__":
+    unittest.main()
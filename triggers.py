@@ -0,0 +1,650 @@
+"""
+Jumpshot HipChat Bot Trigger Indexes
+"""
+
+# python modules.
+import re
+import sre_parse
+import sre_constants
+
+# import options from config.py.
+import config
+
+
+########################################################################################################################
+class command_index:
+    """
+    Index of command triggers. Exact triggers are kept in a hash map and every trigger is additionally threaded through
+    a character trie, so that the command portion of a message can be resolved with a single walk instead of testing
+    each registered trigger in turn.
+    """
+
+    ####################################################################################################################
+    def __init__ (self):
+        self.exact = {}     # lower cased trigger -> (order, callback, trigger).
+        self.trie  = {}     # character trie, terminal nodes hold the exact map entry under the None key.
+        self.order = 0      # registration counter, lower order wins when multiple triggers match.
+
+
+    ####################################################################################################################
+    def add (self, callback, trigger):
+        """
+        Add a trigger to the index.
+
+        @type  callback: Handler Method
+        @param callback: Handler method to call when trigger fires.
+        @type  trigger:  String
+        @param trigger:  Trigger string.
+        """
+
+        entry = (self.order, callback, trigger)
+        node  = self.trie
+
+        for c in trigger.lower():
+            node = node.setdefault(c, {})
+
+        node[None] = entry
+
+        self.exact[trigger.lower()] = entry
+        self.order += 1
+
+
+    ####################################################################################################################
+    def remove (self, trigger):
+        """
+        Remove a trigger from the index.
+
+        @type  trigger: String
+        @param trigger: Registered trigger string.
+        """
+
+        if self.exact.pop(trigger.lower(), None) is None:
+            return
+
+        # unlink the terminal entry, pruning branches that no longer lead anywhere.
+        path = []
+        node = self.trie
+
+        for c in trigger.lower():
+            path.append((node, c))
+            node = node[c]
+
+        del node[None]
+
+        for parent, c in reversed(path):
+            if parent[c]:
+                break
+
+            del parent[c]
+
+
+    ####################################################################################################################
+    def replace (self, callback, trigger):
+        """
+        Swap the callback of a registered trigger, keeping its precedence.
+
+        @type  callback: Handler Method
+        @param callback: New handler method.
+        @type  trigger:  String
+        @param trigger:  Registered trigger string.
+        """
+
+        order, old, trigger = self.exact[trigger.lower()]
+        entry = (order, callback, trigger)
+        node  = self.trie
+
+        for c in trigger.lower():
+            node = node[c]
+
+        node[None] = entry
+
+        self.exact[trigger.lower()] = entry
+
+
+    ####################################################################################################################
+    def _prefixes (self, text, bounded):
+        """
+        Walk the trie along text and yield every registered trigger that prefixes it.
+
+        @type  text:    String
+        @param text:    Lower cased text to walk.
+        @type  bounded: Boolean
+        @param bounded: If True, a trigger must be followed by a space or the end of text to count as a prefix.
+        """
+
+        node = self.trie
+
+        for i, c in enumerate(text):
+            node = node.get(c)
+
+            if node is None:
+                return
+
+            if None in node and (not bounded or i + 1 == len(text) or text[i + 1] == " "):
+                yield node[None]
+
+
+    ####################################################################################################################
+    def lookup (self, message, message_lower):
+        """
+        Resolve the command trigger, if any, contained in a message. Command triggers are either prefixed with a dot or
+        slash, at the start of the message or at its very end, or follow an @mention of the bot. When more than one
+        trigger matches, the one registered first wins.
+
+        @type  message:       String
+        @param message:       Sanitized message.
+        @type  message_lower: String
+        @param message_lower: Lower cased copy of message.
+
+        @rtype:  Tuple
+        @return: (callback, trigger, arguments) or None if no command trigger was found.
+        """
+
+        found = {}      # order -> (callback, trigger, arguments).
+
+        # dot or slash prefixed command at the start of the message, the arguments follow the trigger.
+        if message_lower[:1] in (".", "/"):
+            for order, callback, trigger in self._prefixes(message_lower[1:], bounded=True):
+                found[order] = callback, trigger, message[len(trigger) + 1:].strip()
+
+        # dot or slash prefixed command at the end of the message.
+        prefix = max(message_lower.rfind("."), message_lower.rfind("/"))
+
+        if prefix >= 0:
+            entry = self.exact.get(message_lower[prefix + 1:])
+
+            if entry and entry[0] not in found:
+                order, callback, trigger = entry
+                found[order] = callback, trigger, message[len(trigger) + 1:].strip()
+
+        # @mention of our own name, or of the generic @bot. no dot prefix required here.
+        if config.AT_NAME in message_lower:
+            mention = config.AT_NAME
+        elif "@bot" in message_lower:
+            mention = "@bot"
+        else:
+            mention = None
+
+        if mention:
+            # the trigger and arguments begin after the @mention.
+            remainder = message[message_lower.index(mention) + len(mention):].strip().lstrip("./")
+
+            for order, callback, trigger in self._prefixes(remainder.lower(), bounded=False):
+                if order not in found:
+                    found[order] = callback, trigger, remainder[len(trigger):].strip()
+
+        if not found:
+            return None
+
+        return found[min(found)]
+
+
+########################################################################################################################
+def required_literals (pattern):
+    """
+    Determine a set of lower cased literals, at least one of which must appear in any string the pattern matches. The
+    set is used to prefilter messages before running the full regular expression.
+
+    @type  pattern: String
+    @param pattern: Regular expression.
+
+    @rtype:  Set
+    @return: Set of literals or None if no literal is guaranteed to appear.
+    """
+
+    def best (candidates):
+        # prefer the candidate whose shortest literal is the longest, it is the most selective.
+        candidates = [c for c in candidates if c]
+
+        if not candidates:
+            return None
+
+        return max(candidates, key=lambda c: min(len(literal) for literal in c))
+
+    def walk (subpattern):
+        candidates = []
+        run        = ""
+
+        for op, av in subpattern:
+            # extend the current run of literal characters. non ascii is left alone as case folding gets murky.
+            if op == sre_constants.LITERAL and av < 128:
+                run += chr(av).lower()
+                continue
+
+            if run:
+                candidates.append(set([run]))
+                run = ""
+
+            # groups contribute whatever their contents require.
+            if op == sre_constants.SUBPATTERN:
+                candidates.append(walk(av[-1]))
+
+            # every branch of an alternation must contribute, otherwise nothing is required.
+            elif op == sre_constants.BRANCH:
+                branches = [walk(branch) for branch in av[1]]
+
+                if all(branches):
+                    candidates.append(set().union(*branches))
+
+            # repeats that must occur at least once contribute their contents.
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+                candidates.append(walk(av[2]))
+
+        if run:
+            candidates.append(set([run]))
+
+        return best(candidates)
+
+    try:
+        return walk(sre_parse.parse(pattern))
+    except Exception:
+        return None
+
+
+########################################################################################################################
+def _is_dot_star (item):
+    """
+    Determine whether a parsed pattern item is a greedy, unbounded repeat of any character, ie: .*
+    """
+
+    op, av = item
+
+    return op == sre_constants.MAX_REPEAT and av[0] == 0 and av[1] == sre_constants.MAXREPEAT and \
+        list(av[2]) == [(sre_constants.ANY, None)]
+
+
+########################################################################################################################
+def _is_optional_character (item):
+    """
+    Determine whether a parsed pattern item is a repeat of a single character that may match nothing, ie: [\s'"]*
+    """
+
+    op, av = item
+
+    if op not in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) or av[0] != 0:
+        return False
+
+    body = list(av[2])
+
+    return len(body) == 1 and body[0][0] in \
+        (sre_constants.ANY, sre_constants.IN, sre_constants.LITERAL, sre_constants.NOT_LITERAL)
+
+
+########################################################################################################################
+def _leading_length (pattern, count):
+    """
+    Determine the length of the text making up the first count items of a pattern, by finding the split whose two
+    halves parse to the pattern's leading and remaining items.
+
+    @rtype:  Integer
+    @return: Length of the leading text or None if the pattern can't be split there.
+    """
+
+    items = _plain(sre_parse.parse(pattern))
+
+    for length in xrange(1, len(pattern)):
+        try:
+            if _plain(sre_parse.parse(pattern[:length])) == items[:count] and \
+               _plain(sre_parse.parse(pattern[length:])) == items[count:]:
+                return length
+        except (re.error, sre_constants.error):
+            continue
+
+    return None
+
+
+########################################################################################################################
+def _nested_repeat (subpattern, inside=False):
+    """
+    Determine whether a parsed pattern contains an unbounded repeat nested within another unbounded repeat, the
+    classic recipe for catastrophic backtracking.
+    """
+
+    for op, av in subpattern:
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            unbounded = av[1] == sre_constants.MAXREPEAT
+
+            if unbounded and inside:
+                return True
+
+            if _nested_repeat(av[2], inside or unbounded):
+                return True
+
+        elif op == sre_constants.SUBPATTERN:
+            if _nested_repeat(av[-1], inside):
+                return True
+
+        elif op == sre_constants.BRANCH:
+            for branch in av[1]:
+                if _nested_repeat(branch, inside):
+                    return True
+
+    return False
+
+
+########################################################################################################################
+def _literal_pattern (subpattern, alternation=True):
+    """
+    Rebuild the pattern string for a parsed pattern made up solely of literals, groups and (optionally) alternations of
+    literals. New lines are excluded so the result can never span lines.
+
+    @rtype:  String
+    @return: Pattern string or None if the parsed pattern contains anything else.
+    """
+
+    pattern = ""
+
+    for op, av in subpattern:
+        if op == sre_constants.LITERAL and av < 128 and chr(av) != "\n":
+            pattern += re.escape(chr(av))
+
+        elif op == sre_constants.SUBPATTERN and alternation:
+            inner = _literal_pattern(av[-1])
+
+            if inner is None:
+                return None
+
+            pattern += "(?:%s)" % inner
+
+        elif op == sre_constants.BRANCH and alternation:
+            branches = [_literal_pattern(branch) for branch in av[1]]
+
+            if None in branches:
+                return None
+
+            pattern += "|".join(branches)
+
+        else:
+            return None
+
+    return pattern
+
+
+########################################################################################################################
+def _plain (value):
+    """
+    Convert a parsed pattern to nested lists, which unlike sre_parse.SubPattern compare by value.
+    """
+
+    if isinstance(value, sre_parse.SubPattern):
+        value = value.data
+
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+
+    return value
+
+
+########################################################################################################################
+class regex_trigger:
+    """
+    A compiled regular expression trigger with re.match() semantics. The leading and trailing .* in patterns of the
+    form "(?i).*core.*" backtrack over the entire message, which goes quadratic on multi-kilobyte pastes, so such
+    patterns are normalized at registration time:
+
+        - the leading and trailing .* are stripped and the core is searched for instead. As "." doesn't cross new
+          lines (unless re.DOTALL is set), the original pattern only matches if the core starts on the first line,
+          so the search result is held to that.
+
+        - repeats of a single character that may match nothing, ie: [\s'"]*, are stripped from the front of the core
+          too, as searching for them retries the whole run from every position within it. They can only make a
+          difference by carrying the match over new lines, which is checked with a single anchored match from the end
+          of the first line.
+
+        - if the core is a chain of literals joined by .*, ie: "@bot.*remind me.*(every|in)", each link is searched
+          for in turn starting from the end of the previous one. The earliest occurrence of each link is always the
+          best candidate, so a single linear pass decides the match.
+
+    Patterns nesting unbounded repeats, ie: "(a+)+", are rejected outright.
+    """
+
+    ####################################################################################################################
+    def __init__ (self, trigger):
+        """
+        @type  trigger: String
+        @param trigger: Regular expression trigger.
+
+        @raise: Exception if the pattern contains nested unbounded repeats.
+        """
+
+        self.trigger  = trigger
+        self.compiled = re.compile(trigger)
+        self.dotall   = bool(self.compiled.flags & re.DOTALL)
+        self.searcher = None    # compiled core, when leading .* was stripped.
+        self.bridge   = None    # compiled core including its optional leading characters, when those were stripped.
+        self.chain    = None    # compiled links, when the core is a chain of literals.
+
+        items = list(sre_parse.parse(trigger))
+
+        if _nested_repeat(items):
+            raise Exception("regex trigger '%s' nests unbounded repeats and risks catastrophic backtracking" % trigger)
+
+        # split off any leading inline flags, ie: (?i), as they must be carried over to the core.
+        flags = re.match(r"^(\(\?[a-zA-Z]+\))*", trigger).group(0)
+        core  = trigger[len(flags):]
+
+        # strip leading .*'s.
+        leading = False
+
+        while items and _is_dot_star(items[0]) and core.startswith(".*"):
+            items, core, leading = items[1:], core[2:], True
+
+        # strip trailing .*'s, which can always match the empty string.
+        while items and _is_dot_star(items[-1]) and core.endswith(".*"):
+            items, core = items[:-1], core[:-2]
+
+        # only bother searching if a leading .* was stripped and something is left to search for.
+        if not leading or not items:
+            return
+
+        # strip optional leading characters, keeping the full core around to bridge new lines with.
+        optional = 0
+
+        while optional < len(items) - 1 and _is_optional_character(items[optional]):
+            optional += 1
+
+        length = _leading_length(core, optional) if optional else None
+
+        try:
+            if length:
+                self.bridge = re.compile(flags + core)
+                items, core = items[optional:], core[length:]
+
+            self.searcher = re.compile(flags + core)
+        except re.error:
+            self.bridge = self.searcher = None
+            return
+
+        # chains are held to the first line link by link, which doesn't account for a bridge.
+        if self.bridge:
+            return
+
+        # split the core into links on the remaining .*'s.
+        links = [[]]
+
+        for item in items:
+            if _is_dot_star(item):
+                links.append([])
+            else:
+                links[-1].append(item)
+
+        if len(links) < 2 or not all(links):
+            return
+
+        # every link but the last must be a plain literal, as only then is its earliest occurrence also the one that
+        # ends earliest. the last link may additionally contain groups and alternations.
+        patterns  = [_literal_pattern(link, alternation=False) for link in links[:-1]]
+        patterns += [_literal_pattern(links[-1])]
+
+        if None not in patterns:
+            self.chain = [re.compile(flags + pattern) for pattern in patterns]
+
+
+    ####################################################################################################################
+    def match (self, message):
+        """
+        @type  message: String
+        @param message: Message to match.
+
+        @rtype:  Boolean
+        @return: True if the trigger matches the message.
+        """
+
+        if not self.searcher:
+            return self.compiled.match(message) is not None
+
+        first_line = len(message) if self.dotall else message.find("\n")
+
+        if first_line < 0:
+            first_line = len(message)
+
+        if not self.chain:
+            hit = self.searcher.search(message)
+
+            if hit is None:
+                return False
+
+            # the match must begin on the first line, or be bridged to from its end by the stripped optional characters.
+            if hit.start() <= first_line:
+                return True
+
+            return self.bridge is not None and self.bridge.match(message, first_line) is not None
+
+        position = 0
+
+        for i, link in enumerate(self.chain):
+            hit = link.search(message, position)
+
+            if not hit:
+                return False
+
+            # the first link must begin on the first line, the remainder can't be separated by a new line.
+            if i == 0:
+                if hit.start() > first_line:
+                    return False
+
+            elif not self.dotall and message.find("\n", position, hit.start()) >= 0:
+                return False
+
+            position = hit.end()
+
+        return True
+
+
+########################################################################################################################
+class regex_index:
+    """
+    Index of regular expression triggers. Patterns are compiled at registration time and the literals they require
+    are combined into a single scanner, so that only triggers whose literal actually appears in a message have their
+    full regular expression evaluated.
+    """
+
+    ####################################################################################################################
+    def __init__ (self):
+        self.entries  = []      # (callback, trigger, regex_trigger, literals) in registration order.
+        self.scanner  = None    # combined literal scanner.
+        self.implied  = {}      # literal -> set of literals it implies (itself and its prefixes).
+
+
+    ####################################################################################################################
+    def add (self, callback, trigger):
+        """
+        Add a trigger to the index.
+
+        @type  callback: Handler Method
+        @param callback: Handler method to call when trigger fires.
+        @type  trigger:  String
+        @param trigger:  Regular expression trigger.
+
+        @raise: Exception if the pattern is rejected, see regex_trigger.
+        """
+
+        self.entries.append((callback, trigger, regex_trigger(trigger), required_literals(trigger)))
+        self._build_scanner()
+
+
+    ####################################################################################################################
+    def remove (self, trigger):
+        """
+        Remove a trigger from the index.
+
+        @type  trigger: String
+        @param trigger: Registered regular expression trigger.
+        """
+
+        self.entries = [entry for entry in self.entries if entry[1] != trigger]
+        self._build_scanner()
+
+
+    ####################################################################################################################
+    def replace (self, callback, trigger):
+        """
+        Swap the callback of a registered trigger, keeping its precedence.
+
+        @type  callback: Handler Method
+        @param callback: New handler method.
+        @type  trigger:  String
+        @param trigger:  Registered regular expression trigger.
+        """
+
+        for i, entry in enumerate(self.entries):
+            if entry[1] == trigger:
+                self.entries[i] = (callback,) + entry[1:]
+
+
+    ####################################################################################################################
+    def _build_scanner (self):
+        """
+        (Re)build the combined literal scanner. A zero width look ahead is used so that overlapping literals are all
+        found. When several literals start at the same offset only the longest one is reported, so each literal also
+        implies every other literal that is a prefix of it.
+        """
+
+        literals = set()
+
+        for callback, trigger, pattern, required in self.entries:
+            if required:
+                literals.update(required)
+
+        if not literals:
+            self.scanner = None
+            self.implied = {}
+            return
+
+        literals     = sorted(literals, key=len, reverse=True)
+        self.scanner = re.compile("(?=(%s))" % "|".join(re.escape(literal) for literal in literals))
+        self.implied = dict((x, set(y for y in literals if x.startswith(y))) for x in literals)
+
+
+    ####################################################################################################################
+    def lookup (self, message, message_lower):
+        """
+        Find the first registered trigger, in registration order, whose regular expression matches the message.
+
+        @type  message:       String
+        @param message:       Sanitized message.
+        @type  message_lower: String
+        @param message_lower: Lower cased copy of message.
+
+        @rtype:  Tuple
+        @return: (callback, trigger) or None if no regex trigger matched.
+        """
+
+        present = set()
+
+        # the scanner can be rebuilt underneath us by a handler reload, hence the forgiving implied lookup.
+        if self.scanner:
+            for literal in set(self.scanner.findall(message_lower)):
+                present.update(self.implied.get(literal, ()))
+
+        for callback, trigger, pattern, required in self.entries:
+
+            # skip triggers whose required literal isn't in the message.
+            if required and present.isdisjoint(required):
+                continue
+
+            # look for regular expression match (not search, want to be more strict here).
+            if pattern.match(message):
+                return callback, trigger
+
+        return None
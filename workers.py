@@ -0,0 +1,118 @@
+"""
+Jumpshot HipChat Bot Worker Pool
+"""
+
+# python modules.
+import sys
+import Queue
+import threading
+import traceback
+import collections
+
+
+########################################################################################################################
+class pool:
+    """
+    Bounded thread pool that executes jobs keyed by room. Jobs sharing a key are executed one at a time in submission
+    order, while jobs with different keys are executed in parallel. Keys take turns, so a busy room can't starve the
+    others.
+    """
+
+    ####################################################################################################################
+    def __init__ (self, threads, depth, err=None):
+        """
+        @type  threads: Integer
+        @param threads: Number of worker threads. With 0 workers jobs are executed inline by submit().
+        @type  depth:   Integer
+        @param depth:   Maximum number of jobs waiting for execution across all keys.
+        @type  err:     Function
+        @param err:     Optional error reporting routine, defaults to stderr.
+        """
+
+        self.threads = threads
+        self.depth   = depth
+        self.err     = err
+        self.lock    = threading.Lock()
+        self.keys    = {}               # key -> deque of jobs waiting, present while the key is queued or running.
+        self.ready   = Queue.Queue()    # keys with jobs waiting for a worker.
+        self.pending = 0                # total number of jobs waiting.
+
+        for i in xrange(threads):
+            worker = threading.Thread(target=self._work, name="worker-%d" % i)
+            worker.daemon = True
+            worker.start()
+
+
+    ####################################################################################################################
+    def _run (self, function, args):
+        try:
+            function(*args)
+        except Exception as e:
+            message = "exception in worker job %s(): %s\n\n%s" % (function.__name__, e, traceback.format_exc())
+
+            if self.err:
+                self.err(message)
+            else:
+                sys.stderr.write("[!!] %s\n" % message)
+
+
+    ####################################################################################################################
+    def _work (self):
+        """
+        Worker thread loop. Executes a single job for the next ready key, then puts the key back in line if it has
+        more jobs waiting.
+        """
+
+        while True:
+            key = self.ready.get()
+
+            with self.lock:
+                function, args = self.keys[key].popleft()
+                self.pending  -= 1
+
+            self._run(function, args)
+
+            with self.lock:
+                if self.keys[key]:
+                    self.ready.put(key)
+                else:
+                    del self.keys[key]
+
+
+    ####################################################################################################################
+    def submit (self, key, function, *args):
+        """
+        Queue a job for execution.
+
+        @type  key:      String
+        @param key:      Ordering key, ie: the room, jobs with the same key are executed serially.
+        @type  function: Callable
+        @param function: Routine to execute.
+        @type  args:     Mixed
+        @param args:     Arguments to pass to the routine.
+
+        @rtype:  Boolean
+        @return: True if the job was queued (or executed), False if the queue is full.
+        """
+
+        # no workers, execute inline.
+        if not self.threads:
+            self._run(function, args)
+            return True
+
+        with self.lock:
+            if self.pending >= self.depth:
+                return False
+
+            self.pending += 1
+
+            # if the key is already queued or running, the job waits its turn behind the others...
+            if key in self.keys:
+                self.keys[key].append((function, args))
+
+            # ...otherwise, the key is put in line for a worker.
+            else:
+                self.keys[key] = collections.deque([(function, args)])
+                self.ready.put(key)
+
+        return True